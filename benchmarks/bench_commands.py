@@ -0,0 +1,236 @@
+"""bench_commands.py
+
+Benchmark for the throughput and latency of the get, ls, mv and assign
+commands, run against a local fake Azure DevOps server so no real
+organisation is touched.
+
+For each number of work items it starts a fake server holding that many, all
+assigned to one user, and times the API calls behind each command over real
+HTTP. It reports the total time, work items per second, the time until the
+first result, how many requests were sent and how long they took.
+
+Usage:
+    python benchmarks/bench_commands.py [--sizes N [N ...]]
+        [--commands CMD [CMD ...]] [--runs N] [--latency SECONDS]
+        [--wiql-cap N] [--failure-rate RATE] [--failure-status STATUS]
+        [--pool-size N] [--json PATH]
+
+Author:
+    Sam Gibson <sgibson@glasswallsolutions.com>
+"""
+
+import argparse
+import json
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, Iterable, List
+
+from fake_server import FakeAzureDevOps
+
+from victoria_pbi.config import CacheConfig, PBIConfig, TransportConfig
+from victoria_pbi.pbi import AzureDevOpsAPI, AzureDevOpsClientRequestError, \
+    AzureDevOpsServiceError
+
+COMMANDS = ["get", "ls", "mv", "assign"]
+"""The commands that can be benchmarked."""
+
+SIZES = [10, 1000, 10000]
+"""The default numbers of work items to benchmark each command with."""
+
+MOVE_COLUMNS = ["Validation", "In Development"]
+"""The columns mv moves work items between on alternate runs."""
+
+ASSIGNEES = ["other@example.com", FakeAzureDevOps.EMAIL]
+"""The users assign assigns work items to on alternate runs."""
+
+
+def command_call(api: AzureDevOpsAPI, command: str, size: int,
+                 run: int) -> Callable[[], Iterable]:
+    """Get the API call behind a command.
+
+    Args:
+        api (AzureDevOpsAPI): The connection to make the call on.
+        command (str): The command.
+        size (int): How many work items to make the call with.
+        run (int): Which run this is, so updates change something each time.
+
+    Returns:
+        Callable[[], Iterable]: Makes the call, returning its results.
+    """
+    numbers = range(1, size + 1)
+    if command == "get":
+        return lambda: api.get_work_items(numbers)
+    if command == "ls":
+        return lambda: api.get_user_pbis(FakeAzureDevOps.EMAIL)
+    if command == "mv":
+        column = MOVE_COLUMNS[run % len(MOVE_COLUMNS)]
+        return lambda: api.move_work_items(numbers, column)
+    # work items that are already assigned to the user aren't updated, so
+    # alternate between users like mv does between columns
+    return lambda: api.assign_work_items(numbers,
+                                         ASSIGNEES[run % len(ASSIGNEES)])
+
+
+def percentile(values: List[float], share: float) -> float:
+    """Get a percentile of some values.
+
+    Args:
+        values (List[float]): The values.
+        share (float): Which percentile to get, from 0 to 1.
+
+    Returns:
+        float: The percentile, or 0 if there were no values.
+    """
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(share * len(values)))]
+
+
+def bench_command(server: FakeAzureDevOps, cfg: PBIConfig, command: str,
+                  size: int, run: int) -> Dict[str, float]:
+    """Time a command once, on a fresh connection.
+
+    Args:
+        server (FakeAzureDevOps): The server the connection is to.
+        cfg (PBIConfig): The config to connect with.
+        command (str): The command to time.
+        size (int): How many work items to time it with.
+        run (int): Which run this is.
+
+    Returns:
+        Dict[str, float]: The measurements of the run.
+    """
+    api = AzureDevOpsAPI(cfg)
+    latencies = []
+    api.transport.session.hooks["response"].append(
+        lambda response, *args, **kwargs: latencies.append(
+            response.elapsed.total_seconds()))
+    call = command_call(api, command, size, run)
+    server.reset_counts()
+
+    results = 0
+    first = None
+    error = None
+    start = time.perf_counter()
+    try:
+        for _ in call():
+            if first is None:
+                first = time.perf_counter() - start
+            results += 1
+    except (AzureDevOpsClientRequestError, AzureDevOpsServiceError) as err:
+        # an injected failure the plugin didn't recover from
+        error = str(err)
+    total = time.perf_counter() - start
+    api.close()
+
+    requests = sum(count for endpoint, count in server.requests.items()
+                   if endpoint != "discovery")
+    return {
+        "results": results,
+        "seconds": total,
+        "items_per_second": results / total if total else 0.0,
+        "first_result_seconds": first or 0.0,
+        "requests": requests,
+        "failures": server.failures,
+        "request_p50_ms": percentile(latencies, 0.5) * 1000,
+        "request_p95_ms": percentile(latencies, 0.95) * 1000,
+        "error": error
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--sizes",
+                        type=int,
+                        nargs="+",
+                        default=SIZES,
+                        help="the numbers of work items to benchmark with")
+    parser.add_argument("--commands",
+                        nargs="+",
+                        choices=COMMANDS,
+                        default=COMMANDS,
+                        help="the commands to benchmark")
+    parser.add_argument("--runs",
+                        type=int,
+                        default=3,
+                        help="how many times to run each command; the median "
+                        "run is reported")
+    parser.add_argument("--latency",
+                        type=float,
+                        default=0.0,
+                        help="seconds the server waits before each response")
+    parser.add_argument("--wiql-cap",
+                        type=int,
+                        default=20000,
+                        help="the most work items a WIQL query can return")
+    parser.add_argument("--failure-rate",
+                        type=float,
+                        default=0.0,
+                        help="the share of requests the server fails")
+    parser.add_argument("--failure-status",
+                        type=int,
+                        choices=[429, 500, 503],
+                        default=503,
+                        help="the status failed requests return; 429 "
+                        "throttles them")
+    parser.add_argument("--pool-size",
+                        type=int,
+                        default=TransportConfig().pool_size,
+                        help="how many connections and concurrent requests "
+                        "the plugin uses")
+    parser.add_argument("--json",
+                        default=None,
+                        help="also write the results to this file as JSON")
+    args = parser.parse_args()
+
+    print(f"{'command':<8} {'items':>6} {'seconds':>8} {'items/s':>9} "
+          f"{'first':>7} {'requests':>8} {'failed':>6} {'p50 ms':>7} "
+          f"{'p95 ms':>7}")
+    results = []
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for size in args.sizes:
+            with FakeAzureDevOps(work_items=size,
+                                 latency=args.latency,
+                                 wiql_cap=args.wiql_cap,
+                                 failure_rate=args.failure_rate,
+                                 failure_status=args.failure_status) as server:
+                cfg = PBIConfig("token",
+                                "fake",
+                                FakeAzureDevOps.PROJECT,
+                                FakeAzureDevOps.EMAIL,
+                                cache=CacheConfig(directory=cache_dir),
+                                transport=TransportConfig(args.pool_size),
+                                url=server.url)
+                for command in args.commands:
+                    runs = [
+                        bench_command(server, cfg, command, size, run)
+                        for run in range(args.runs)
+                    ]
+                    result = sorted(runs, key=lambda r: r["seconds"])[
+                        len(runs) // 2]
+                    result.update(command=command, size=size)
+                    results.append(result)
+                    print(f"{command:<8} {size:>6} "
+                          f"{result['seconds']:>8.3f} "
+                          f"{result['items_per_second']:>9.0f} "
+                          f"{result['first_result_seconds']:>7.3f} "
+                          f"{result['requests']:>8} "
+                          f"{result['failures']:>6} "
+                          f"{result['request_p50_ms']:>7.1f} "
+                          f"{result['request_p95_ms']:>7.1f}")
+                    if result["error"] is not None:
+                        print(f"  stopped early: {result['error']}",
+                              file=sys.stderr)
+                    elif result["results"] != size:
+                        print(f"  only {result['results']} of {size} work "
+                              f"items came back", file=sys.stderr)
+
+    if args.json is not None:
+        with open(args.json, "w") as json_file:
+            json.dump(results, json_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""bench_import.py
+
+Benchmark for how long it takes to import the plugin entry point, which
+Victoria does on every invocation, even for unrelated commands.
+
+It runs 'python -X importtime' in fresh interpreters and reports the
+cumulative import time of victoria_pbi, the modules it spends the most time
+importing itself, and whether any heavy dependencies were imported.
+
+Usage:
+    python benchmarks/bench_import.py [--runs N] [--max-ms MS]
+
+Author:
+    Sam Gibson <sgibson@glasswallsolutions.com>
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+ENTRY_POINT = "victoria_pbi"
+"""The module Victoria imports to load the plugin."""
+
+HEAVY_MODULES = ["azure.devops", "msrest", "requests"]
+"""Modules that should only be imported when a command needs them."""
+
+
+def import_times(module: str) -> Tuple[Dict[str, int], List[str]]:
+    """Import a module in a fresh interpreter with -X importtime.
+
+    Args:
+        module (str): The module to import.
+
+    Returns:
+        Tuple[Dict[str, int], List[str]]: The cumulative import time in
+            microseconds of each module imported, and the names of the modules
+            in the order they were imported.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c",
+                             f"import {module}"],
+                            stderr=subprocess.PIPE,
+                            universal_newlines=True,
+                            check=True)
+    times = {}
+    order = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        name = name.strip()
+        times[name] = int(cumulative)
+        order.append(name)
+    return times, order
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--runs",
+                        type=int,
+                        default=10,
+                        help="how many fresh interpreters to time")
+    parser.add_argument("--max-ms",
+                        type=float,
+                        default=None,
+                        help="exit with an error if the median import time "
+                        "of the entry point is above this")
+    args = parser.parse_args()
+
+    totals = []
+    module_times = {}
+    imported = set()
+    for _ in range(args.runs):
+        times, order = import_times(ENTRY_POINT)
+        totals.append(times[ENTRY_POINT] / 1000)
+        imported.update(order)
+        for name, cumulative in times.items():
+            module_times.setdefault(name, []).append(cumulative / 1000)
+
+    median = statistics.median(totals)
+    print(f"{ENTRY_POINT}: median {median:.1f}ms, min {min(totals):.1f}ms, "
+          f"max {max(totals):.1f}ms over {args.runs} runs")
+
+    print("\nSlowest plugin modules (median cumulative):")
+    plugin_modules = sorted(
+        ((statistics.median(times), name)
+         for name, times in module_times.items()
+         if name.startswith(ENTRY_POINT + ".")),
+        reverse=True)
+    for time_ms, name in plugin_modules[:10]:
+        print(f"  {time_ms:8.1f}ms  {name}")
+
+    heavy = [
+        name for name in HEAVY_MODULES
+        if any(m == name or m.startswith(name + ".") for m in imported)
+    ]
+    print("\nHeavy modules imported:", ", ".join(heavy) if heavy else "none")
+
+    if args.max_ms is not None and median > args.max_ms:
+        print(f"\nMedian import time {median:.1f}ms is over the budget of "
+              f"{args.max_ms:.1f}ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""bench_memory.py
+
+Benchmark for how much memory it takes to hold work items, as a whole
+project's worth of them can be held at once.
+
+It builds work items the same way a batch get does, by decoding a JSON
+response and deserialising each item, then measures the memory held by the
+WorkItemContainers once the responses have been thrown away.
+
+Usage:
+    python benchmarks/bench_memory.py [--items N] [--keep-work-items]
+        [--max-bytes BYTES]
+
+Author:
+    Sam Gibson <sgibson@glasswallsolutions.com>
+"""
+
+import argparse
+import gc
+import json
+import random
+import sys
+import tracemalloc
+from typing import List
+
+from azure.devops.v5_1.work_item_tracking import WorkItem
+
+from victoria_pbi.pbi import WorkItemContainer
+
+STATES = ["New", "Approved", "In Development", "Validation", "Done"]
+"""The states generated work items can be in."""
+
+USERS = 50
+"""How many different users generated work items are assigned to."""
+
+
+def generate_response(count: int) -> str:
+    """Generate the JSON body of a batch get response.
+
+    Args:
+        count (int): How many work items to put in the response.
+
+    Returns:
+        str: The response body.
+    """
+    rand = random.Random(0)
+    work_items = []
+    for number in range(1, count + 1):
+        state = rand.choice(STATES)
+        fields = {
+            "System.Id": number,
+            "System.WorkItemType": rand.choice(["Product Backlog Item",
+                                                "Bug"]),
+            "System.State": state,
+            "System.Title": f"Work item {number} needs doing",
+            "System.BoardColumn": state,
+            "System.AssignedTo": {
+                "displayName": f"User {number % USERS}",
+                "uniqueName": f"user{number % USERS}@example.com"
+            }
+        }
+        if number % 10 == 0:
+            del fields["System.AssignedTo"]
+        work_items.append({
+            "id": number,
+            "rev": 1,
+            "fields": fields,
+            "url": f"https://dev.azure.com/org/_apis/wit/workItems/{number}"
+        })
+    return json.dumps({"count": count, "value": work_items})
+
+
+def build_containers(response: str,
+                     keep_work_items: bool) -> List[WorkItemContainer]:
+    """Build WorkItemContainers from a batch get response.
+
+    Args:
+        response (str): The response body.
+        keep_work_items (bool): Whether the containers should keep the Azure
+            DevOps work items.
+
+    Returns:
+        List[WorkItemContainer]: The containers.
+    """
+    return [
+        WorkItemContainer(WorkItem.deserialize(work_item), keep_work_items)
+        for work_item in json.loads(response)["value"]
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--items",
+                        type=int,
+                        default=100000,
+                        help="how many work items to hold")
+    parser.add_argument("--keep-work-items",
+                        action="store_true",
+                        help="keep the Azure DevOps work items in the "
+                        "containers")
+    parser.add_argument("--max-bytes",
+                        type=float,
+                        default=None,
+                        help="exit with an error if the memory held per work "
+                        "item is above this")
+    args = parser.parse_args()
+
+    response = generate_response(args.items)
+
+    gc.collect()
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    containers = build_containers(response, args.keep_work_items)
+    gc.collect()
+    held, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    held -= baseline
+    peak -= baseline
+    per_item = held / len(containers)
+    print(f"{len(containers)} work items: {held / 2**20:.1f}MiB held "
+          f"({per_item:.0f} bytes each), {peak / 2**20:.1f}MiB peak")
+
+    if args.max_bytes is not None and per_item > args.max_bytes:
+        print(f"\n{per_item:.0f} bytes per work item is over the budget of "
+              f"{args.max_bytes:.0f} bytes")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,503 @@
+"""fake_server.py
+
+A local stand-in for the parts of the Azure DevOps REST API the plugin uses,
+so benchmarks can send real HTTP requests without touching a real
+organisation.
+
+It serves service discovery, the work item batch get, WIQL, update and batch
+update endpoints, and the teams and board endpoints, from an in-memory
+project. Each request can be slowed down by a fixed latency, WIQL queries are
+capped like the real service caps them, and a share of requests can be made
+to fail.
+
+Usage:
+    with FakeAzureDevOps(work_items=1000, latency=0.05) as server:
+        cfg = PBIConfig("token", "fake", FakeAzureDevOps.PROJECT,
+                        FakeAzureDevOps.EMAIL, url=server.url)
+        ...
+
+Author:
+    Sam Gibson <sgibson@glasswallsolutions.com>
+"""
+
+from collections import Counter
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import random
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+COLUMNS = ["New", "Approved", "In Development", "Validation", "Done"]
+"""The columns of every board on the fake server."""
+
+TEAMS = ["DevOps", "QA", "Product"]
+"""The teams in the fake project, each of which has a board."""
+
+COLUMN_FIELD = "WEF_FAKE_Kanban.Column"
+"""The name of the field that stores which board column a work item is in."""
+
+BATCH_SIZE = 200
+"""The most work items the fake server allows in one batch request."""
+
+WIQL_CAP = 20000
+"""The most work items the real service returns from one WIQL query."""
+
+CREATED_DATE = "2020-01-01T00:00:00.000Z"
+"""When every work item on the fake server was last changed, until it is
+updated."""
+
+
+def _now() -> str:
+    """Get the current time, as the service formats it."""
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] \
+        + "Z"
+
+
+def _location(location_id: str, area: str, resource: str,
+              route_template: str) -> dict:
+    """Describe a resource location, as returned by service discovery."""
+    return {
+        "id": location_id,
+        "area": area,
+        "resourceName": resource,
+        "routeTemplate": route_template,
+        "resourceVersion": 1,
+        "minVersion": 1.0,
+        "maxVersion": 5.1,
+        "releasedVersion": "5.1"
+    }
+
+
+LOCATIONS = [
+    _location("e81700f7-3be2-46de-8624-2eb35882fcaa", "Location",
+              "ResourceAreas", "_apis/{resource}/{areaId}"),
+    _location("908509b6-4248-4475-a1cd-829139ba419f", "wit",
+              "workitemsbatch", "{project}/_apis/{area}/{resource}"),
+    _location("1a9c53f7-f243-4447-b110-35ef023636e4", "wit", "wiql",
+              "{project}/{team}/_apis/{area}/{resource}/{id}"),
+    _location("72c7ddf8-2cdc-4f60-90cd-ab71c14a399b", "wit", "workItems",
+              "{project}/_apis/{area}/{resource}/{id}"),
+    _location("d30a3dd1-f8ba-442a-b86a-bd0c0c383e59", "core", "teams",
+              "_apis/projects/{projectId}/{resource}/{*teamId}"),
+    _location("c555d7ff-84e1-47df-9923-a3fe0cd8751b", "work", "columns",
+              "{project}/{team}/_apis/{area}/boards/{board}/{resource}"),
+    _location("23ad19fc-3b8e-4877-8462-b3f92bc06b40", "work", "boards",
+              "{project}/{team}/_apis/{area}/{resource}/{id}"),
+]
+"""The resource locations the plugin uses, returned by service discovery."""
+
+
+class FakeProject:
+    """The work items in the fake project.
+
+    Attributes:
+        work_items (Dict[int, dict]): The fields of each work item, by ID.
+    """
+    def __init__(self, count: int, email: str, seed: int = 0) -> None:
+        """Create a project with work items assigned to a user.
+
+        Args:
+            count (int): How many work items to create. They are numbered from
+                1 upwards.
+            email (str): The email of the user to assign them to.
+            seed (int): The seed for the random parts of the work items.
+        """
+        rand = random.Random(seed)
+        self.work_items = {}
+        self._lock = threading.Lock()
+        for number in range(1, count + 1):
+            column = rand.choice(COLUMNS[:-1])
+            self.work_items[number] = {
+                "System.Id": number,
+                "System.WorkItemType": rand.choice(["Product Backlog Item",
+                                                    "Bug"]),
+                "System.State": column,
+                "System.Title": f"Work item {number}",
+                "System.BoardColumn": column,
+                "System.AssignedTo": {
+                    "displayName": email,
+                    "uniqueName": email
+                },
+                "System.ChangedDate": CREATED_DATE,
+                "System.Rev": 1,
+                COLUMN_FIELD: column
+            }
+
+    def get(self, number: int, fields: List[str] = None) -> Optional[dict]:
+        """Get a work item as the service returns it.
+
+        Args:
+            number (int): The ID of the work item.
+            fields (List[str]): The fields to return, or None for all of them.
+
+        Returns:
+            dict: The work item, or None if it doesn't exist.
+        """
+        with self._lock:
+            work_item = self.work_items.get(number)
+            if work_item is None:
+                return None
+            if fields is not None:
+                work_item = {
+                    field: value
+                    for field, value in work_item.items() if field in fields
+                }
+            return {
+                "id": number,
+                "rev": self.work_items[number]["System.Rev"],
+                "fields": dict(work_item)
+            }
+
+    def update(self, number: int,
+               operations: List[dict]) -> Tuple[int, dict]:
+        """Apply a JSON patch document to a work item.
+
+        Args:
+            number (int): The ID of the work item.
+            operations (List[dict]): The JSON patch operations.
+
+        Returns:
+            Tuple[int, dict]: The status code and body of the response.
+        """
+        with self._lock:
+            work_item = self.work_items.get(number)
+            if work_item is None:
+                return 404, _error(
+                    f"TF401232: Work item {number} does not exist.")
+
+            changes = {}
+            for op in operations:
+                if op["op"] == "test":
+                    # only the revision is ever tested
+                    if op["value"] != work_item["System.Rev"]:
+                        return 412, _error(
+                            f"TF26071: Work item {number} has been changed "
+                            f"since revision {op['value']}.")
+                    continue
+                field = op["path"][len("/fields/"):]
+                value = op["value"]
+                if field == COLUMN_FIELD:
+                    if value not in COLUMNS:
+                        return 400, _error(
+                            f"TF401320: Rule Error for field Board Column. "
+                            f"Error code: Required, InvalidListValue.")
+                    changes["System.BoardColumn"] = value
+                    changes["System.State"] = value
+                elif field == "System.AssignedTo":
+                    value = {"displayName": value, "uniqueName": value}
+                changes[field] = value
+            changes["System.ChangedDate"] = _now()
+            changes["System.Rev"] = work_item["System.Rev"] + 1
+            work_item.update(changes)
+        return 200, self.get(number)
+
+    def query(self, email: str, after: int) -> List[int]:
+        """Find the IDs of the open work items assigned to a user.
+
+        Args:
+            email (str): The email of the user.
+            after (int): Only find work items with IDs greater than this.
+
+        Returns:
+            List[int]: The IDs, in ascending order.
+        """
+        with self._lock:
+            return [
+                number for number, fields in sorted(self.work_items.items())
+                if number > after and fields["System.State"] != "Done"
+                and fields["System.AssignedTo"]["uniqueName"].lower() ==
+                email.lower()
+            ]
+
+    def changed(self,
+                since: Optional[str],
+                after: int,
+                email: str = None) -> List[int]:
+        """Find the IDs of the work items changed since a given time.
+
+        Args:
+            since (str): Only find work items changed at or after this time,
+                or None to find all of them.
+            after (int): Only find work items with IDs greater than this.
+            email (str): Only find work items assigned to this user. The fake
+                server doesn't keep history, so this stands in for ones that
+                were ever assigned to them.
+
+        Returns:
+            List[int]: The IDs, in ascending order.
+        """
+        # the dates all have the same format, so they compare as strings
+        # once the fraction of a second is cut off
+        since = since[:19] if since else ""
+        with self._lock:
+            return [
+                number for number, fields in sorted(self.work_items.items())
+                if number > after
+                and fields["System.ChangedDate"][:19] >= since and (
+                    email is None or fields["System.AssignedTo"]
+                    ["uniqueName"].lower() == email.lower())
+            ]
+
+
+def _error(message: str) -> dict:
+    """Create the body of an error response."""
+    return {"$id": "1", "message": message, "typeKey": "FakeException"}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Handles a request to the fake server."""
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_body(self) -> Any:
+        length = int(self.headers.get("Content-Length") or 0)
+        if length == 0:
+            return None
+        return json.loads(self.rfile.read(length))
+
+    def _respond(self, status: int, body: Any = None) -> None:
+        data = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        if status == 429:
+            self.send_header("Retry-After", str(self.server.fake.retry_after))
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _handle(self) -> None:
+        server = self.server.fake
+        url = urlsplit(self.path)
+        path = unquote(url.path).strip("/")
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        body = self._read_body()
+
+        endpoint, status, response = server.route(self.command, path, query,
+                                                  body)
+        self._respond(status, response)
+        server.record(endpoint, status)
+
+    do_GET = do_POST = do_PATCH = do_OPTIONS = _handle
+
+
+class FakeAzureDevOps:
+    """A local HTTP server that stands in for an Azure DevOps organisation.
+
+    Attributes:
+        project (FakeProject): The work items on the server.
+        latency (float): How many seconds to wait before answering each
+            request.
+        wiql_cap (int): The most work items a WIQL query can return.
+        failure_rate (float): The share of requests to fail, from 0 to 1.
+            Service discovery never fails.
+        failure_status (int): The status code failed requests return. 429
+            fails them as if they were throttled.
+        retry_after (float): How many seconds throttled requests are told to
+            wait before retrying.
+        requests (Counter): How many requests each endpoint has answered.
+        failures (int): How many requests were made to fail.
+    """
+    PROJECT = "Fake"
+    """The name of the fake project."""
+
+    EMAIL = "bench@example.com"
+    """The user the work items are assigned to."""
+
+    def __init__(self,
+                 work_items: int = 1000,
+                 latency: float = 0.0,
+                 wiql_cap: int = WIQL_CAP,
+                 failure_rate: float = 0.0,
+                 failure_status: int = 503,
+                 retry_after: float = 0.1,
+                 seed: int = 0) -> None:
+        self.project = FakeProject(work_items, self.EMAIL, seed)
+        self.latency = latency
+        self.wiql_cap = wiql_cap
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.retry_after = retry_after
+        self.requests = Counter()
+        self.failures = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        """str: The URL of the fake organisation."""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self) -> "FakeAzureDevOps":
+        """Start serving requests on a free local port."""
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self._server.daemon_threads = True
+        self._server.fake = self
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop serving requests."""
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self) -> "FakeAzureDevOps":
+        return self.start()
+
+    def __exit__(self, *exc_details) -> None:
+        self.stop()
+
+    def reset_counts(self) -> None:
+        """Forget how many requests have been answered."""
+        with self._lock:
+            self.requests.clear()
+            self.failures = 0
+
+    def record(self, endpoint: str, status: int) -> None:
+        """Count a request that was answered."""
+        with self._lock:
+            self.requests[endpoint] += 1
+
+    def _should_fail(self) -> bool:
+        with self._lock:
+            if self.failure_rate > 0 \
+                    and self._random.random() < self.failure_rate:
+                self.failures += 1
+                return True
+        return False
+
+    def route(self, method: str, path: str, query: Dict[str, str],
+              body: Any) -> Tuple[str, int, Any]:
+        """Answer a request.
+
+        Args:
+            method (str): The HTTP method.
+            path (str): The decoded URL path, without leading or trailing
+                slashes.
+            query (Dict[str, str]): The query parameters.
+            body (Any): The decoded JSON body, if any.
+
+        Returns:
+            Tuple[str, int, Any]: The name of the endpoint, and the status code
+                and body of the response.
+        """
+        if path == "_apis/ResourceAreas":
+            return "discovery", 200, {"count": 0, "value": []}
+        if method == "OPTIONS" and path == "_apis":
+            return "discovery", 200, {
+                "count": len(LOCATIONS),
+                "value": LOCATIONS
+            }
+
+        if self.latency:
+            time.sleep(self.latency)
+        if self._should_fail():
+            return "failure", self.failure_status, _error(
+                "The service is unavailable.")
+
+        if method == "POST" and path.endswith("_apis/wit/workitemsbatch"):
+            return ("workitemsbatch", ) + self._get_batch(body)
+        if method == "POST" and path.endswith("_apis/wit/wiql"):
+            return ("wiql", ) + self._wiql(body, query)
+        if method == "POST" and path == "_apis/wit/$batch":
+            return ("$batch", ) + self._update_batch(body)
+        match = re.fullmatch(r"(?:[^/]+/)?_apis/wit/workItems/(\d+)", path,
+                             re.IGNORECASE)
+        if match and method == "PATCH":
+            return ("update", ) + self.project.update(
+                int(match.group(1)), body)
+        if match and method == "GET":
+            work_item = self.project.get(int(match.group(1)))
+            if work_item is None:
+                return "workitem", 404, _error("TF401232: Not found.")
+            return "workitem", 200, work_item
+        if method == "GET" and re.fullmatch(r"_apis/projects/[^/]+/teams",
+                                            path):
+            return "teams", 200, {
+                "count": len(TEAMS),
+                "value": [{"name": team} for team in TEAMS]
+            }
+        match = re.fullmatch(r"[^/]+/([^/]+)/_apis/work/boards/[^/]+(/columns)?",
+                             path)
+        if match and method == "GET":
+            if match.group(1) not in TEAMS:
+                return "boards", 404, _error(
+                    f"VS800075: The team '{match.group(1)}' does not exist.")
+            if match.group(2):
+                return "columns", 200, {
+                    "count": len(COLUMNS),
+                    "value": [{"name": column} for column in COLUMNS]
+                }
+            return "boards", 200, {
+                "fields": {
+                    "columnField": {
+                        "referenceName": COLUMN_FIELD
+                    }
+                }
+            }
+        return "unknown", 404, _error(f"No route for {method} /{path}")
+
+    def _get_batch(self, body: dict) -> Tuple[int, Any]:
+        ids = body["ids"]
+        if len(ids) > BATCH_SIZE:
+            return 400, _error(f"VS402335: The maximum number of work items "
+                               f"in a batch is {BATCH_SIZE}.")
+        work_items = [self.project.get(number, body.get("fields"))
+                      for number in ids]
+        if str(body.get("errorPolicy", "")).lower() != "omit" \
+                and None in work_items:
+            return 404, _error("TF401232: Work item does not exist.")
+        return 200, {"count": len(work_items), "value": work_items}
+
+    def _wiql(self, body: dict, query: Dict[str, str]) -> Tuple[int, Any]:
+        wiql = body["query"]
+        email = re.search(r"\[System\.AssignedTo\]\s*(?:=|EVER)\s*'([^']*)'",
+                          wiql)
+        since = re.search(r"\[System\.ChangedDate\]\s*>=\s*'([^']*)'", wiql)
+        after = re.search(r"\[System\.Id\]\s*>\s*(\d+)", wiql)
+        after = int(after.group(1)) if after else 0
+        if email and not since:
+            ids = self.project.query(email.group(1), after)
+        else:
+            ids = self.project.changed(since.group(1) if since else None,
+                                       after,
+                                       email.group(1) if email else None)
+        top = int(query["$top"]) if "$top" in query else None
+        if len(ids) > self.wiql_cap and (top is None or top > self.wiql_cap):
+            return 400, _error(
+                f"VS402337: The number of work items returned exceeds the "
+                f"size limit of {self.wiql_cap}.")
+        ids = ids[:top]
+        return 200, {
+            "queryType": "flat",
+            "workItems": [{"id": number} for number in ids]
+        }
+
+    def _update_batch(self, body: List[dict]) -> Tuple[int, Any]:
+        if len(body) > BATCH_SIZE:
+            return 400, _error(f"VS402335: The maximum number of work items "
+                               f"in a batch is {BATCH_SIZE}.")
+        responses = []
+        for request in body:
+            number = int(re.search(r"workitems/(\d+)", request["uri"],
+                                   re.IGNORECASE).group(1))
+            code, response = self.project.update(number, request["body"])
+            responses.append({
+                "code": code,
+                "headers": {
+                    "Content-Type": "application/json; charset=utf-8"
+                },
+                "body": json.dumps(response)
+            })
+        return 200, {"count": len(responses), "value": responses}
@@ -10,9 +10,9 @@ from setuptools import setup, find_packages
 setup(
     dependency_links=[],
     install_requires=[
-        "victoria", "click", "marshmallow", "azure-devops", "tabulate",
-        "colorama"
+        "victoria", "click", "marshmallow", "azure-devops", "colorama"
     ],
+    extras_require={"async": ["aiohttp"]},
     name="victoria_pbi",
     version="#{TAG_NAME}#",
     description="Victoria plugin to manipulate Azure DevOps PBIs",
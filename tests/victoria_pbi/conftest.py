@@ -1,10 +1,14 @@
 from collections import namedtuple
+import json
 
+from azure.devops.client_configuration import ClientConfiguration
+from azure.devops.exceptions import AzureDevOpsClientRequestError
 import azure.devops.connection
 import msrest.authentication
 import pytest
 
 import victoria_pbi
+from victoria_pbi.config import CacheConfig, TransportConfig
 from victoria_pbi.pbi import WorkItemContainer
 
 WorkItem = namedtuple("WorkItem", ["fields", "id"])
@@ -25,6 +29,11 @@ def generate_work_item(number,
             },
             "System.Title": "This is a work item",
             "System.BoardColumn": "In Development",
+            "System.ChangedDate": "2020-01-01T00:00:00.123Z",
+            "System.Rev": 1,
+            "System.IterationPath": "Project\\Sprint 1",
+            "System.AreaPath": "Project\\DevOps",
+            "Microsoft.VSTS.Scheduling.Effort": 5.0,
             "_Kanban.Column": kanban_column
         }, number)
     if not assigned:
@@ -32,7 +41,7 @@ def generate_work_item(number,
     return wi
 
 
-def create_work_item_container(work_item):
+def create_work_item_container(work_item, keep_work_item=False):
     expected = WorkItemContainer.__new__(WorkItemContainer)
     expected.id_number = work_item.id
     expected.title = work_item.fields["System.Title"]
@@ -44,16 +53,47 @@ def create_work_item_container(work_item):
             "uniqueName"]
     expected.state = work_item.fields["System.State"]
     expected.board_column = work_item.fields["System.BoardColumn"]
-    expected.work_item = work_item
+    expected.fields = None
+    expected.work_item = work_item if keep_work_item else None
+    expected.source = None
     return expected
 
 
-WorkItemQueryResult = namedtuple("WorkItemQueryResult", ["work_items"])
+WorkItemQueryResult = namedtuple("WorkItemQueryResult",
+                                 ["work_items", "work_item_relations"],
+                                 defaults=[None])
+
+WorkItemLink = namedtuple("WorkItemLink", ["source", "target"])
+
+WorkItemReference = namedtuple("WorkItemReference", ["id"])
+
+# the parent of each work item under another, for links queries
+HIERARCHY = {100001: 100000, 100002: 100000, 100003: 100001, 100004: 100003}
 
 BoardColumn = namedtuple("BoardColumn", ["name"])
 
+Board = namedtuple("Board", ["fields"])
+
+BoardFields = namedtuple("BoardFields", ["column_field"])
+
+FieldReference = namedtuple("FieldReference", ["reference_name"])
+
 WebApiTeam = namedtuple("WebApiTeam", ["name"])
 
+WorkItemField = namedtuple("WorkItemField", ["reference_name", "name", "type"])
+
+TeamFieldValues = namedtuple("TeamFieldValues", ["field", "values"])
+
+TeamFieldValue = namedtuple("TeamFieldValue", ["value", "include_children"])
+
+TeamMember = namedtuple("TeamMember", ["identity"])
+
+IdentityRef = namedtuple("IdentityRef", ["unique_name"])
+
+WorkItemType = namedtuple("WorkItemType", ["states"])
+
+WorkItemStateColor = namedtuple("WorkItemStateColor", ["name"])
+
 
 class MockBasicAuthentication:
     def __init__(self, *args, **kwargs):
@@ -71,43 +111,119 @@ class MockClients:
         return MockCoreClient()
 
 
-class MockWorkItemClient:
+class MockClient:
+    def __init__(self):
+        self.config = ClientConfiguration("https://mock/")
+
+
+class MockWorkItemClient(MockClient):
     def get_work_item(self, number):
         return generate_work_item(number)
 
     def get_work_items_batch(self, request):
-        return [generate_work_item(number) for number in range(100000, 100005)]
+        return [generate_work_item(number) for number in request.ids]
+
+    def get_fields(self, project=None):
+        return [
+            WorkItemField("System.Title", "Title", "string"),
+            WorkItemField("System.IterationPath", "Iteration Path",
+                          "treePath"),
+            WorkItemField("Microsoft.VSTS.Scheduling.Effort", "Effort",
+                          "double"),
+            WorkItemField("System.CreatedBy", "Created By", "string")
+        ]
 
-    def query_by_wiql(self, wiql):
-        return WorkItemQueryResult(
-            [generate_work_item(number) for number in range(100000, 100005)])
+    def get_work_item_type(self, project, type):
+        return WorkItemType([
+            WorkItemStateColor(name)
+            for name in ["New", "In Development", "Done", "Removed"]
+        ])
+
+    def query_by_wiql(self, wiql, time_precision=None, top=None):
+        if "WorkItemLinks" in wiql.query:
+            ids = [
+                int(number) for number in wiql.query.split("IN (")[1].split(
+                    ")")[0].split(",")
+            ]
+            links = [WorkItemLink(None, WorkItemReference(id)) for id in ids]
+            # recursive queries go down from the sources they're given
+            parents = set(ids)
+            for child, parent in HIERARCHY.items():
+                if parent in parents:
+                    parents.add(child)
+                    links.append(
+                        WorkItemLink(WorkItemReference(parent),
+                                     WorkItemReference(child)))
+            return WorkItemQueryResult([], links)
+        return WorkItemQueryResult([
+            generate_work_item(number) for number in range(100000, 100005)
+        ][:top])
 
     def update_work_item(self, ops, number):
-        # we only ever use one operation, so grab the 1st
-        op = ops[0]
         wi = generate_work_item(number)
-
-        # if it's an email we need to set uniqueName
-        if "@" in op.value:
-            # snip off the "/fields/" part of the path given
-            wi.fields[op.path[8:]] = {"uniqueName": op.value}
-        else:
-            wi.fields[op.path[8:]] = op.value
+        for op in ops:
+            if op.op == "test":
+                if wi.fields["System.Rev"] != op.value:
+                    raise AzureDevOpsClientRequestError(
+                        "TF26071: This work item has been changed by someone "
+                        "else since you opened it.")
+            # if it's an email we need to set uniqueName
+            elif "@" in op.value:
+                # snip off the "/fields/" part of the path given
+                wi.fields[op.path[8:]] = {"uniqueName": op.value}
+            else:
+                wi.fields[op.path[8:]] = op.value
         return wi
 
 
-class MockWorkClient:
+class MockWorkItemBatchClient(MockClient):
+    def update_work_items_batch(self, documents):
+        responses = []
+        client = MockWorkItemClient()
+        for number, ops in documents.items():
+            try:
+                wi = client.update_work_item(ops, number)
+            except AzureDevOpsClientRequestError as err:
+                responses.append({
+                    "code": 412,
+                    "body": json.dumps({"message": str(err)})
+                })
+                continue
+            responses.append({
+                "code": 200,
+                "body": json.dumps({
+                    "id": wi.id,
+                    "fields": wi.fields
+                })
+            })
+        return responses
+
+
+class MockWorkClient(MockClient):
     def get_board_columns(self, team_ctx, board):
         return [
             BoardColumn(name)
             for name in ["New", "Approved", "In Dev", "Done"]
         ]
 
+    def get_board(self, team_ctx, board):
+        return Board(BoardFields(FieldReference("_Kanban.Column")))
+
+    def get_team_field_values(self, team_ctx):
+        return TeamFieldValues(FieldReference("System.AreaPath"),
+                               [TeamFieldValue("Project\\DevOps", True)])
+
 
-class MockCoreClient:
+class MockCoreClient(MockClient):
     def get_teams(self, project):
         return [WebApiTeam(name) for name in ["DevOps", "QA", "Product"]]
 
+    def get_team_members_with_extended_properties(self, project, team):
+        return [
+            TeamMember(IdentityRef(email))
+            for email in ["email@test.com", "b@test.com"]
+        ]
+
 
 class MockConnection:
     clients = MockClients()
@@ -115,11 +231,19 @@ class MockConnection:
     def __init__(self, *args, **kwargs):
         pass
 
+    def get_client(self, client_type):
+        if client_type == "victoria_pbi.pbi.WorkItemBatchClient":
+            return MockWorkItemBatchClient()
+        raise ValueError(f"Unknown client type '{client_type}'")
+
 
 class MockConfig:
     project = "mocked_project"
     access_token = "mocked_access_token"
     organisation = "mocked_organisation"
+    url = None
+    cache = CacheConfig(discovery_ttl=0)
+    transport = TransportConfig()
 
 
 def create_mock_api(monkeypatch):
@@ -130,6 +254,13 @@ def create_mock_api(monkeypatch):
     return victoria_pbi.pbi.AzureDevOpsAPI(MockConfig())
 
 
+@pytest.fixture(autouse=True)
+def cache_dir(monkeypatch, tmp_path):
+    # keep tests from using the real cache
+    monkeypatch.setenv("VICTORIA_PBI_CACHE_DIR", str(tmp_path / "cache"))
+    return tmp_path / "cache"
+
+
 @pytest.fixture
 def mock_api(monkeypatch):
     return create_mock_api(monkeypatch)
\ No newline at end of file
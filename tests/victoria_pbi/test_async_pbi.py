@@ -0,0 +1,191 @@
+import asyncio
+import json
+
+import pytest
+
+aiohttp = pytest.importorskip("aiohttp")
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+import victoria_pbi.async_pbi
+from victoria_pbi.async_pbi import AsyncAzureDevOpsAPI, bounded_gather
+from victoria_pbi.pbi import AzureDevOpsServiceError
+
+from conftest import MockConfig, generate_work_item
+
+
+def work_item_json(number, **kwargs):
+    return {
+        "id": number,
+        "fields": generate_work_item(number, **kwargs).fields
+    }
+
+
+class MockRouter:
+    """Stands in for the REST API by routing requests to canned responses."""
+    def __init__(self):
+        self.requests = []
+        self.wiql_ids = list(range(100000, 100005))
+
+    async def __call__(self,
+                       method,
+                       path,
+                       body=None,
+                       content_type=None,
+                       params=None):
+        self.requests.append((method, path, body))
+        if path.endswith("_apis/wit/workitemsbatch"):
+            return {"value": [work_item_json(n) for n in body["ids"]]}
+        if path.endswith("_apis/wit/wiql"):
+            after = int(body["query"].split("[System.Id]>")[1].split()[0])
+            ids = [n for n in self.wiql_ids if n > after][:params["$top"]]
+            return {"workItems": [{"id": n} for n in ids]}
+        if path.endswith("/teams"):
+            return {"value": [{"name": n} for n in ["DevOps", "QA"]]}
+        if path.endswith("/columns"):
+            return {"value": [{"name": n} for n in ["New", "Done"]]}
+        if "/_apis/work/boards/" in path:
+            return {
+                "fields": {
+                    "columnField": {
+                        "referenceName": "B_Kanban.Column"
+                    }
+                }
+            }
+        if method == "GET":
+            return work_item_json(int(path.split("/")[-1]))
+        if method == "PATCH":
+            number = int(path.split("/")[-1])
+            result = work_item_json(number)
+            value = body[0]["value"]
+            if "@" in value:
+                value = {"uniqueName": value}
+            result["fields"][body[0]["path"][8:]] = value
+            return result
+        raise AssertionError(f"unexpected request {method} {path}")
+
+
+@pytest.fixture
+def router(monkeypatch):
+    router = MockRouter()
+    monkeypatch.setattr(AsyncAzureDevOpsAPI, "_request",
+                        lambda self, *args, **kwargs: router(*args, **kwargs))
+    return router
+
+
+async def collect(generator):
+    return [item async for item in generator]
+
+
+def test_bounded_gather():
+    running = 0
+    max_running = 0
+
+    async def work(number):
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        await asyncio.sleep(0.001 * (10 - number))
+        running -= 1
+        return number
+
+    result = asyncio.run(collect(bounded_gather(work, range(10), 3)))
+    assert result == list(range(10))
+    assert max_running == 3
+
+
+def test_get_work_items(router):
+    api = AsyncAzureDevOpsAPI(MockConfig())
+    numbers = list(range(1000, 1450)) + [1000]
+    result = asyncio.run(collect(api.get_work_items(numbers)))
+    assert [wi.id_number for wi in result] == list(range(1000, 1450))
+    assert [len(body["ids"])
+            for _, _, body in router.requests] == [200, 200, 50]
+
+
+def test_get_user_pbis(router):
+    api = AsyncAzureDevOpsAPI(MockConfig())
+    result = asyncio.run(collect(api.get_user_pbis("email@test.com")))
+    assert [wi.id_number for wi in result] == list(range(100000, 100005))
+    assert "email@test.com" in router.requests[0][2]["query"]
+
+
+def test_get_user_pbis_paged(router, monkeypatch):
+    monkeypatch.setattr(victoria_pbi.async_pbi, "WIQL_PAGE_SIZE", 4)
+    router.wiql_ids = list(range(1, 11))
+    api = AsyncAzureDevOpsAPI(MockConfig())
+
+    result = asyncio.run(collect(api.get_user_pbis("email@test.com")))
+    assert [wi.id_number for wi in result] == list(range(1, 11))
+    queries = [body["query"] for _, path, body in router.requests
+               if path.endswith("wiql")]
+    assert len(queries) == 3
+    assert "[System.Id]>8" in queries[2]
+
+    result = asyncio.run(collect(api.get_user_pbis("email@test.com", top=6)))
+    assert [wi.id_number for wi in result] == list(range(1, 7))
+
+
+def test_get_boards_and_states(router):
+    api = AsyncAzureDevOpsAPI(MockConfig())
+    assert asyncio.run(collect(api.get_boards())) == ["DevOps", "QA"]
+    assert asyncio.run(collect(
+        api.get_board_states("DevOps Team"))) == ["New", "Done"]
+    assert router.requests[1][1] == "mocked_project/DevOps%20Team/" \
+        "_apis/work/boards/Backlog%20items/columns"
+
+
+def test_move_work_item(router):
+    api = AsyncAzureDevOpsAPI(MockConfig())
+    result = asyncio.run(api.move_work_item(100000, "Done"))
+    assert result.id_number == 100000
+    assert router.requests[-1][2][0]["path"] == "/fields/_Kanban.Column"
+
+
+def test_move_work_item_board(router):
+    api = AsyncAzureDevOpsAPI(MockConfig())
+
+    async def move():
+        await api.move_work_item(1, "Done", "DevOps")
+        await api.move_work_item(2, "Done", "DevOps")
+
+    asyncio.run(move())
+    methods = [method for method, _, _ in router.requests]
+    assert methods == ["GET", "PATCH", "PATCH"]
+    assert router.requests[-1][2][0]["path"] == "/fields/B_Kanban.Column"
+
+
+def test_assign_work_item(router):
+    api = AsyncAzureDevOpsAPI(MockConfig())
+    result = asyncio.run(api.assign_work_item(100000, "test123@email.com"))
+    assert result.assigned_to == "test123@email.com"
+
+
+def test_request_over_http():
+    async def workitemsbatch(request):
+        assert request.query["api-version"] == "5.1"
+        assert request.headers["Authorization"].startswith("Basic ")
+        body = await request.json()
+        return web.json_response(
+            {"value": [work_item_json(n) for n in body["ids"]]})
+
+    async def teams(request):
+        return web.json_response({"message": "TF400344: No such project"},
+                                 status=404)
+
+    async def run():
+        app = web.Application()
+        app.router.add_post("/mocked_project/_apis/wit/workitemsbatch",
+                            workitemsbatch)
+        app.router.add_get("/_apis/projects/mocked_project/teams", teams)
+        async with TestServer(app) as server:
+            async with AsyncAzureDevOpsAPI(MockConfig()) as api:
+                api.base_url = str(server.make_url("/"))
+                work_items = await collect(api.get_work_items([1, 2]))
+                with pytest.raises(AzureDevOpsServiceError):
+                    await collect(api.get_boards())
+            assert api._session is None
+            return work_items
+
+    result = asyncio.run(run())
+    assert [wi.id_number for wi in result] == [1, 2]
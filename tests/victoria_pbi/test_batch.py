@@ -0,0 +1,128 @@
+import json
+
+from msrest.exceptions import ClientRequestError
+import pytest
+
+from victoria_pbi.batch import parse_operation, run_batch, segments
+
+
+def user_email(user):
+    return user if "@" in user else user + "@test.com"
+
+
+def parse(*lines):
+    return [
+        parse_operation(number, json.dumps(line), user_email)
+        for number, line in enumerate(lines, 1)
+    ]
+
+
+@pytest.mark.parametrize("line,error", [
+    ("not json", "Could not read JSON"),
+    ("[1, 2]", "Each line should be a JSON object"),
+    ('{"op": "rm", "ids": [1]}', "Unknown op 'rm'"),
+    ('{"op": "get", "ids": []}', "'ids' should be a list"),
+    ('{"op": "get", "ids": ["1"]}', "'ids' should be a list"),
+    ('{"op": "mv", "ids": [1]}', "'column' is required"),
+    ('{"op": "assign", "ids": [1]}', "'user' is required"),
+])
+def test_parse_operation_invalid(line, error):
+    assert parse_operation(1, line, user_email).error.startswith(error)
+
+
+def test_parse_operation():
+    operation = parse_operation(
+        3, '{"op": "assign", "id": 5, "user": "sam", "ref": "a"}',
+        user_email)
+    assert operation.error is None
+    assert (operation.line, operation.op, operation.ids, operation.value,
+            operation.ref) == (3, "assign", [5], "sam@test.com", "a")
+
+
+def test_segments():
+    operations = parse(
+        {"op": "get", "ids": [1]},
+        {"op": "get", "ids": [1, 2]},
+        {"op": "mv", "ids": [1], "column": "Done"},
+        {"op": "assign", "ids": [1], "user": "sam"},
+        # the same value twice can be combined, a different one can't
+        {"op": "mv", "ids": [1], "column": "done"},
+        {"op": "mv", "ids": [1], "column": "New"},
+        {"op": "get", "ids": [1]})
+    assert [[operation.line for operation in segment]
+            for segment in segments(operations)] == [[1, 2], [3, 4, 5], [6],
+                                                     [7]]
+    assert [len(segment) for segment in segments(operations, 2)] == \
+        [2, 2, 1, 1, 1]
+
+
+def test_run_batch_reads(mock_api, monkeypatch):
+    requested = []
+    get_work_items = mock_api.get_work_items
+
+    def record(numbers):
+        requested.append(list(numbers))
+        return get_work_items(requested[-1])
+
+    monkeypatch.setattr(mock_api, "get_work_items", record)
+    lines = [
+        '{"op": "get", "ids": [1, 2], "ref": "first"}', "",
+        '{"op": "get", "id": 2}', "bad"
+    ]
+    results = list(run_batch(mock_api, lines, user_email))
+
+    # the work item both operations asked for is only fetched once
+    assert requested == [[1, 2]]
+    assert [(result["line"], result["ok"]) for result in results] == \
+        [(1, True), (3, True), (4, False)]
+    assert results[0]["ref"] == "first"
+    assert [item["id"] for item in results[0]["work_items"]] == [1, 2]
+    assert results[1]["work_items"][0]["column"] == "In Development"
+
+
+def test_run_batch_connection_error(mock_api, monkeypatch):
+    def fail(*args, **kwargs):
+        raise ClientRequestError("Connection refused")
+
+    monkeypatch.setattr(mock_api, "get_work_items", fail)
+    monkeypatch.setattr(mock_api, "update_work_items", fail)
+    # the operations fail rather than the whole batch
+    for line in ['{"op": "get", "ids": [1]}',
+                 '{"op": "assign", "ids": [2], "user": "sam"}']:
+        results = list(run_batch(mock_api, [line], user_email))
+        assert [(result["ok"], result["error"]) for result in results] == \
+            [(False, "Connection refused")]
+
+
+def test_run_batch_writes(mock_api, monkeypatch):
+    sent = []
+    update_work_items = mock_api.update_work_items
+
+    def record(documents, *args, **kwargs):
+        sent.append(documents)
+        return update_work_items(documents, *args, **kwargs)
+
+    monkeypatch.setattr(mock_api, "update_work_items", record)
+    lines = [
+        '{"op": "mv", "ids": [1, 2], "column": "in dev", "board": "DevOps"}',
+        '{"op": "assign", "ids": [2, 3], "user": "sam"}',
+        '{"op": "mv", "ids": [4], "column": "In Devv", "board": "DevOps"}'
+    ]
+    results = list(run_batch(mock_api, lines, user_email))
+
+    # every change goes in one bulk update, with one document per work item
+    assert len(sent) == 1
+    assert {
+        number: [(op.path, op.value) for op in ops]
+        for number, ops in sent[0].items()
+    } == {
+        1: [("/fields/_Kanban.Column", "In Dev")],
+        2: [("/fields/_Kanban.Column", "In Dev"),
+            ("/fields/System.AssignedTo", "sam@test.com")],
+        3: [("/fields/System.AssignedTo", "sam@test.com")]
+    }
+    assert results[0] == {"line": 1, "op": "mv", "ok": True,
+                          "updated": [1, 2], "errors": {}}
+    assert results[1]["updated"] == [2, 3]
+    assert results[2]["ok"] is False
+    assert "did not exist on board 'DevOps'" in results[2]["error"]
@@ -0,0 +1,58 @@
+import json
+import os
+import time
+
+from victoria_pbi.cache import DiskCache, default_cache_dir
+
+
+def test_default_cache_dir(cache_dir):
+    assert default_cache_dir() == str(cache_dir)
+
+
+def test_default_cache_dir_xdg(monkeypatch, tmp_path):
+    monkeypatch.delenv("VICTORIA_PBI_CACHE_DIR")
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    assert default_cache_dir() == str(tmp_path / "victoria_pbi")
+
+
+def test_disk_cache(cache_dir):
+    cache = DiskCache("test", 60)
+    assert cache.get("key") is None
+
+    cache.set("key", {"value": [1, 2, 3]})
+    assert cache.get("key") == {"value": [1, 2, 3]}
+    assert os.path.isfile(cache_dir / "test.json")
+
+    # a new cache object should read it back from disk
+    assert DiskCache("test", 60).get("key") == {"value": [1, 2, 3]}
+
+    cache.delete("key")
+    assert cache.get("key") is None
+
+
+def test_disk_cache_expired(cache_dir, monkeypatch):
+    cache = DiskCache("test", 60)
+    cache.set("key", "value")
+
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+    assert cache.get("key") is None
+
+
+def test_disk_cache_corrupt(cache_dir):
+    os.makedirs(cache_dir)
+    with open(cache_dir / "test.json", "w") as cache_file:
+        cache_file.write("{not json")
+
+    cache = DiskCache("test", 60)
+    assert cache.get("key") is None
+    cache.set("key", "value")
+    assert cache.get("key") == "value"
+
+
+def test_disk_cache_unwritable(tmp_path):
+    # a file where the directory should be means it can't be written to
+    (tmp_path / "file").write_text("")
+    cache = DiskCache("test", 60, str(tmp_path / "file"))
+    cache.set("key", "value")
+    assert cache.get("key") is None
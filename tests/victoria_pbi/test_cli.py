@@ -1,11 +1,14 @@
+import json
+
 from click.testing import CliRunner
 import pytest
 
 import victoria_pbi.cli
 from victoria_pbi.cli import pbi
-from victoria_pbi.config import PBIConfig
+from victoria_pbi.config import PBIConfig, TargetConfig
 
-from conftest import create_mock_api
+from conftest import WorkItemQueryResult, create_mock_api, \
+    generate_work_item
 
 
 @pytest.fixture
@@ -19,7 +22,7 @@ def mock_cli(monkeypatch):
     def create_api(*args, **kwargs):
         return create_mock_api(monkeypatch)
 
-    monkeypatch.setattr(victoria_pbi.cli, "AzureDevOpsAPI", create_api)
+    monkeypatch.setattr(victoria_pbi.cli, "_connect", create_api)
 
 
 def test_pbi_cli(cfg_file, mock_cli):
@@ -57,6 +60,132 @@ def test_pbi_cli_ls_email(cfg_file, mock_cli):
     assert result.exit_code == 0
 
 
+def test_pbi_cli_fields(cfg_file, mock_cli):
+    """Test to see if we can show other fields of work items."""
+    runner = CliRunner()
+    result = runner.invoke(pbi, ["get", "100000", "--fields", "effort"],
+                           obj=cfg_file)
+    assert result.exit_code == 0
+    assert result.output.splitlines()[0].split()[-1] == "Effort"
+    assert result.output.splitlines()[1].split()[-1] == "5"
+
+    # the config has the fields to show by default
+    cfg_file.fields = ["Iteration Path"]
+    result = runner.invoke(pbi, ["ls"], obj=cfg_file)
+    assert "Iteration Path" in result.output
+    assert "Sprint 1" in result.output
+    result = runner.invoke(pbi, ["ls", "--fields", ""], obj=cfg_file)
+    assert "Iteration Path" not in result.output
+
+    result = runner.invoke(pbi, ["ls", "-f", "Points"], obj=cfg_file)
+    assert "victoria pbi fields" in result.output
+
+    result = runner.invoke(pbi, ["fields"], obj=cfg_file)
+    assert "Microsoft.VSTS.Scheduling.Effort" in result.output
+
+
+def test_pbi_cli_output(cfg_file, mock_cli):
+    """Test to see if we can print work items for other programs to read."""
+    runner = CliRunner()
+    result = runner.invoke(pbi, ["get", "100000", "100001", "-o", "jsonl"],
+                           obj=cfg_file)
+    assert result.exit_code == 0
+    lines = [json.loads(line) for line in result.output.splitlines()]
+    assert [line["id"] for line in lines] == [100000, 100001]
+    assert lines[0]["column"] == "In Development"
+
+    result = runner.invoke(
+        pbi, ["ls", "--output", "csv", "--fields", "Effort"], obj=cfg_file)
+    assert result.exit_code == 0
+    lines = result.output.splitlines()
+    assert lines[0] == "id,type,title,state,column,assigned_to," \
+        "Microsoft.VSTS.Scheduling.Effort"
+    assert lines[1].endswith(",email@test.com,5.0")
+
+    result = runner.invoke(pbi, ["ls", "-o", "xml"], obj=cfg_file)
+    assert result.exit_code != 0
+
+
+def test_pbi_cli_tree(cfg_file, mock_cli):
+    """Test to see if we can get the work items under a work item."""
+    runner = CliRunner()
+    result = runner.invoke(pbi, ["get", "100000", "--tree"], obj=cfg_file)
+    assert result.exit_code == 0
+    assert [line.split()[0] for line in result.output.splitlines()[1:]] == [
+        "#100000", "#100001", "#100003", "#100004", "#100002"
+    ]
+    assert result.output.splitlines()[3].startswith("    #100003")
+
+    result = runner.invoke(pbi, ["get", "100000", "--depth", "1"],
+                           obj=cfg_file)
+    assert result.exit_code == 0
+    assert len(result.output.splitlines()) == 4
+
+    result = runner.invoke(pbi, ["get", "100000", "--tree", "-o", "csv"],
+                           obj=cfg_file)
+    assert result.exit_code != 0
+
+
+def test_pbi_cli_targets(cfg_file, mock_cli):
+    """Test to see if we can get work items from several projects at once."""
+    cfg_file.targets = [TargetConfig("other", "Other", "other_token")]
+    runner = CliRunner()
+    result = runner.invoke(pbi, ["ls", "-o", "jsonl"], obj=cfg_file)
+    assert result.exit_code == 0
+    lines = [json.loads(line) for line in result.output.splitlines()]
+    assert sorted(line["source"] for line in lines) == \
+        ["organisation/project"] * 5 + ["other/Other"] * 5
+
+    result = runner.invoke(pbi, ["get", "100000"], obj=cfg_file)
+    assert result.exit_code == 0
+    assert result.output.splitlines()[0].split()[-1] == "Source"
+    assert len(result.output.splitlines()) == 3
+
+    result = runner.invoke(pbi, ["boards"], obj=cfg_file)
+    assert result.exit_code == 0
+    assert "other/Other" in result.output
+
+    # trees are only got from the project at the top of the config
+    result = runner.invoke(pbi, ["get", "100000", "--depth", "0"],
+                           obj=cfg_file)
+    assert "Source" not in result.output
+
+
+def test_pbi_cli_output_nothing_found(cfg_file, monkeypatch):
+    """Test to see if other programs only get work items, even when none were
+    found."""
+    api = create_mock_api(monkeypatch)
+    monkeypatch.setattr(victoria_pbi.cli, "_connect", lambda cfg: api)
+    monkeypatch.setattr(api.work_item_client, "query_by_wiql",
+                        lambda *args, **kwargs: WorkItemQueryResult([]))
+
+    runner = CliRunner(mix_stderr=False)
+    result = runner.invoke(pbi, ["ls", "-o", "csv"], obj=cfg_file)
+    assert result.exit_code == 0
+    assert result.stdout.splitlines() == [
+        "id,type,title,state,column,assigned_to"
+    ]
+    result = runner.invoke(pbi, ["ls", "-o", "jsonl"], obj=cfg_file)
+    assert result.stdout == ""
+
+    result = runner.invoke(pbi, ["ls", "-o", "jsonl", "-f", "Bogus"],
+                           obj=cfg_file)
+    assert result.stdout == ""
+    assert "victoria pbi fields" in result.stderr
+
+
+def test_pbi_cli_ls_top(cfg_file, mock_cli):
+    """Test to see if we can limit how many work items are listed."""
+    runner = CliRunner()
+    result = runner.invoke(pbi, ["ls", "--top", "2"], obj=cfg_file)
+    assert result.exit_code == 0
+    assert "#100001" in result.output
+    assert "#100002" not in result.output
+
+    result = runner.invoke(pbi, ["ls", "--top", "0"], obj=cfg_file)
+    assert result.exit_code != 0
+
+
 def test_pbi_cli_columns(cfg_file, mock_cli):
     """Test to see if we can get the columns."""
     runner = CliRunner()
@@ -86,9 +215,218 @@ def test_pbi_cli_assign_user(cfg_file, mock_cli):
     assert result.exit_code == 0
 
 
+def test_pbi_cli_assign_error(cfg_file, monkeypatch, caplog):
+    """Test to see if an error reading the work items is logged."""
+    from azure.devops._models import WrappedException
+    from azure.devops.exceptions import AzureDevOpsServiceError
+    api = create_mock_api(monkeypatch)
+    monkeypatch.setattr(victoria_pbi.cli, "_connect", lambda cfg: api)
+
+    def get_work_items_batch(request):
+        raise AzureDevOpsServiceError(
+            WrappedException(message="Access denied"))
+
+    monkeypatch.setattr(api.work_item_client, "get_work_items_batch",
+                        get_work_items_batch)
+
+    runner = CliRunner()
+    result = runner.invoke(pbi, ["assign", "100000", "email@test.com"],
+                           obj=cfg_file)
+    assert result.exit_code == 0
+    assert "Access denied" in caplog.text
+
+
 def test_pbi_cli_mv(cfg_file, mock_cli):
     """Test to see if we can move a PBI."""
     runner = CliRunner()
-    result = runner.invoke(pbi, ["mv", "100000", "In Development"],
+    result = runner.invoke(pbi, ["mv", "100000", "In Dev"], obj=cfg_file)
+    assert result.exit_code == 0
+
+
+def test_pbi_cli_mv_board(cfg_file, mock_cli):
+    """Test to see if we can move PBIs on a given board."""
+    runner = CliRunner()
+    result = runner.invoke(
+        pbi, ["mv", "100000", "100001", "In Dev", "-b", "DevOps"],
+        obj=cfg_file)
+    assert result.exit_code == 0
+
+
+def test_pbi_cli_mv_bad_column(cfg_file, monkeypatch):
+    """Test to see if a column that doesn't exist is caught before moving."""
+    api = create_mock_api(monkeypatch)
+    monkeypatch.setattr(victoria_pbi.cli, "_connect", lambda cfg: api)
+
+    def update_work_items(*args, **kwargs):
+        raise AssertionError("work items should not be updated")
+
+    monkeypatch.setattr(api, "update_work_items", update_work_items)
+
+    runner = CliRunner()
+    result = runner.invoke(pbi, ["mv", "100000", "100001", "In Devv"],
+                           obj=cfg_file)
+    assert result.exit_code == 0
+    assert "victoria pbi columns BOARD" in result.output
+
+
+def test_pbi_cli_mv_plan(cfg_file, monkeypatch):
+    """Test to see if work items that wouldn't change are left alone."""
+    api = create_mock_api(monkeypatch)
+    monkeypatch.setattr(victoria_pbi.cli, "_connect", lambda cfg: api)
+    updated = []
+
+    def update_work_items(documents, keep_work_items=False):
+        updated.extend(documents)
+        return api.__class__.update_work_items(api, documents)
+
+    monkeypatch.setattr(api, "update_work_items", update_work_items)
+
+    runner = CliRunner()
+    result = runner.invoke(pbi, ["mv", "100000", "100001", "In Dev", "--plan"],
+                           obj=cfg_file)
+    assert result.exit_code == 0
+    assert result.output.splitlines()[1].split()[:4] == [
+        "#100000", "New", "In", "Dev"
+    ]
+    assert "2 of 2 work item(s) would change." in result.output
+
+    # the work items are already in the column
+    result = runner.invoke(pbi, ["mv", "100000", "100001", "new"],
+                           obj=cfg_file)
+    assert result.exit_code == 0
+    assert "2 work item(s) were already in 'New'." in result.output
+
+    result = runner.invoke(pbi, ["assign", "100000", "email@test.com"],
+                           obj=cfg_file)
+    assert result.exit_code == 0
+    assert "already assigned" in result.output
+    assert updated == []
+
+
+def test_pbi_cli_stats(cfg_file, monkeypatch):
+    """Test to see if we can count the work items on a board."""
+    from msrest.exceptions import ClientRequestError
+    api = create_mock_api(monkeypatch)
+    monkeypatch.setattr(victoria_pbi.cli, "_connect", lambda cfg: api)
+
+    runner = CliRunner()
+    result = runner.invoke(pbi, ["stats", "DevOps"], obj=cfg_file)
+    assert result.exit_code == 0
+    lines = result.output.splitlines()
+    assert lines[0].split() == ["Column", "Work", "items"]
+    assert lines[1].split() == ["New", "5"]
+    assert "Unassigned" in result.output
+
+    # if Azure DevOps can't be reached the replica is counted instead
+    assert runner.invoke(pbi, ["sync"], obj=cfg_file).exit_code == 0
+
+    def get_board_stats(board, refresh=False):
+        raise ClientRequestError("Could not connect")
+
+    monkeypatch.setattr(api, "get_board_stats", get_board_stats)
+    result = runner.invoke(pbi, ["stats", "DevOps"], obj=cfg_file)
+    assert result.exit_code == 0
+    assert "Using the replica" in result.output
+    assert "In Dev" in result.output
+    assert "email@test.com  5" in result.output
+
+
+def test_pbi_cli_offline(cfg_file, mock_cli):
+    """Test to see if we can sync the replica and answer from it."""
+    runner = CliRunner()
+    result = runner.invoke(pbi, ["ls", "--offline"], obj=cfg_file)
+    assert result.exit_code == 0
+    assert "victoria pbi sync" in result.output
+
+    result = runner.invoke(pbi, ["sync"], obj=cfg_file)
+    assert result.exit_code == 0
+    assert "The replica has 5 work items" in result.output
+
+    result = runner.invoke(pbi, ["ls", "--offline", "--top", "2"],
                            obj=cfg_file)
-    assert result.exit_code == 0
\ No newline at end of file
+    assert result.exit_code == 0
+    assert "synced just now" in result.output
+    assert "#100001" in result.output
+    assert "#100002" not in result.output
+
+    result = runner.invoke(pbi, ["get", "--offline", "100003"], obj=cfg_file)
+    assert result.exit_code == 0
+    assert "#100003" in result.output
+
+
+def test_pbi_cli_watch(cfg_file, mock_cli, monkeypatch):
+    """Test to see if we can watch work items until interrupted."""
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        if len(sleeps) == 2:
+            raise KeyboardInterrupt()
+
+    monkeypatch.setattr(victoria_pbi.cli.time, "sleep", sleep)
+    runner = CliRunner()
+    result = runner.invoke(pbi, ["watch", "-n", "5"], obj=cfg_file)
+    assert result.exit_code == 0
+    assert sleeps == [5, 5]
+    # the work items only changed once
+    assert result.output.count("#100000") == 1
+
+
+def test_pbi_cli_ls_many_users(monkeypatch):
+    """Test to see if we can list the work items of a team at once."""
+    cfg = PBIConfig("access_token",
+                    "organisation",
+                    "project",
+                    "email@test.com",
+                    teams={"standup": ["b", "a@other.com"]})
+    api = create_mock_api(monkeypatch)
+    monkeypatch.setattr(victoria_pbi.cli, "_connect", lambda cfg: api)
+    queries = []
+
+    def query_by_wiql(wiql, time_precision=None, top=None):
+        queries.append(wiql.query)
+        return WorkItemQueryResult(
+            [generate_work_item(number) for number in range(1, 5)][:top])
+
+    def get_work_items_batch(request):
+        assignees = ["a@other.com", "b@test.com"]
+        return [
+            generate_work_item(number, assigned_to=assignees[number % 2])
+            for number in request.ids
+        ]
+
+    monkeypatch.setattr(api.work_item_client, "query_by_wiql", query_by_wiql)
+    monkeypatch.setattr(api.work_item_client, "get_work_items_batch",
+                        get_work_items_batch)
+
+    runner = CliRunner()
+    result = runner.invoke(pbi, ["ls", "standup", "B"], obj=cfg)
+    assert result.exit_code == 0
+    assert len(queries) == 1
+    assert "IN ('b@test.com', 'a@other.com')" in queries[0]
+
+    # grouped by assignee, in the order they were given
+    rows = [line.split()[0] for line in result.output.splitlines()[1:]]
+    assert rows == ["#1", "#3", "#2", "#4"]
+
+    # other programs get them as they arrive, to group themselves
+    result = runner.invoke(pbi, ["ls", "standup", "-o", "jsonl"], obj=cfg)
+    lines = [json.loads(line) for line in result.output.splitlines()]
+    assert [(line["id"], line["assigned_to"]) for line in lines] == [
+        (1, "b@test.com"), (2, "a@other.com"), (3, "b@test.com"),
+        (4, "a@other.com")
+    ]
+
+
+def test_pbi_cli_batch(cfg_file, mock_cli):
+    """Test to see if we can run operations from stdin."""
+    runner = CliRunner()
+    result = runner.invoke(
+        pbi, ["batch"],
+        input='{"op": "get", "ids": [100000]}\n'
+        '{"op": "assign", "ids": [100000], "user": "test"}\n',
+        obj=cfg_file)
+    assert result.exit_code == 0
+    lines = [json.loads(line) for line in result.output.splitlines()]
+    assert [(line["op"], line["ok"]) for line in lines] == [("get", True),
+                                                            ("assign", True)]
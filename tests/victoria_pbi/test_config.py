@@ -1,6 +1,8 @@
+from marshmallow import ValidationError
 import pytest
 
-from victoria_pbi.config import PBIConfigSchema, PBIConfig
+from victoria_pbi.config import CacheConfig, PBIConfigSchema, PBIConfig, \
+    TargetConfig, TransportConfig
 
 CONFIG_SCHEMA = PBIConfigSchema()
 
@@ -13,3 +15,119 @@ def test_create_pbiconfig():
         "email": "test@test.com"
     })
     assert result == PBIConfig("test", "test", "test", "test@test.com")
+
+
+def test_create_pbiconfig_cache():
+    result = CONFIG_SCHEMA.load({
+        "access_token": "test",
+        "organisation": "test",
+        "project": "test",
+        "email": "test@test.com",
+        "cache": {
+            "directory": "/tmp/cache",
+            "discovery_ttl": 60,
+            "metadata_ttl": 30
+        }
+    })
+    assert result == PBIConfig("test", "test", "test", "test@test.com",
+                               CacheConfig("/tmp/cache", 60, 30))
+    assert result.cache.discovery_ttl == 60
+    assert result.cache.metadata_ttl == 30
+
+
+def test_create_pbiconfig_transport():
+    result = CONFIG_SCHEMA.load({
+        "access_token": "test",
+        "organisation": "test",
+        "project": "test",
+        "email": "test@test.com",
+        "transport": {
+            "pool_size": 16,
+            "keep_alive": False,
+            "timeout": 5,
+            "compression": False,
+            "retries": 2
+        }
+    })
+    assert result.transport == TransportConfig(16, False, 5, False, 2)
+    assert result.cache == CacheConfig()
+
+
+def test_create_pbiconfig_teams():
+    result = CONFIG_SCHEMA.load({
+        "access_token": "test",
+        "organisation": "test",
+        "project": "test",
+        "email": "test@test.com",
+        "teams": {
+            "standup": ["alice", "bob@test.com"]
+        }
+    })
+    assert result.teams == {"standup": ["alice", "bob@test.com"]}
+
+
+def test_create_pbiconfig_fields():
+    result = CONFIG_SCHEMA.load({
+        "access_token": "test",
+        "organisation": "test",
+        "project": "test",
+        "email": "test@test.com",
+        "fields": ["Effort", "Iteration Path"]
+    })
+    assert result.fields == ["Effort", "Iteration Path"]
+    assert result != PBIConfig("test", "test", "test", "test@test.com")
+
+
+def test_create_pbiconfig_url():
+    result = CONFIG_SCHEMA.load({
+        "access_token": "test",
+        "organisation": "test",
+        "project": "test",
+        "email": "test@test.com",
+        "url": "https://devops.example.com/test"
+    })
+    assert result.url == "https://devops.example.com/test"
+    assert result != PBIConfig("test", "test", "test", "test@test.com")
+
+
+def test_create_pbiconfig_targets():
+    result = CONFIG_SCHEMA.load({
+        "access_token": "test",
+        "organisation": "test",
+        "project": "test",
+        "email": "test@test.com",
+        "targets": [{
+            "organisation": "other",
+            "project": "Other",
+            "access_token": "other_token"
+        }, {
+            "name": "platform",
+            "organisation": "test",
+            "project": "Platform"
+        }]
+    })
+    assert result.targets == [
+        TargetConfig("other", "Other", "other_token"),
+        TargetConfig("test", "Platform", name="platform")
+    ]
+
+    configs = result.target_configs()
+    assert list(configs) == ["test/test", "other/Other", "platform"]
+    assert configs["other/Other"].access_token == "other_token"
+    # targets without a token use the one at the top of the config
+    assert configs["platform"].access_token == "test"
+    assert configs["platform"].project == "Platform"
+    assert configs["platform"].email == "test@test.com"
+    assert configs["platform"].targets == []
+    assert result.project == "test"
+
+    with pytest.raises(ValidationError):
+        CONFIG_SCHEMA.load({
+            "access_token": "test",
+            "organisation": "test",
+            "project": "test",
+            "email": "test@test.com",
+            "targets": [{
+                "organisation": "other"
+            }]
+        })
@@ -0,0 +1,164 @@
+import logging
+import os
+import threading
+import time
+
+from azure.devops.exceptions import AzureDevOpsServiceError
+from azure.devops.v5_1.work_item_tracking.models import JsonPatchOperation
+import pytest
+
+import victoria_pbi.daemon
+from victoria_pbi.config import PBIConfig
+from victoria_pbi.daemon import Daemon, DaemonError, NO_DAEMON_ENV_VAR, \
+    RemoteWorkItem, connect, decode, encode, raise_error, socket_path, stop
+from victoria_pbi.pbi import UpdateResult, WorkItemContainer
+from victoria_pbi.workitem import Change
+
+from conftest import generate_work_item
+
+
+@pytest.fixture
+def cfg():
+    return PBIConfig("access_token", "organisation", "project",
+                     "email@test.com")
+
+
+@pytest.fixture
+def daemon(cfg, mock_api, monkeypatch):
+    monkeypatch.setattr(victoria_pbi.daemon, "POLL_INTERVAL", 0.01)
+    daemon = Daemon(cfg, api=mock_api)
+    thread = threading.Thread(target=daemon.serve, daemon=True)
+    thread.start()
+    deadline = time.time() + 5
+    while connect(cfg) is None:
+        assert time.time() < deadline, "the daemon did not start"
+        time.sleep(0.01)
+    yield daemon
+    daemon.stop()
+    thread.join(5)
+
+
+def test_encode_decode():
+    container = WorkItemContainer(generate_work_item(1))
+    with_fields = WorkItemContainer(generate_work_item(1),
+                                    fields=["System.AssignedTo"])
+    values = {
+        1: [container, UpdateResult(2, error="failed"), with_fields],
+        "changes": [
+            Change(1, "System.AssignedTo", None, "a@test.com", 3, container),
+            UpdateResult(1, container, changed=False)
+        ],
+        "work_item": RemoteWorkItem(3, {"System.Title": "Title"}),
+        "ids": (4, 5)
+    }
+    decoded = decode(encode(values))
+    assert decoded[1] == [
+        container, UpdateResult(2, error="failed"), with_fields
+    ]
+    assert decoded["changes"] == values["changes"]
+    assert decoded["work_item"].fields == {"System.Title": "Title"}
+    assert decoded["ids"] == [4, 5]
+
+    op = decode(
+        encode(JsonPatchOperation(op="add", path="/fields/A", value="B")))
+    assert (op.op, op.path, op.value) == ("add", "/fields/A", "B")
+
+    with pytest.raises(TypeError):
+        encode(object())
+
+
+def test_daemon_not_running(cfg, monkeypatch):
+    assert connect(cfg) is None
+    assert stop(cfg) is None
+
+    # a socket left behind by a daemon that didn't stop cleanly is ignored
+    os.makedirs(os.path.dirname(socket_path(cfg)))
+    open(socket_path(cfg), "w").close()
+    assert connect(cfg) is None
+
+
+def test_daemon_calls(cfg, daemon, capsys):
+    client = connect(cfg)
+    work_items = client.get_work_items([100000, 100001])
+    assert [item.id_number for item in work_items] == [100000, 100001]
+    assert client.match_column("in dev", "DevOps") == "In Dev"
+    assert client.get_column_field_names([1], "DevOps") == {
+        1: "_Kanban.Column"
+    }
+    results = list(client.assign_work_items([1, 2], "test@test.com"))
+    assert [result.succeeded for result in results] == [True, True]
+    assert client.call("status")["requests"] == 4
+
+    # work items are sent the same way as the SDK's
+    work_item = next(client.get_changed_work_items())
+    assert work_item.id == 100000
+    assert WorkItemContainer(work_item).board_column == "In Development"
+
+
+def test_daemon_output(cfg, daemon, mock_api, monkeypatch, capsys, caplog):
+    def get_boards(refresh=False):
+        print("printed")
+        logging.error("logged")
+        yield "DevOps"
+        raise_error({"type": "AzureDevOpsServiceError", "message": "failed"})
+
+    monkeypatch.setattr(mock_api, "get_boards", get_boards)
+    boards = connect(cfg).get_boards()
+    assert next(boards) == "DevOps"
+    with pytest.raises(AzureDevOpsServiceError, match="failed"):
+        next(boards)
+    assert capsys.readouterr().out == "printed\n"
+    assert "logged" in caplog.text
+
+
+def test_daemon_output_from_batches(cfg, daemon, mock_api, monkeypatch,
+                                    caplog):
+    def get_work_items_batch(request):
+        return [None for number in request.ids]
+
+    monkeypatch.setattr(mock_api.work_item_client, "get_work_items_batch",
+                        get_work_items_batch)
+    assert list(connect(cfg).get_work_items([424242])) == []
+    # batches are fetched in worker threads, and what they log is still sent
+    # to the client, which logs it in its own thread
+    assert any(
+        record.getMessage() == "Work item #424242 could not be found"
+        and record.threadName == threading.current_thread().name
+        for record in caplog.records)
+
+
+def test_daemon_value_error(cfg, daemon):
+    # unknown fields and columns are raised as they are without the daemon,
+    # so commands can tell the user about them
+    with pytest.raises(ValueError, match="Bogus"):
+        connect(cfg).resolve_fields(["Bogus"])
+
+
+def test_daemon_config_changed(cfg, daemon, caplog):
+    changed = PBIConfig("new_token", "organisation", "project",
+                        "email@test.com")
+    assert connect(changed) is None
+    assert "daemon restart" in caplog.text
+
+    # it can still be stopped, so it can be restarted with the new config
+    assert stop(changed)["pid"] == os.getpid()
+
+
+def test_daemon_disabled(cfg, daemon, monkeypatch):
+    monkeypatch.setenv(NO_DAEMON_ENV_VAR, "1")
+    assert connect(cfg) is None
+
+
+def test_daemon_unknown_method(cfg, daemon):
+    with pytest.raises(DaemonError, match="Unknown method '_connect'"):
+        connect(cfg).call("_connect")
+
+
+def test_daemon_idle_timeout(cfg, mock_api, monkeypatch):
+    monkeypatch.setattr(victoria_pbi.daemon, "POLL_INTERVAL", 0.01)
+    daemon = Daemon(cfg, idle_timeout=0.1, api=mock_api)
+    thread = threading.Thread(target=daemon.serve, daemon=True)
+    thread.start()
+    thread.join(5)
+    assert not thread.is_alive()
+    assert not os.path.exists(socket_path(cfg))
@@ -0,0 +1,94 @@
+from azure.devops._models import ApiResourceLocation
+from azure.devops.client import Client
+from azure.devops.connection import Connection
+from azure.devops.released.work_item_tracking import WorkItemTrackingClient
+from azure.devops.v5_0.location.models import ResourceAreaInfo
+import pytest
+
+from victoria_pbi.cache import DiskCache
+from victoria_pbi.discovery import DiscoveryCache
+
+URL = "https://dev.azure.com/org/"
+
+WIT_AREA = ResourceAreaInfo(id=WorkItemTrackingClient.resource_area_identifier,
+                            location_url=URL,
+                            name="wit")
+
+LOCATION = ApiResourceLocation(id="908509b6-4248-4475-a1cd-829139ba419f",
+                               area="wit",
+                               resource_name="workitemsbatch",
+                               route_template="{project}/_apis/{area}/"
+                               "{resource}",
+                               resource_version=1,
+                               min_version=1.0,
+                               max_version=5.1,
+                               released_version="5.1")
+
+
+@pytest.fixture(autouse=True)
+def locations_cache(monkeypatch):
+    # the SDK keeps discovered locations on the Client class
+    monkeypatch.setattr(Client, "_locations_cache", {})
+
+
+class DiscoveringClient(Client):
+    """A client that discovers its locations without going to the network."""
+    calls = 0
+
+    def _get_resource_locations(self, all_host_types):
+        DiscoveringClient.calls += 1
+        return [LOCATION]
+
+
+def test_discovery_round_trip(cache_dir):
+    connection = Connection(base_url=URL)
+    connection._resource_areas = [WIT_AREA]
+
+    discovery = DiscoveryCache("Org", DiskCache("discovery", 60))
+    assert not discovery.prime(connection)
+
+    DiscoveringClient.calls = 0
+    discovery.ensure(connection, DiscoveringClient(URL))
+    discovery.ensure(connection, DiscoveringClient(URL))
+    assert DiscoveringClient.calls == 1
+
+    # a fresh process should be able to connect without discovering anything
+    Client._locations_cache.clear()
+    connection = Connection(base_url=URL)
+    discovery = DiscoveryCache("org", DiskCache("discovery", 60))
+    assert discovery.prime(connection)
+
+    def no_network(*args, **kwargs):
+        raise AssertionError("discovery should have come from the cache")
+
+    connection._get_deployment_resource_area_from_sps = no_network
+    client = connection.clients.get_work_item_tracking_client()
+    client._get_resource_locations = no_network
+    discovery.ensure(connection, client)
+
+    location = client._get_resource_location(LOCATION.id)
+    assert location.route_template == LOCATION.route_template
+    assert location.max_version == 5.1
+
+
+def test_discovery_cold(cache_dir):
+    connection = Connection(base_url=URL)
+    connection._resource_areas = [WIT_AREA]
+    discovery = DiscoveryCache("org", DiskCache("discovery", 60))
+    assert not discovery.prime(connection)
+
+    DiscoveringClient.calls = 0
+    client = DiscoveringClient(URL)
+    discovery.ensure(connection, client)
+    # the client's first request uses what was just discovered
+    assert client._get_resource_location(LOCATION.id).id == LOCATION.id
+    assert DiscoveringClient.calls == 1
+
+
+def test_discovery_bad_entry(cache_dir):
+    cache = DiskCache("discovery", 60)
+    cache.set("org", {"resource_areas": "nonsense"})
+
+    connection = Connection(base_url=URL)
+    assert not DiscoveryCache("org", cache).prime(connection)
+    assert connection._resource_areas is None
@@ -0,0 +1,23 @@
+import subprocess
+import sys
+
+import victoria_pbi
+from victoria_pbi import cli
+
+
+def test_plugin():
+    assert victoria_pbi.plugin.name == "pbi"
+    assert victoria_pbi.plugin.cli == cli.pbi
+
+
+def test_plugin_import_is_lazy():
+    """Loading the plugin shouldn't import the Azure DevOps SDK, as Victoria
+    loads every plugin on startup."""
+    result = subprocess.run([
+        sys.executable, "-c", "import sys, victoria_pbi; "
+        "print([m for m in sys.modules if m.startswith('azure.devops')])"
+    ],
+                            stdout=subprocess.PIPE,
+                            universal_newlines=True,
+                            check=True)
+    assert result.stdout.strip() == "[]"
@@ -0,0 +1,139 @@
+import io
+import json
+
+from click.testing import CliRunner
+import requests
+
+import victoria_pbi.cli
+from victoria_pbi.cli import pbi
+from victoria_pbi.config import PBIConfig
+from victoria_pbi.instrumentation import Instrumentation, Timing, \
+    count_items, endpoint_name, load_hook
+
+from conftest import create_mock_api
+
+
+def test_endpoint_name():
+    assert endpoint_name(
+        "POST", "https://dev.azure.com/org/project/_apis/wit/workitemsbatch"
+        "?api-version=5.1") == "POST wit/workitemsbatch"
+    assert endpoint_name(
+        "PATCH", "https://dev.azure.com/org/_apis/wit/workItems/1234"
+    ) == "PATCH wit/workItems/{id}"
+    assert endpoint_name("OPTIONS",
+                         "https://dev.azure.com/org/_apis") == "OPTIONS _apis"
+
+
+def test_count_items():
+    assert count_items({"count": 2, "value": [{}, {}]}) == 2
+    assert count_items({"workItems": [{"id": 1}]}) == 1
+    assert count_items({"id": 1, "fields": {}}) == 1
+    assert count_items({"message": "error"}) is None
+
+
+def test_instrument_session():
+    instrumentation = Instrumentation()
+    session = requests.Session()
+    instrumentation.instrument(session)
+
+    response = requests.Response()
+    response.status_code = 200
+    response.headers["Content-Type"] = "application/json; charset=utf-8"
+    response._content = json.dumps({"value": [1, 2, 3]}).encode()
+    response.request = requests.Request(
+        "POST",
+        "https://dev.azure.com/org/_apis/wit/workitemsbatch",
+        data=b'{"ids": [1, 2, 3]}').prepare()
+    for hook in session.hooks["response"]:
+        hook(response)
+
+    timing, = instrumentation.timings
+    assert timing.kind == "request"
+    assert timing.name == "POST wit/workitemsbatch"
+    assert timing.status == 200
+    assert timing.request_bytes == 18
+    assert timing.response_bytes == len(response.content)
+    assert timing.retries == 0
+    assert timing.items == 3
+
+
+def test_hooks():
+    seen = []
+
+    def broken_hook(timing):
+        raise RuntimeError("metrics are down")
+
+    instrumentation = Instrumentation([broken_hook, seen.append])
+    with instrumentation.stage("work"):
+        pass
+    # a broken hook shouldn't stop the others or the command
+    assert [timing.name for timing in seen] == ["work"]
+    assert load_hook("json:dumps") is json.dumps
+
+
+def test_timed_iter():
+    instrumentation = Instrumentation()
+    assert list(instrumentation.timed_iter(range(3), "wait", "use")) == [
+        0, 1, 2
+    ]
+    assert [timing.name
+            for timing in instrumentation.timings] == ["wait", "use"]
+
+
+def test_summary_and_json():
+    instrumentation = Instrumentation()
+    for seconds in [0.1, 0.3]:
+        instrumentation.record(
+            Timing("request", "POST wit/wiql", seconds, status=200,
+                   request_bytes=10, response_bytes=2048, retries=1,
+                   items=5))
+    instrumentation.record(Timing("stage", "print", 0.5))
+
+    summary = instrumentation.summary().splitlines()
+    assert summary[1].split() == [
+        "POST", "wit/wiql", "2", "0.400", "200.0", "300.0", "4.0", "2", "10"
+    ]
+    assert summary[2].split() == ["[print]", "1", "0.500", "500.0", "500.0"]
+    assert summary[3].startswith("2 requests taking 0.400s")
+
+    output = io.StringIO()
+    instrumentation.write_json(output)
+    lines = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert lines[0]["name"] == "POST wit/wiql"
+    assert lines[0]["items"] == 5
+    assert "status" not in lines[2]
+
+
+def test_cli_timings(monkeypatch, tmp_path):
+    apis = []
+
+    def connect(cfg):
+        api = create_mock_api(monkeypatch)
+        api.instrumentation = victoria_pbi.cli._instrumentation()
+        apis.append(api)
+        return api
+
+    monkeypatch.setattr(victoria_pbi.cli, "_connect", connect)
+    cfg = PBIConfig("access_token", "organisation", "project",
+                    "email@test.com")
+    timings_file = tmp_path / "timings.jsonl"
+
+    runner = CliRunner(mix_stderr=False)
+    result = runner.invoke(
+        pbi, ["--timings", "--timings-json",
+              str(timings_file), "ls"],
+        obj=cfg)
+    assert result.exit_code == 0
+    assert "[fetch]" in result.stderr
+    assert "[print]" in result.stderr
+    assert apis[0].instrumentation is not None
+    stages = [
+        json.loads(line)["name"]
+        for line in timings_file.read_text().splitlines()
+    ]
+    assert stages == ["connect work_item_tracking", "fetch", "print"]
+
+    # without any timings options nothing should be recorded
+    result = runner.invoke(pbi, ["ls"], obj=cfg)
+    assert result.exit_code == 0
+    assert apis[1].instrumentation is None
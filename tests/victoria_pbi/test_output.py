@@ -0,0 +1,195 @@
+import csv
+import io
+import json
+
+import colorama
+import pytest
+
+from victoria_pbi.output import StreamingTable, format_field, \
+    print_work_item_table, print_work_item_tree, visible_len, \
+    work_item_row, write_work_items
+from victoria_pbi.workitem import FieldInfo, WorkItemContainer
+
+from conftest import create_work_item_container, generate_work_item
+
+
+def test_visible_len():
+    assert visible_len(f"{colorama.Fore.GREEN}● "
+                       f"{colorama.Style.RESET_ALL}Done") == 6
+
+
+def test_streaming_table():
+    output = io.StringIO()
+    table = StreamingTable(["A", "Bee", "C"], lookahead=2, file=output)
+    table.print_rows([["1", "2", "3"], ["1234", "2", "3"], ["123456", "2",
+                                                            "3"]])
+    assert output.getvalue().splitlines() == [
+        "A     Bee  C",
+        "1     2    3",
+        "1234  2    3",
+        # rows after the lookahead that don't fit push the row along
+        "123456  2    3",
+    ]
+
+
+def test_streaming_table_fixed_widths():
+    output = io.StringIO()
+    table = StreamingTable(["A", "B"], widths=[3, 1], file=output)
+    table.print_rows([["1", "2"]])
+    assert output.getvalue().splitlines() == ["A    B", "1    2"]
+
+
+def test_streaming_table_colours():
+    output = io.StringIO()
+    table = StreamingTable(["State", "X"], file=output)
+    coloured = f"{colorama.Fore.GREEN}Done{colorama.Style.RESET_ALL}"
+    table.print_rows([[coloured, "x"], ["Approved", "x"]])
+    lines = output.getvalue().splitlines()
+    assert lines[1] == coloured + "      x"
+    assert lines[2] == "Approved  x"
+
+
+def test_streaming_table_streams():
+    output = io.StringIO()
+    printed = []
+
+    def rows():
+        for i in range(5):
+            # everything after the lookahead should be printed as it comes
+            printed.append(len(output.getvalue().splitlines()))
+            yield [str(i), "x"]
+
+    StreamingTable(["N", "X"], lookahead=2, file=output).print_rows(rows())
+    assert printed == [0, 0, 3, 4, 5]
+
+
+def test_print_work_item_table_empty():
+    output = io.StringIO()
+    print_work_item_table([], file=output)
+    assert output.getvalue() == "ID  Type  Title  State  Assignee\n"
+
+
+def test_work_item_row():
+    work_item = create_work_item_container(
+        generate_work_item(100000, assigned=False))
+    row = work_item_row(work_item)
+    assert row[0] == "#100000"
+    assert row[1] == "PBI"
+    assert row[2] == "This is a work item"
+    assert row[3] == f"{colorama.Fore.YELLOW}● " \
+        f"{colorama.Style.RESET_ALL}In Development"
+    assert row[4] == "Unassigned"
+
+
+def test_format_field():
+    assert format_field(None, FieldInfo("A", "A", "string")) == ""
+    assert format_field(5.0, FieldInfo("A", "A", "double")) == "5"
+    assert format_field(2.5, FieldInfo("A", "A", "double")) == "2.5"
+    assert format_field("2020-01-02T03:04:05.67Z",
+                        FieldInfo("A", "A", "dateTime")) == "2020-01-02 03:04"
+    assert format_field({"uniqueName": "test@test.com"},
+                        FieldInfo("A", "A", "string")) == "test@test.com"
+    assert format_field("<div>A &amp;<br>B</div>",
+                        FieldInfo("A", "A", "html")) == "A & B"
+    assert format_field("a" * 100, FieldInfo("A", "A", "string")) == \
+        "a" * 59 + "…"
+
+
+def test_print_work_item_table_fields():
+    work_item = WorkItemContainer(generate_work_item(100000),
+                                  fields=["Microsoft.VSTS.Scheduling.Effort"])
+    fields = [
+        FieldInfo("Microsoft.VSTS.Scheduling.Effort", "Effort", "double"),
+        FieldInfo("System.Tags", "Tags", "plainText")
+    ]
+    output = io.StringIO()
+    print_work_item_table([work_item], file=output, fields=fields)
+    header, row = output.getvalue().splitlines()
+    assert header.split() == [
+        "ID", "Type", "Title", "State", "Assignee", "Effort", "Tags"
+    ]
+    # fields the work item didn't have are left empty
+    assert work_item_row(work_item, fields)[5:] == ["5", ""]
+
+
+def test_print_work_item_tree():
+    work_items = [(0, create_work_item_container(generate_work_item(1))),
+                  (1, create_work_item_container(generate_work_item(2))),
+                  (2, create_work_item_container(generate_work_item(3)))]
+    output = io.StringIO()
+    print_work_item_tree(work_items, file=output)
+    rows = output.getvalue().splitlines()[1:]
+    assert [row[:6] for row in rows] == ["#1    ", "  #2  ", "    #3"]
+
+
+def test_write_work_items_jsonl():
+    work_items = [
+        WorkItemContainer(generate_work_item(number),
+                          fields=["System.IterationPath"])
+        for number in (100000, 100001)
+    ]
+    output = io.StringIO()
+    write_work_items(iter(work_items), "jsonl", file=output)
+    lines = output.getvalue().splitlines()
+    assert [json.loads(line) for line in lines] == [
+        work_item.to_dict() for work_item in work_items
+    ]
+    assert json.loads(lines[0])["fields"] == {
+        "System.IterationPath": "Project\\Sprint 1"
+    }
+    # nothing is coloured
+    assert "\x1b" not in output.getvalue()
+
+
+def test_write_work_items_csv():
+    work_item = WorkItemContainer(generate_work_item(100000),
+                                  fields=["System.AssignedTo", "System.Tags"])
+    work_item.title = 'A "quoted", title'
+    fields = [
+        FieldInfo("System.AssignedTo", "Assigned To", "identity"),
+        FieldInfo("System.Tags", "Tags", "plainText")
+    ]
+    output = io.StringIO()
+    write_work_items([work_item], "csv", file=output, fields=fields)
+    output.seek(0)
+    assert list(csv.reader(output)) == [
+        [
+            "id", "type", "title", "state", "column", "assigned_to",
+            "System.AssignedTo", "System.Tags"
+        ],
+        [
+            "100000", "Product Backlog Item", 'A "quoted", title',
+            "In Development", "In Development", "email@test.com",
+            "email@test.com", ""
+        ],
+    ]
+
+
+def test_write_work_items_sources():
+    work_item = WorkItemContainer(generate_work_item(100000))
+    work_item.source = "org/Project"
+    output = io.StringIO()
+    write_work_items([work_item], "csv", file=output, sources=True)
+    header, row = output.getvalue().splitlines()
+    assert header.split(",")[5:] == ["assigned_to", "source"]
+    assert row.endswith(",email@test.com,org/Project")
+
+    assert work_item_row(work_item, sources=True)[5] == "org/Project"
+    output = io.StringIO()
+    write_work_items([work_item], "table", file=output, sources=True)
+    assert output.getvalue().split()[5] == "Source"
+
+
+def test_write_work_items_tsv():
+    work_item = WorkItemContainer(generate_work_item(100000))
+    work_item.title = "A\ttitle\non two lines"
+    output = io.StringIO()
+    write_work_items([work_item], "tsv", file=output)
+    header, row = output.getvalue().splitlines()
+    assert header.split("\t")[:3] == ["id", "type", "title"]
+    assert row.split("\t")[:3] == [
+        "100000", "Product Backlog Item", "A title on two lines"
+    ]
+
+    with pytest.raises(ValueError, match="Output format 'xml' did not exist"):
+        write_work_items([work_item], "xml", file=output)
@@ -1,10 +1,18 @@
 from collections import namedtuple
+import json
+import re
+import time
 
+from azure.devops._models import WrappedException
 import pytest
 
 import victoria_pbi.pbi
+from victoria_pbi.config import PBIConfig
+from victoria_pbi.pbi import AzureDevOpsClientRequestError, \
+    AzureDevOpsServiceError
 
-from conftest import WorkItem, create_work_item_container, \
+from conftest import BoardColumn, MockConfig, MockCoreClient, \
+    MockWorkClient, WorkItem, create_mock_api, create_work_item_container, \
     generate_work_item, WorkItemQueryResult
 
 
@@ -14,6 +22,16 @@ def test_api_connection(mock_api):
     assert mock_api.work_item_client is not None
     assert mock_api.work_client is not None
     assert mock_api.core_client is not None
+    assert mock_api.batch_client is not None
+
+
+def test_organisation_url():
+    cfg = PBIConfig("token", "org", "project", "email@test.com")
+    assert victoria_pbi.pbi.organisation_url(cfg) == \
+        "https://dev.azure.com/org/"
+    cfg.url = "http://localhost:8080/tfs/org"
+    assert victoria_pbi.pbi.organisation_url(cfg) == \
+        "http://localhost:8080/tfs/org/"
 
 
 def test_find_column_field_name(mock_api):
@@ -42,6 +60,28 @@ def test_get_unassigned_work_item(mock_api, monkeypatch):
     assert result == expected
 
 
+def test_work_item_container_compact():
+    first = victoria_pbi.pbi.WorkItemContainer(
+        WorkItem(json.loads(json.dumps(generate_work_item(1).fields)), 1))
+    second = victoria_pbi.pbi.WorkItemContainer(
+        WorkItem(json.loads(json.dumps(generate_work_item(2).fields)), 2))
+    assert not hasattr(first, "__dict__")
+    assert first.work_item is None
+
+    # strings shared between work items should only be stored once
+    assert first.state is second.state
+    assert first.board_column is second.board_column
+    assert first.work_type is second.work_type
+    assert first.assigned_to is second.assigned_to
+
+
+def test_work_item_container_keep_work_item():
+    work_item = generate_work_item(1)
+    container = victoria_pbi.pbi.WorkItemContainer(work_item,
+                                                   keep_work_item=True)
+    assert container.work_item is work_item
+
+
 def test_get_bad_type_work_item(mock_api, monkeypatch):
     # patch the client to return a work item with a bad type
     def get_bad_type_work_item(*args, **kwargs):
@@ -55,7 +95,7 @@ def test_get_bad_type_work_item(mock_api, monkeypatch):
 
 
 def test_get_work_items(mock_api):
-    result = list(mock_api.get_work_items([1, 2, 3, 4]))
+    result = list(mock_api.get_work_items(range(100000, 100005)))
     expected = list([
         create_work_item_container(generate_work_item(number))
         for number in range(100000, 100005)
@@ -65,6 +105,41 @@ def test_get_work_items(mock_api):
         assert result[i] == expected[i]
 
 
+def test_get_work_items_fields(mock_api, monkeypatch):
+    requests = []
+    get_work_items_batch = mock_api.work_item_client.get_work_items_batch
+
+    def record(request):
+        requests.append(request)
+        return get_work_items_batch(request)
+
+    monkeypatch.setattr(mock_api.work_item_client, "get_work_items_batch",
+                        record)
+    result = list(
+        mock_api.get_work_items([1], ["Microsoft.VSTS.Scheduling.Effort"]))
+
+    # only the fields asked for are sent back
+    assert requests[0].fields == victoria_pbi.pbi.WORK_ITEM_FIELDS + [
+        "Microsoft.VSTS.Scheduling.Effort"
+    ]
+    assert result[0].fields == {"Microsoft.VSTS.Scheduling.Effort": 5.0}
+    assert result[0].to_dict()["fields"] == result[0].fields
+
+
+def test_resolve_fields(mock_api):
+    fields = mock_api.resolve_fields(
+        ["effort", "System.IterationPath", " Effort ", "Title"])
+    # duplicates and the fields that are always got are left out
+    assert [field.reference_name for field in fields] == [
+        "Microsoft.VSTS.Scheduling.Effort", "System.IterationPath"
+    ]
+    assert fields[0].name == "Effort"
+    assert fields[0].type == "double"
+
+    with pytest.raises(ValueError, match="Field 'Points' did not exist"):
+        mock_api.resolve_fields(["Points"])
+
+
 def test_get_no_work_items(mock_api):
     result = list(mock_api.get_work_items([]))
     assert len(result) == 0
@@ -82,6 +157,122 @@ def test_get_bad_type_work_items(mock_api, monkeypatch):
     assert len(result) == 0
 
 
+def test_get_work_items_chunked(mock_api, monkeypatch):
+    requested = []
+
+    def get_work_items_batch(request):
+        requested.append(request.ids)
+        return [generate_work_item(number) for number in request.ids]
+
+    monkeypatch.setattr(mock_api.work_item_client, "get_work_items_batch",
+                        get_work_items_batch)
+
+    numbers = list(range(1000, 1450))
+    result = list(mock_api.get_work_items(numbers))
+    assert [work_item.id_number for work_item in result] == numbers
+    assert [len(ids) for ids in requested] == [200, 200, 50]
+
+
+def test_get_work_items_duplicates(mock_api, monkeypatch):
+    requested = []
+
+    def get_work_items_batch(request):
+        requested.extend(request.ids)
+        # return them out of order to make sure the input order is kept
+        return [generate_work_item(number) for number in reversed(request.ids)]
+
+    monkeypatch.setattr(mock_api.work_item_client, "get_work_items_batch",
+                        get_work_items_batch)
+
+    result = list(mock_api.get_work_items([3, 1, 3, 2, 1]))
+    assert [work_item.id_number for work_item in result] == [3, 1, 2]
+    assert requested == [3, 1, 2]
+
+
+def test_get_missing_work_items(mock_api, monkeypatch):
+    # work items that don't exist come back as None
+    def get_work_items_batch(request):
+        return [
+            generate_work_item(number) if number != 2 else None
+            for number in request.ids
+        ]
+
+    monkeypatch.setattr(mock_api.work_item_client, "get_work_items_batch",
+                        get_work_items_batch)
+
+    result = list(mock_api.get_work_items([1, 2, 3]))
+    assert [work_item.id_number for work_item in result] == [1, 3]
+
+
+def test_tree_levels():
+    links = [(None, 1), (1, 2), (1, 3), (2, 4), (3, 5), (None, 6), (6, 2)]
+    assert victoria_pbi.pbi.tree_levels([1, 6], links) == [[1, 6], [2, 3],
+                                                            [4, 5]]
+    assert victoria_pbi.pbi.tree_levels([1, 6], links, depth=1) == [[1, 6],
+                                                                    [2, 3]]
+    assert victoria_pbi.pbi.tree_levels([1], [], depth=0) == [[1]]
+
+
+def test_get_work_item_tree(mock_api, monkeypatch):
+    queries = []
+    requested = []
+    query_by_wiql = mock_api.work_item_client.query_by_wiql
+
+    def record_query(wiql, *args, **kwargs):
+        queries.append(wiql.query)
+        return query_by_wiql(wiql, *args, **kwargs)
+
+    def get_work_items_batch(request):
+        requested.append(request.ids)
+        return [
+            generate_work_item(number) if number != 100003 else None
+            for number in request.ids
+        ]
+
+    monkeypatch.setattr(mock_api.work_item_client, "query_by_wiql",
+                        record_query)
+    monkeypatch.setattr(mock_api.work_item_client, "get_work_items_batch",
+                        get_work_items_batch)
+
+    tree = [(level, work_item.id_number)
+            for level, work_item in mock_api.get_work_item_tree([100000])]
+    # the missing work item is left out, but the ones under it aren't
+    assert tree == [(0, 100000), (1, 100001), (3, 100004), (1, 100002)]
+    # one query for the links, and one request per level
+    assert len(queries) == 1
+    assert sorted(requested) == [[100000], [100001, 100002], [100003],
+                                 [100004]]
+
+    queries.clear()
+    requested.clear()
+    tree = list(mock_api.get_work_item_tree([100001], depth=1))
+    assert [(level, work_item.id_number)
+            for level, work_item in tree] == [(0, 100001)]
+    assert requested == [[100001], [100003]]
+
+    tree = list(mock_api.get_work_item_tree([100000], depth=0))
+    assert [(level, work_item.id_number)
+            for level, work_item in tree] == [(0, 100000)]
+    assert len(queries) == 1
+
+
+def test_get_work_item_tree_tasks(mock_api, monkeypatch):
+    def get_work_items_batch(request):
+        work_items = [generate_work_item(number) for number in request.ids]
+        for work_item in work_items:
+            work_item.fields["System.WorkItemType"] = "Task"
+            del work_item.fields["System.BoardColumn"]
+        return work_items
+
+    monkeypatch.setattr(mock_api.work_item_client, "get_work_items_batch",
+                        get_work_items_batch)
+
+    # tasks aren't on a board, so their state is used instead
+    (level, work_item), = mock_api.get_work_item_tree([100004])
+    assert work_item.work_type == "Task"
+    assert work_item.board_column == work_item.state
+
+
 def test_get_user_pbis(mock_api):
     result = list(mock_api.get_user_pbis("email@test.com"))
     expected = list([
@@ -93,7 +284,19 @@ def test_get_user_pbis(mock_api):
         assert result[i] == expected[i]
 
 
-def test_get_user_pbis_none(mock_api, monkeypatch, capsys):
+def test_user_pbis_query_many_users():
+    query = victoria_pbi.pbi.user_pbis_query(["a@test.com", "o'b@test.com"])
+    assert "[System.AssignedTo] IN ('a@test.com', 'o''b@test.com')" in query
+
+    query = victoria_pbi.pbi.user_pbis_query(["a@test.com"])
+    assert "[System.AssignedTo]='a@test.com'" in query
+    assert "TeamProject" not in query
+
+    query = victoria_pbi.pbi.user_pbis_query("a@test.com", 0, "O'Project")
+    assert "AND [System.TeamProject]='O''Project'" in query
+
+
+def test_get_user_pbis_none(mock_api, monkeypatch, capsys, caplog):
     # patch the client to return no work items
     def get_no_work_items(*args, **kwargs):
         return WorkItemQueryResult([])
@@ -104,9 +307,91 @@ def test_get_user_pbis_none(mock_api, monkeypatch, capsys):
     result = list(mock_api.get_user_pbis("email@test.com"))
     assert len(result) == 0
 
-    captured = capsys.readouterr()
-    assert captured.out == "Could not find any work items for user " \
-        "'email@test.com'. Did the user exist?\n"
+    # it's logged, so it doesn't end up in output meant for other programs
+    assert capsys.readouterr().out == ""
+    assert "Could not find any work items for user 'email@test.com'. " \
+        "Did the user exist?" in caplog.text
+
+
+def test_paged_query_ids():
+    pages = []
+
+    def query_page(after, size):
+        pages.append((after, size))
+        return [number for number in range(1, 2501) if number > after][:size]
+
+    numbers = victoria_pbi.pbi.paged_query_ids(query_page, page_size=1000)
+    assert next(numbers) == 1
+    # the next page shouldn't be queried until it's needed
+    assert pages == [(0, 1000)]
+    assert list(numbers) == list(range(2, 2501))
+    assert pages == [(0, 1000), (1000, 1000), (2000, 1000)]
+
+    pages.clear()
+    numbers = list(
+        victoria_pbi.pbi.paged_query_ids(query_page, top=1500, page_size=1000))
+    assert numbers == list(range(1, 1501))
+    assert pages == [(0, 1000), (1000, 500)]
+
+
+def test_paged_query_ids_stuck():
+    # a page that doesn't move past the last ID shouldn't loop forever
+    numbers = victoria_pbi.pbi.paged_query_ids(lambda after, size: [1, 2],
+                                               page_size=2)
+    assert list(numbers) == [1, 2]
+
+
+def test_get_user_pbis_paged(mock_api, monkeypatch):
+    queries = []
+
+    def query_by_wiql(wiql, time_precision=None, top=None):
+        queries.append(wiql.query)
+        after = int(re.search(r"\[System.Id\]>(\d+)", wiql.query).group(1))
+        return WorkItemQueryResult([
+            generate_work_item(number)
+            for number in range(after + 1, min(after + top, 25000) + 1)
+        ])
+
+    monkeypatch.setattr(mock_api.work_item_client, "query_by_wiql",
+                        query_by_wiql)
+
+    result = mock_api.get_user_pbis("email@test.com")
+    assert sum(1 for _ in result) == 25000
+    # 25 full pages, then an empty one to find the end
+    assert len(queries) == 26
+
+    result = list(mock_api.get_user_pbis("email@test.com", top=10))
+    assert [work_item.id_number for work_item in result] == list(range(1, 11))
+
+
+def test_get_changed_work_items(mock_api, monkeypatch):
+    queries = []
+    requests = []
+
+    def query_by_wiql(wiql, time_precision=None, top=None):
+        queries.append((wiql.query, time_precision))
+        return WorkItemQueryResult([generate_work_item(1)])
+
+    def get_work_items_batch(request):
+        requests.append(request)
+        return [generate_work_item(1), None]
+
+    monkeypatch.setattr(mock_api.work_item_client, "query_by_wiql",
+                        query_by_wiql)
+    monkeypatch.setattr(mock_api.work_item_client, "get_work_items_batch",
+                        get_work_items_batch)
+
+    result = list(mock_api.get_changed_work_items("2020-01-01T00:00:00Z"))
+    assert [work_item.id for work_item in result] == [1]
+    query, time_precision = queries[0]
+    assert "[System.TeamProject]='mocked_project'" in query
+    assert "[System.ChangedDate]>='2020-01-01T00:00:00Z'" in query
+    assert time_precision
+    assert "System.ChangedDate" in requests[0].fields
+
+    query = victoria_pbi.pbi.changed_work_items_query("O'Brien")
+    assert "[System.TeamProject]='O''Brien'" in query
+    assert "ChangedDate" not in query
 
 
 def test_get_boards(mock_api):
@@ -119,13 +404,350 @@ def test_get_board_states(mock_api):
     assert result == ["New", "Approved", "In Dev", "Done"]
 
 
+def test_board_metadata_cached(monkeypatch):
+    calls = []
+    get_teams = MockCoreClient.get_teams
+    get_board_columns = MockWorkClient.get_board_columns
+    monkeypatch.setattr(
+        MockCoreClient, "get_teams",
+        lambda self, project: calls.append("teams") or get_teams(
+            self, project))
+    monkeypatch.setattr(
+        MockWorkClient, "get_board_columns", lambda self, team_ctx, board:
+        calls.append(team_ctx.team) or get_board_columns(
+            self, team_ctx, board))
+
+    # the cache should be shared between runs
+    for _ in range(2):
+        api = create_mock_api(monkeypatch)
+        assert list(api.get_boards()) == ["DevOps", "QA", "Product"]
+        assert list(api.get_board_states("DevOps")) == [
+            "New", "Approved", "In Dev", "Done"
+        ]
+    assert calls == ["teams", "DevOps"]
+
+    assert list(api.get_board_states("DevOps", refresh=True)) == [
+        "New", "Approved", "In Dev", "Done"
+    ]
+    assert calls == ["teams", "DevOps", "DevOps"]
+
+
+def test_board_condition():
+    assert victoria_pbi.pbi.board_condition(
+        "System.AreaPath", [["Project\\Team's", True], ["Project", False]]
+    ) == ("([System.AreaPath] UNDER 'Project\\Team''s' OR "
+          "[System.AreaPath] = 'Project')")
+    assert victoria_pbi.pbi.board_condition("System.AreaPath", []) == "(1=0)"
+
+
+def test_get_board_stats(mock_api, monkeypatch):
+    queries = []
+    counts = {
+        "[System.BoardColumn]='In Dev'": 3,
+        "[System.BoardColumn]='Done'": 1,
+        "[System.State]='In Development'": 3,
+        "[System.State]='Done'": 1,
+        "[System.AssignedTo]='email@test.com'": 2,
+        "[System.AssignedTo]=''": 1,
+    }
+
+    def query_by_wiql(wiql, time_precision=None, top=None):
+        queries.append((wiql.query, top))
+        count = sum(number for condition, number in counts.items()
+                    if condition in wiql.query)
+        after = int(re.search(r"\[System.Id\]>(\d+)", wiql.query).group(1))
+        # only the IDs are used
+        return WorkItemQueryResult(
+            [generate_work_item(number) for number in range(1, count + 1)
+             if number > after][:top])
+
+    monkeypatch.setattr(mock_api.work_item_client, "query_by_wiql",
+                        query_by_wiql)
+
+    stats = mock_api.get_board_stats("DevOps")
+    assert stats == {
+        "column": {
+            "New": 0,
+            "Approved": 0,
+            "In Dev": 3,
+            "Done": 1
+        },
+        "state": {
+            "New": 0,
+            "In Development": 3,
+            "Done": 1
+        },
+        "assignee": {
+            "email@test.com": 2,
+            "Unassigned": 1
+        }
+    }
+
+    # a query for each column, state other than Removed, member and no-one
+    assert len(queries) == 4 + 3 + 2 + 1
+    assert all("[System.AreaPath] UNDER 'Project\\DevOps'" in query
+               for query, _ in queries)
+    assert all(top == victoria_pbi.pbi.WIQL_COUNT_PAGE_SIZE
+               for _, top in queries)
+    # removed work items aren't counted in columns, like they aren't in states
+    assert all("[System.State]<>'Removed'" in query
+               for query, _ in queries[:4])
+    assert "Removed" not in "".join(query for query, _ in queries[4:7])
+
+    # open work items assigned to people outside the team
+    counts["[System.State]='New'"] = 2
+    assert mock_api.get_board_stats("DevOps")["assignee"]["Others"] == 2
+
+
+def test_board_metadata_expires_in_memory(monkeypatch):
+    calls = []
+    get_board_columns = MockWorkClient.get_board_columns
+    monkeypatch.setattr(
+        MockWorkClient, "get_board_columns", lambda self, team_ctx, board:
+        calls.append(team_ctx.team) or get_board_columns(
+            self, team_ctx, board))
+
+    # a long running process, such as the daemon, picks up changed boards
+    api = create_mock_api(monkeypatch)
+    list(api.get_board_states("DevOps"))
+    now = time.time()
+    monkeypatch.setattr(time, "time",
+                        lambda: now + MockConfig.cache.metadata_ttl + 1)
+    list(api.get_board_states("DevOps"))
+    assert calls == ["DevOps", "DevOps"]
+
+
+def test_match_column(mock_api, monkeypatch):
+    assert mock_api.match_column("in dev", "DevOps") == "In Dev"
+    assert mock_api.match_column("In Devv", "DevOps") is None
+    assert mock_api.match_column("done") == "Done"
+
+    def get_board_columns(team_ctx, board):
+        if team_ctx.team == "QA":
+            return [BoardColumn("Testing")]
+        raise AzureDevOpsServiceError(WrappedException(message="No board"))
+
+    monkeypatch.setattr(mock_api.work_client, "get_board_columns",
+                        get_board_columns)
+    # boards without a backlog should be skipped
+    assert mock_api.match_column("testing", refresh=True) == "Testing"
+    assert mock_api.match_column("Done", refresh=True) is None
+
+
+def test_match_column_unknown(mock_api, monkeypatch):
+    def get_board_columns(team_ctx, board):
+        raise AzureDevOpsServiceError(WrappedException(message="No board"))
+
+    monkeypatch.setattr(mock_api.work_client, "get_board_columns",
+                        get_board_columns)
+    # if no columns could be found leave it to the service to decide
+    assert mock_api.match_column("In Devv") == "In Devv"
+
+
 def test_move_work_item(mock_api):
     result = mock_api.move_work_item(100000, "In Dev")
     expected = generate_work_item(100000, kanban_column="In Dev")
     assert result.work_item == expected
 
 
+def test_move_work_items(mock_api, monkeypatch):
+    requested = []
+
+    def get_work_items_batch(request):
+        requested.append(request)
+        return [generate_work_item(number) for number in request.ids]
+
+    monkeypatch.setattr(mock_api.work_item_client, "get_work_items_batch",
+                        get_work_items_batch)
+
+    result = list(
+        mock_api.move_work_items([1, 2, 3], "In Dev", keep_work_items=True))
+    assert [r.work_item.work_item.fields for r in result] == [
+        generate_work_item(number, kanban_column="In Dev").fields
+        for number in [1, 2, 3]
+    ]
+
+    # the column field names should be found with a single request
+    assert len(requested) == 1
+    assert requested[0].fields is None
+
+
+def test_move_work_items_board(mock_api, monkeypatch):
+    boards = []
+
+    def get_board(team_ctx, board):
+        boards.append(team_ctx.team)
+        return mock_api.work_client.__class__().get_board(team_ctx, board)
+
+    requested = []
+
+    def get_work_items_batch(request):
+        requested.append(request)
+        return [generate_work_item(number) for number in request.ids]
+
+    monkeypatch.setattr(mock_api.work_client, "get_board", get_board)
+    monkeypatch.setattr(mock_api.work_item_client, "get_work_items_batch",
+                        get_work_items_batch)
+
+    for _ in range(2):
+        result = list(
+            mock_api.move_work_items([1, 2], "In Dev", "DevOps",
+                                     keep_work_items=True))
+        assert [r.work_item.work_item.fields for r in result] == [
+            generate_work_item(number, kanban_column="In Dev").fields
+            for number in [1, 2]
+        ]
+
+    # the column field name should be cached per board
+    assert boards == ["DevOps"]
+    # so only the fields that are needed are read
+    assert requested[0].fields == victoria_pbi.pbi.WORK_ITEM_FIELDS + [
+        "_Kanban.Column", "System.Rev"
+    ]
+
+
+def test_move_missing_work_item(mock_api, monkeypatch):
+    def get_work_items_batch(request):
+        return [None for _ in request.ids]
+
+    monkeypatch.setattr(mock_api.work_item_client, "get_work_items_batch",
+                        get_work_items_batch)
+
+    assert mock_api.move_work_item(100000, "In Dev") is None
+
+
 def test_assign_work_item(mock_api):
     result = mock_api.assign_work_item(100000, "test123@email.com")
     expected = generate_work_item(100000, assigned_to="test123@email.com")
-    assert result.work_item == expected
\ No newline at end of file
+    assert result.work_item == expected
+
+
+def test_assign_work_items(mock_api, monkeypatch):
+    requested = []
+
+    def update_work_items_batch(documents):
+        requested.append(list(documents))
+        return mock_api.batch_client.__class__().update_work_items_batch(
+            documents)
+
+    monkeypatch.setattr(mock_api.batch_client, "update_work_items_batch",
+                        update_work_items_batch)
+
+    numbers = list(range(1000, 1250))
+    result = list(mock_api.assign_work_items(numbers, "test123@email.com"))
+    assert [r.id_number for r in result] == numbers
+    assert all(r.succeeded for r in result)
+    assert all(r.work_item.assigned_to == "test123@email.com" for r in result)
+    assert all(r.work_item.work_item is None for r in result)
+    assert [len(batch) for batch in requested] == [200, 50]
+
+
+def test_plan_assign(mock_api, monkeypatch):
+    requested = []
+
+    def get_work_items_batch(request):
+        requested.append(request)
+        return [
+            generate_work_item(number,
+                               assigned=number != 3,
+                               assigned_to=f"user{number}@test.com")
+            for number in request.ids
+        ]
+
+    monkeypatch.setattr(mock_api.work_item_client, "get_work_items_batch",
+                        get_work_items_batch)
+
+    changes = mock_api.plan_assign([1, 2, 3, 2], "User1@test.com")
+    # their current state is read in one request
+    assert len(requested) == 1
+    assert requested[0].fields == victoria_pbi.pbi.WORK_ITEM_FIELDS + [
+        "System.Rev"
+    ]
+    assert [(change.id_number, change.old, change.rev)
+            for change in changes] == [(1, "user1@test.com", 1),
+                                       (2, "user2@test.com", 1), (3, None, 1)]
+    # emails that only differ by case are the same
+    assert [change.changed for change in changes] == [False, True, True]
+
+    # the IDs can be a generator, which can only be gone through once
+    changes = mock_api.plan_assign((number for number in [1, 2]),
+                                   "User1@test.com")
+    assert [change.id_number for change in changes] == [1, 2]
+    changes = mock_api.plan_move((number for number in [1, 2]), "In Dev")
+    assert [change.id_number for change in changes] == [1, 2]
+
+
+def test_apply_changes(mock_api, monkeypatch):
+    documents = []
+
+    def update_work_items_batch(batch):
+        documents.append(batch)
+        return mock_api.batch_client.__class__().update_work_items_batch(
+            batch)
+
+    monkeypatch.setattr(mock_api.batch_client, "update_work_items_batch",
+                        update_work_items_batch)
+
+    changes = mock_api.plan_move([1, 2, 3], "In Dev")
+    changes[0].new = "New"
+    # somebody else changed it since it was read
+    changes[2].rev = 0
+    result = list(mock_api.apply_changes(changes))
+
+    assert [(r.id_number, r.succeeded, r.changed) for r in result] == [
+        (1, True, False), (2, True, True), (3, False, True)
+    ]
+    assert result[0].work_item.id_number == 1
+    assert result[2].error.startswith("TF26071")
+    assert list(documents[0]) == [2, 3]
+    assert [(op.op, op.path, op.value) for op in documents[0][2]] == [
+        ("test", "/rev", 1), ("add", "/fields/_Kanban.Column", "In Dev")
+    ]
+
+
+def test_update_work_items_batch_failures(mock_api, monkeypatch):
+    def update_work_items_batch(documents):
+        return [{
+            "code": 200,
+            "body": json.dumps({
+                "id": 1,
+                "fields": generate_work_item(1).fields
+            })
+        }, {
+            "code": 400,
+            "body": json.dumps({"message": "TF401320: Bad column"})
+        }, {
+            "code": 500,
+            "body": ""
+        }]
+
+    monkeypatch.setattr(mock_api.batch_client, "update_work_items_batch",
+                        update_work_items_batch)
+
+    result = list(mock_api.assign_work_items([1, 2, 3], "test@email.com"))
+    assert result[0].succeeded
+    assert result[0].work_item.id_number == 1
+    assert result[1].error == "TF401320: Bad column"
+    assert result[2].error == "Operation returned a 500 status code."
+
+
+def test_update_work_items_batch_rejected(mock_api, monkeypatch):
+    def update_work_items_batch(documents):
+        raise AzureDevOpsClientRequestError("Operation returned a 404 status "
+                                            "code.")
+
+    def update_work_item(ops, number):
+        if number == 2:
+            raise AzureDevOpsClientRequestError("Could not update")
+        return generate_work_item(number, assigned_to=ops[-1].value)
+
+    monkeypatch.setattr(mock_api.batch_client, "update_work_items_batch",
+                        update_work_items_batch)
+    monkeypatch.setattr(mock_api.work_item_client, "update_work_item",
+                        update_work_item)
+
+    result = list(mock_api.assign_work_items([1, 2, 3], "test@email.com"))
+    assert [r.id_number for r in result] == [1, 2, 3]
+    assert [r.succeeded for r in result] == [True, False, True]
+    assert result[1].error == "Could not update"
+    assert result[2].work_item.assigned_to == "test@email.com"
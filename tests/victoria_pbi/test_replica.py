@@ -0,0 +1,226 @@
+import pytest
+
+import victoria_pbi.replica
+from victoria_pbi.replica import Replica, describe_age, format_date, \
+    parse_date
+
+from conftest import create_work_item_container, generate_work_item
+
+
+class MockAPI:
+    def __init__(self, work_items):
+        self.work_items = work_items
+        self.since = []
+
+    def get_changed_work_items(self, since=None):
+        self.since.append(since)
+        yield from self.work_items
+
+
+def changed_work_item(number, changed, **kwargs):
+    work_item = generate_work_item(number, **kwargs)
+    work_item.fields["System.ChangedDate"] = changed
+    return work_item
+
+
+@pytest.fixture
+def replica(tmp_path):
+    replica = Replica("Org", "Project", str(tmp_path))
+    yield replica
+    replica.close()
+
+
+def test_parse_date():
+    assert format_date(parse_date("2020-01-02T03:04:05Z")) \
+        == "2020-01-02T03:04:05.000000Z"
+    assert format_date(parse_date("2020-01-02T03:04:05.67Z")) \
+        == "2020-01-02T03:04:05.670000Z"
+    assert format_date(parse_date("2020-01-02T03:04:05.1234567Z")) \
+        == "2020-01-02T03:04:05.123456Z"
+
+
+def test_describe_age():
+    assert describe_age(5) == "just now"
+    assert describe_age(60) == "1 minute ago"
+    assert describe_age(3 * 3600 + 5) == "3 hours ago"
+    assert describe_age(2 * 86400) == "2 days ago"
+
+
+def test_replica_never_synced(replica, tmp_path):
+    assert replica.synced_at is None
+    assert replica.age() is None
+    assert not (tmp_path / "replica_org_project.sqlite3").exists()
+
+
+def test_replica_sync(replica):
+    api = MockAPI([
+        changed_work_item(1, "2020-01-01T00:00:00Z"),
+        changed_work_item(2, "2020-01-03T00:00:00.5Z"),
+        changed_work_item(3, "2020-01-02T00:00:00Z", assigned=False)
+    ])
+    assert replica.sync(api) == 3
+    assert replica.count() == 3
+    assert api.since == [None]
+    assert replica.age() < 60
+
+    # the next sync starts a little before the newest change
+    api.work_items = [
+        changed_work_item(2, "2020-01-04T00:00:00Z", assigned_to="b@test.com")
+    ]
+    assert replica.sync(api) == 1
+    assert api.since[1] == "2020-01-02T23:55:00.500000Z"
+    assert replica.count() == 3
+    assert [item.assigned_to for item in replica.get_work_items([2])] \
+        == ["b@test.com"]
+
+    # a sync that finds nothing keeps where it got up to
+    api.work_items = []
+    replica.sync(api)
+    assert api.since[2] == "2020-01-03T23:55:00.000000Z"
+
+
+def test_replica_sync_full(replica):
+    api = MockAPI([
+        changed_work_item(number, "2020-01-01T00:00:00Z")
+        for number in range(1, 5)
+    ])
+    replica.sync(api)
+
+    # work items that weren't found by a full sync were deleted
+    api.work_items = api.work_items[:2]
+    assert replica.sync(api, full=True) == 2
+    assert api.since[1] is None
+    assert replica.count() == 2
+
+
+def test_replica_sync_off_board(replica):
+    work_item = changed_work_item(1, "2020-01-01T00:00:00Z")
+    del work_item.fields["System.BoardColumn"]
+    assert replica.sync(MockAPI([work_item])) == 1
+    # work items that aren't on a board use their state as their column
+    assert [item.board_column for item in replica.get_work_items([1])] \
+        == ["In Development"]
+
+
+def test_replica_sync_interrupted(replica, monkeypatch):
+    monkeypatch.setattr(victoria_pbi.replica, "STORE_BATCH_SIZE", 1)
+
+    def get_changed_work_items(since=None):
+        yield changed_work_item(1, "2020-01-05T00:00:00Z")
+        raise RuntimeError("connection lost")
+
+    api = MockAPI([changed_work_item(2, "2020-01-01T00:00:00Z")])
+    replica.sync(api)
+    api.get_changed_work_items = get_changed_work_items
+    with pytest.raises(RuntimeError):
+        replica.sync(api)
+
+    # the work items that were fetched are kept, but the next sync starts
+    # from the same place
+    api = MockAPI([])
+    replica.sync(api)
+    assert replica.count() == 2
+    assert api.since == ["2019-12-31T23:55:00.000000Z"]
+
+
+def test_replica_get_work_items(replica):
+    work_items = [
+        changed_work_item(number, "2020-01-01T00:00:00Z")
+        for number in [3, 1, 2]
+    ]
+    replica.sync(MockAPI(work_items))
+
+    result = list(replica.get_work_items([2, 4, 3, 2]))
+    assert result == [
+        create_work_item_container(work_items[2]),
+        create_work_item_container(work_items[0])
+    ]
+
+
+def test_replica_get_user_pbis(replica, caplog):
+    work_items = [
+        changed_work_item(1, "2020-01-01T00:00:00Z"),
+        changed_work_item(2, "2020-01-01T00:00:00Z", assigned_to="b@test.com"),
+        changed_work_item(3, "2020-01-01T00:00:00Z"),
+        changed_work_item(4, "2020-01-01T00:00:00Z"),
+    ]
+    work_items[2].fields["System.State"] = "Done"
+    replica.sync(MockAPI(work_items))
+
+    result = list(replica.get_user_pbis("EMAIL@test.com"))
+    assert [item.id_number for item in result] == [1, 4]
+    assert [item.id_number
+            for item in replica.get_user_pbis("email@test.com", 1)] == [1]
+
+    result = replica.get_user_pbis(["b@test.com", "email@test.com"])
+    assert [item.id_number for item in result] == [1, 2, 4]
+
+    assert list(replica.get_user_pbis("nobody@test.com")) == []
+    assert "Could not find any work items" in caplog.text
+
+
+def test_replica_get_board_stats(replica):
+    work_items = [
+        changed_work_item(number, "2020-01-01T00:00:00Z")
+        for number in range(1, 7)
+    ]
+    work_items[1].fields["System.AssignedTo"]["uniqueName"] = "b@test.com"
+    work_items[2].fields["System.State"] = "Done"
+    work_items[2].fields["System.BoardColumn"] = "Done"
+    work_items[3].fields["System.State"] = "Removed"
+    work_items[4].fields["System.AreaPath"] = "Project\\devops\\Sub"
+    work_items[5].fields["System.AreaPath"] = "Project\\DevOpsOther"
+    replica.sync(MockAPI(work_items))
+
+    work_items[5].fields["System.AssignedTo"] = None
+    work_items[5].fields["System.AreaPath"] = "Project\\DevOps"
+    replica.sync(MockAPI(work_items[5:]))
+
+    areas = {"field": "System.AreaPath", "values": [["Project\\DevOps", True]]}
+    states = ["New", "In Development", "Done", "Removed"]
+    # the same shape as AzureDevOpsAPI.get_board_stats()
+    assert replica.get_board_stats(areas, ["New", "In Development", "Done"],
+                                   states, ["EMAIL@test.com"]) == {
+        "column": {
+            "New": 0,
+            "In Development": 4,
+            "Done": 1
+        },
+        "state": {
+            "New": 0,
+            "In Development": 4,
+            "Done": 1
+        },
+        "assignee": {
+            "EMAIL@test.com": 2,
+            "Unassigned": 1,
+            "Others": 1
+        }
+    }
+
+    # without the areas under it
+    areas["values"][0][1] = False
+    assert replica.get_board_stats(areas, [], states, [])["state"] == {
+        "New": 0,
+        "In Development": 3,
+        "Done": 1
+    }
+
+    with pytest.raises(ValueError, match="System.IterationPath"):
+        replica.get_board_stats(
+            {
+                "field": "System.IterationPath",
+                "values": []
+            }, [], [], [])
+
+
+def test_replica_rebuilds_old_schema(tmp_path):
+    replica = Replica("Org", "Project", str(tmp_path))
+    replica.sync(MockAPI([changed_work_item(1, "2020-01-01T00:00:00Z")]))
+    replica._db.execute("PRAGMA user_version = 0")
+    replica.close()
+
+    replica = Replica("Org", "Project", str(tmp_path))
+    assert replica.synced_at is None
+    assert replica.count() == 0
+    replica.close()
@@ -0,0 +1,186 @@
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import time
+
+import pytest
+
+from victoria_pbi.config import TransportConfig
+from victoria_pbi.scheduler import RequestScheduler, near_limit, retry_after
+from victoria_pbi.transport import Transport
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # the statuses to respond with, in order, before responding with 200
+    statuses = []
+    requests = 0
+    lock = threading.Lock()
+
+    def _handle(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with Handler.lock:
+            Handler.requests += 1
+            status = Handler.statuses.pop(0) if Handler.statuses else 200
+        body = b'{"value": []}'
+        self.send_response(status)
+        if status == 429:
+            self.send_header("Retry-After", "0")
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = _handle
+    do_POST = _handle
+    do_PATCH = _handle
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    Handler.statuses = []
+    Handler.requests = 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def transport():
+    transport = Transport(TransportConfig(pool_size=4, retries=3))
+    transport.scheduler.backoff = 0.01
+    yield transport
+    transport.close()
+
+
+def test_retry_after():
+    assert retry_after({}) is None
+    assert retry_after({"Retry-After": "2.5"}) == 2.5
+    assert retry_after({"Retry-After": "-1"}) == 0
+    assert retry_after({"Retry-After": "soon"}) is None
+    assert retry_after({"Retry-After":
+                        "Wed, 21 Oct 2015 07:28:00 GMT"}) == 0
+
+
+def test_near_limit():
+    assert not near_limit({})
+    assert near_limit({"X-RateLimit-Delay": "0.5"})
+    assert not near_limit({"X-RateLimit-Delay": "0"})
+    assert near_limit({
+        "X-RateLimit-Limit": "200",
+        "X-RateLimit-Remaining": "10"
+    })
+    assert not near_limit({
+        "X-RateLimit-Limit": "200",
+        "X-RateLimit-Remaining": "150"
+    })
+    assert not near_limit({"X-RateLimit-Remaining": "oops"})
+
+
+def test_scheduler_aimd():
+    scheduler = RequestScheduler(8, backoff=0)
+    assert scheduler.observe(429, {"Retry-After": "0"}, 0) is not None
+    assert scheduler.limit == 4
+    assert scheduler.observe(200, {"X-RateLimit-Delay": "1"}, 0) is None
+    assert scheduler.limit == 2
+    scheduler.observe(503, {}, 0)
+    scheduler.observe(503, {}, 0)
+    assert scheduler.limit == 1
+
+    # each success raises the limit by a limit's worth of one
+    scheduler.observe(200, {}, 0)
+    assert scheduler.limit == 2
+    scheduler.observe(200, {}, 0)
+    assert scheduler.limit == 2.5
+    for _ in range(100):
+        scheduler.observe(200, {}, 0)
+    assert scheduler.limit == 8
+
+
+def test_scheduler_decreases_once_per_backoff():
+    scheduler = RequestScheduler(8, backoff=60)
+    scheduler.observe(503, {}, 0)
+    scheduler.observe(503, {}, 0)
+    assert scheduler.limit == 4
+
+
+def test_scheduler_retries():
+    scheduler = RequestScheduler(8, retries=2, backoff=0.5)
+    assert scheduler.observe(404, {}, 0) is None
+    assert 0 <= scheduler.observe(503, {}, 0) <= 0.5
+    assert 0 <= scheduler.observe(503, {}, 1) <= 1
+    assert scheduler.observe(503, {}, 2) is None
+    assert 3 <= scheduler.observe(429, {"Retry-After": "3"}, 0) <= 3.5
+
+
+def test_scheduler_pauses_on_retry_after():
+    scheduler = RequestScheduler(8)
+    scheduler.observe(429, {"Retry-After": "0.2"}, 0)
+    start = time.monotonic()
+    scheduler.acquire()
+    scheduler.release()
+    assert time.monotonic() - start >= 0.15
+
+
+def test_scheduler_limits_concurrency():
+    scheduler = RequestScheduler(2)
+    in_flight = []
+    most = []
+    lock = threading.Lock()
+
+    def request(_):
+        scheduler.acquire()
+        with lock:
+            in_flight.append(1)
+            most.append(len(in_flight))
+        time.sleep(0.01)
+        with lock:
+            in_flight.pop()
+        scheduler.release()
+
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        list(executor.map(request, range(12)))
+    assert max(most) == 2
+
+
+def test_transport_retries_throttled(server, transport):
+    Handler.statuses = [429, 429]
+    response = transport.session.patch(server, data=b"{}")
+    assert response.status_code == 200
+    assert response.retried == 2
+    assert Handler.requests == 3
+    assert transport.scheduler.limit < 4
+
+
+def test_transport_retries_idempotent(server, transport):
+    Handler.statuses = [503]
+    assert transport.session.get(server).status_code == 200
+
+    Handler.statuses = [503]
+    response = transport.session.post(server + "_apis/wit/workitemsbatch",
+                                      data=b"{}")
+    assert response.status_code == 200
+    assert response.retried == 1
+
+
+def test_transport_does_not_retry_updates(server, transport):
+    Handler.statuses = [503]
+    response = transport.session.patch(server + "_apis/wit/workitems/1",
+                                       data=b"{}")
+    assert response.status_code == 503
+    assert response.retried == 0
+    assert Handler.requests == 1
+
+
+def test_transport_gives_up(server, transport):
+    Handler.statuses = [503] * 5
+    response = transport.session.get(server)
+    assert response.status_code == 503
+    assert response.retried == 3
+    assert Handler.requests == 4
@@ -0,0 +1,229 @@
+import time
+
+import pytest
+
+from azure.devops.v5_1.work_item_tracking import WorkItemQueryResult
+
+from victoria_pbi.config import PBIConfig, TargetConfig
+from victoria_pbi.targets import MultiTargetAPI, TEAM_PROJECT_FIELD, \
+    merge_streams
+from victoria_pbi.workitem import WorkItemContainer
+
+from conftest import create_mock_api, generate_work_item
+
+
+class TargetError(Exception):
+    pass
+
+
+class FakeTarget:
+    """Stands in for the connection to a target, with the work items in each
+    of its organisation's projects."""
+    def __init__(self, cfg, projects, delay=0.0):
+        self.project = cfg.project
+        self.projects = projects
+        self.delay = delay
+        self.calls = []
+
+    def _project_of(self, number):
+        return next((project for project, numbers in self.projects.items()
+                     if number in numbers), None)
+
+    def get_work_items(self, numbers, fields=None, missing_ok=False):
+        self.calls.append(("get_work_items", fields, missing_ok))
+        time.sleep(self.delay)
+        for number in numbers:
+            project = self._project_of(number)
+            if project is None:
+                continue
+            work_item = generate_work_item(number)
+            work_item.fields[TEAM_PROJECT_FIELD] = project
+            yield WorkItemContainer(work_item, fields=fields)
+
+    def get_user_pbis(self,
+                      email,
+                      top=None,
+                      fields=None,
+                      project=None,
+                      missing_ok=False):
+        assert missing_ok
+        self.calls.append(("get_user_pbis", project))
+        time.sleep(self.delay)
+        for number in self.projects.get(project, [])[:top]:
+            yield WorkItemContainer(generate_work_item(number), fields=fields)
+
+    def get_boards(self, refresh=False):
+        if self.project == "Broken":
+            raise TargetError("failed")
+        yield f"{self.project} Team"
+
+
+def create_api(targets, projects, delay=0.0):
+    cfg = PBIConfig("token", "org", "Project", "email@test.com",
+                    targets=targets)
+    connections = []
+
+    def connect(target_cfg):
+        # projects are per organisation
+        connections.append(
+            FakeTarget(target_cfg, projects[target_cfg.organisation], delay))
+        return connections[-1]
+
+    return MultiTargetAPI(cfg.target_configs(), connect,
+                          (TargetError, )), connections
+
+
+def test_merge_streams():
+    def slow(items):
+        for item in items:
+            time.sleep(0.1)
+            yield item
+
+    start = time.time()
+    merged = list(
+        merge_streams({
+            "a": lambda: slow([1, 2]),
+            "b": lambda: slow([3, 4])
+        }))
+    # the streams are read at the same time, not one after the other
+    assert time.time() - start < 0.35
+    assert sorted(merged) == [("a", 1), ("a", 2), ("b", 3), ("b", 4)]
+    assert [item for name, item in merged if name == "a"] == [1, 2]
+
+
+def test_merge_streams_errors(caplog):
+    def failing():
+        yield 1
+        raise TargetError("failed")
+
+    merged = list(
+        merge_streams({
+            "a": failing,
+            "b": lambda: [2]
+        }, (TargetError, )))
+    assert sorted(merged) == [("a", 1), ("b", 2)]
+    assert "a: failed" in caplog.text
+
+    with pytest.raises(ValueError):
+        list(merge_streams({"a": lambda: int("x")}, (TargetError, )))
+
+
+def test_get_work_items_organisations(caplog):
+    api, (first, second) = create_api(
+        [TargetConfig("other", "Other")], {
+            "org": {
+                "Project": [1, 2]
+            },
+            "other": {
+                "Other": [3]
+            }
+        })
+    work_items = list(api.get_work_items([1, 3, 2, 4]))
+    assert sorted((work_item.id_number, work_item.source)
+                  for work_item in work_items) == [(1, "org/Project"),
+                                                   (2, "org/Project"),
+                                                   (3, "other/Other")]
+    # each organisation is only missing some of them, so only the one
+    # missing from all of them is reported
+    assert first.calls == [("get_work_items", None, True)]
+    assert "#4 could not be found" in caplog.text
+    assert "#1 could not be found" not in caplog.text
+
+
+def test_get_work_items_projects():
+    api, connections = create_api(
+        [TargetConfig("org", "Platform", name="platform")], {
+            "org": {
+                "Project": [1],
+                "Platform": [2],
+                "Elsewhere": [3]
+            }
+        })
+    work_items = list(api.get_work_items([1, 2, 3], ["System.Title"]))
+    assert [(work_item.id_number, work_item.source)
+            for work_item in work_items] == [(1, "org/Project"),
+                                             (2, "platform"),
+                                             (3, "org/Elsewhere")]
+    # the organisation is only asked once, for the project as well
+    assert [call for connection in connections
+            for call in connection.calls] == [
+                ("get_work_items", ["System.Title", TEAM_PROJECT_FIELD],
+                 False)
+            ]
+    assert work_items[0].fields == {
+        "System.Title": "This is a work item"
+    }
+
+    work_items = list(api.get_work_items([2]))
+    assert work_items[0].fields is None
+    assert work_items[0].to_dict()["source"] == "platform"
+
+
+def test_get_user_pbis():
+    api, connections = create_api(
+        [TargetConfig("other", "Other"),
+         TargetConfig("org", "Platform")], {
+             "org": {
+                 "Project": [1, 2],
+                 "Platform": [3]
+             },
+             "other": {
+                 "Other": [4, 5]
+             }
+         },
+        delay=0.1)
+    start = time.time()
+    work_items = list(api.get_user_pbis("email@test.com"))
+    assert time.time() - start < 0.25
+    assert sorted((work_item.id_number, work_item.source)
+                  for work_item in work_items) == [(1, "org/Project"),
+                                                   (2, "org/Project"),
+                                                   (3, "org/Platform"),
+                                                   (4, "other/Other"),
+                                                   (5, "other/Other")]
+    # each target only gets its own project's work items
+    assert [connection.calls for connection in connections] == [
+        [("get_user_pbis", "Project")], [("get_user_pbis", "Other")],
+        [("get_user_pbis", "Platform")]
+    ]
+
+    assert len(list(api.get_user_pbis("email@test.com", top=3))) == 3
+
+
+def test_get_user_pbis_none(monkeypatch, capsys, caplog):
+    def connect(target_cfg):
+        conn = create_mock_api(monkeypatch)
+        if target_cfg.project == "Empty":
+            monkeypatch.setattr(conn.work_item_client, "query_by_wiql",
+                                lambda *args, **kwargs: WorkItemQueryResult(
+                                    work_items=[]))
+        return conn
+
+    cfg = PBIConfig("token", "org", "Empty", "email@test.com",
+                    targets=[TargetConfig("org", "Project")])
+    api = MultiTargetAPI(cfg.target_configs(), connect)
+    # a target with none of the user's work items isn't reported when
+    # another target has some
+    assert len(list(api.get_user_pbis("email@test.com"))) > 0
+    assert "Could not find any work items" not in caplog.text
+
+    cfg = PBIConfig("token", "org", "Empty", "email@test.com",
+                    targets=[TargetConfig("other", "Empty")])
+    api = MultiTargetAPI(cfg.target_configs(), connect)
+    assert list(api.get_user_pbis(["email@test.com", "b@test.com"])) == []
+    # reported once for all of the targets, without breaking the output
+    assert caplog.text.count("Could not find any work items") == 1
+    assert "'email@test.com', 'b@test.com' in any target" in caplog.text
+    assert capsys.readouterr().out == ""
+
+
+def test_get_boards(caplog):
+    api, _ = create_api(
+        [TargetConfig("other", "Other"),
+         TargetConfig("org", "Broken")], {
+             "org": {},
+             "other": {}
+         })
+    assert sorted(api.get_boards()) == [("org/Project", "Project Team"),
+                                        ("other/Other", "Other Team")]
+    assert "org/Broken: failed" in caplog.text
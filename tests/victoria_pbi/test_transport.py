@@ -0,0 +1,85 @@
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+
+from azure.devops.client import Client
+from msrest.universal_http import ClientRequest
+import pytest
+
+from victoria_pbi.config import TransportConfig
+from victoria_pbi.transport import Transport
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    connections = set()
+    lock = threading.Lock()
+
+    def do_GET(self):
+        with Handler.lock:
+            Handler.connections.add(self.client_address)
+        body = b'{"value": []}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    Handler.connections = set()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/"
+    server.shutdown()
+    server.server_close()
+
+
+def send(client, url):
+    request = ClientRequest(method="GET", url=url)
+    return client._send_request(request, headers={"Accept": "application/json"})
+
+
+def test_transport_session():
+    transport = Transport(TransportConfig(pool_size=4, compression=False))
+    adapter = transport.session.get_adapter("https://dev.azure.com/")
+    assert adapter._pool_maxsize == 4
+    assert adapter._pool_block
+    assert transport.session.headers["Accept-Encoding"] == "identity"
+    assert transport.session.headers["Connection"] == "keep-alive"
+
+    transport = Transport(TransportConfig(keep_alive=False))
+    assert transport.session.headers["Connection"] == "close"
+
+
+def test_transport_configure():
+    transport = Transport(TransportConfig(timeout=5))
+    client = Client("https://dev.azure.com/org/")
+    transport.configure(client)
+    assert client.config.keep_alive
+    assert client.config.connection.timeout == 5
+
+    kwargs = client.config.session_configuration_callback(
+        None, client.config, {}, timeout=5)
+    assert kwargs == {"timeout": 5, "session": transport.session}
+
+
+def test_transport_reuses_connections(server):
+    transport = Transport(TransportConfig(pool_size=2))
+    clients = [Client(server), Client(server)]
+    for client in clients:
+        transport.configure(client)
+
+    # every client and thread should share the same two connections
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        responses = list(
+            executor.map(lambda i: send(clients[i % 2], server), range(20)))
+    transport.close()
+
+    assert all(response.status_code == 200 for response in responses)
+    assert len(Handler.connections) <= 2
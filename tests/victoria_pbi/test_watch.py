@@ -0,0 +1,105 @@
+import pytest
+
+from victoria_pbi.replica import parse_date
+from victoria_pbi.watch import Watcher
+
+from conftest import generate_work_item
+
+
+class MockAPI:
+    def __init__(self):
+        self.work_items = []
+        self.since = []
+
+    def get_changed_user_pbis(self, email, since=None):
+        self.since.append(since)
+        for work_item in self.work_items:
+            if since is None or parse_date(work_item.fields[
+                    "System.ChangedDate"]) >= parse_date(since):
+                yield work_item
+
+
+def changed_work_item(number, rev, changed, **kwargs):
+    work_item = generate_work_item(number, **kwargs)
+    work_item.fields["System.Rev"] = rev
+    work_item.fields["System.ChangedDate"] = changed
+    return work_item
+
+
+def test_watcher_poll():
+    api = MockAPI()
+    watcher = Watcher(api, "email@test.com")
+    api.work_items = [
+        changed_work_item(1, 1, "2020-01-01T10:00:00Z"),
+        changed_work_item(2, 3, "2020-01-01T11:00:00Z")
+    ]
+    assert [item.id_number for item in watcher.poll()] == [1, 2]
+    assert api.since == [None]
+
+    # work items fetched again without changing aren't reported
+    assert watcher.poll() == []
+    assert api.since[1] == "2020-01-01T10:55:00.000000Z"
+
+    api.work_items = [
+        changed_work_item(2, 3, "2020-01-01T11:00:00Z"),
+        changed_work_item(3, 1, "2020-01-01T11:01:00Z")
+    ]
+    assert [item.id_number for item in watcher.poll()] == [3]
+    assert watcher.watermark == "2020-01-01T11:01:00.000000Z"
+
+
+def test_watcher_reassigned():
+    api = MockAPI()
+    watcher = Watcher(api, "email@test.com")
+    api.work_items = [changed_work_item(1, 1, "2020-01-01T10:00:00Z")]
+    watcher.poll()
+
+    # a work item we've seen leaving is reported, but not one that was
+    # assigned to the user before we started watching
+    api.work_items = [
+        changed_work_item(1, 2, "2020-01-01T10:01:00Z",
+                          assigned_to="other@test.com"),
+        changed_work_item(2, 2, "2020-01-01T10:01:00Z",
+                          assigned_to="other@test.com")
+    ]
+    result = watcher.poll()
+    assert [item.id_number for item in result] == [1]
+    assert result[0].assigned_to == "other@test.com"
+
+    api.work_items = [
+        changed_work_item(1, 3, "2020-01-01T10:02:00Z",
+                          assigned_to="other@test.com")
+    ]
+    assert watcher.poll() == []
+
+
+def test_watcher_poll_failed():
+    api = MockAPI()
+    watcher = Watcher(api, "email@test.com")
+    api.work_items = [changed_work_item(1, 1, "2020-01-01T10:00:00Z")]
+    watcher.poll()
+
+    def get_changed_user_pbis(email, since=None):
+        yield changed_work_item(1, 2, "2020-01-01T12:00:00Z")
+        raise RuntimeError("connection lost")
+
+    api.get_changed_user_pbis = get_changed_user_pbis
+    with pytest.raises(RuntimeError):
+        watcher.poll()
+    assert watcher.watermark == "2020-01-01T10:00:00.000000Z"
+
+    # the change is picked up by the next poll
+    del api.get_changed_user_pbis
+    api.work_items = [changed_work_item(1, 2, "2020-01-01T12:00:00Z")]
+    assert [item.id_number for item in watcher.poll()] == [1]
+
+
+def test_watcher_forgets_old_revisions():
+    api = MockAPI()
+    watcher = Watcher(api, "email@test.com")
+    api.work_items = [
+        changed_work_item(1, 1, "2020-01-01T10:00:00Z"),
+        changed_work_item(2, 1, "2020-01-01T12:00:00Z")
+    ]
+    watcher.poll()
+    assert set(watcher._revisions) == {2}
@@ -6,9 +6,7 @@ Author:
     Sam Gibson <sgibson@glasswallsolutions.com>
 """
 
-import click
 from victoria.plugin import Plugin
-import yaml
 
 from .config import PBIConfigSchema
 from . import cli
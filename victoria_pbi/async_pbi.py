@@ -0,0 +1,441 @@
+"""async_pbi.py
+
+This module contains an asyncio version of the wrapper for interacting with
+the Azure DevOps API, for use inside asyncio applications. It talks to the REST
+API directly using aiohttp, which needs to be installed with the 'async' extra.
+
+Author:
+    Sam Gibson <sgibson@glasswallsolutions.com>
+"""
+
+import asyncio
+import base64
+from collections import deque
+import logging
+from typing import Any, AsyncGenerator, Awaitable, Callable, Iterable, \
+    List, Optional, TypeVar
+from urllib.parse import quote
+
+import aiohttp
+from azure.devops._models import WrappedException
+from azure.devops.exceptions import AzureDevOpsClientRequestError, \
+    AzureDevOpsServiceError
+from azure.devops.v5_1.work_item_tracking import WorkItem
+
+from .config import PBIConfig
+from .pbi import BACKLOG_BOARD, MAX_CONCURRENT_REQUESTS, WIQL_PAGE_SIZE, \
+    WORK_ITEM_BATCH_SIZE, WORK_ITEM_FIELDS, WorkItemContainer, chunks, \
+    containers_in_order, organisation_url, user_pbis_query
+
+API_VERSION = "5.1"
+"""The version of the Azure DevOps REST API to use."""
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+async def bounded_gather(func: Callable[[T], Awaitable[R]], items: Iterable[T],
+                         max_tasks: int) -> AsyncGenerator[R, None]:
+    """Run a coroutine function on each item concurrently, with at most
+    max_tasks running at once.
+
+    Args:
+        func (Callable[[T], Awaitable[R]]): The coroutine function to run.
+        items (Iterable[T]): The items to run it on.
+        max_tasks (int): The maximum number of tasks to have running.
+
+    Yields:
+        R: The result of each task, in the same order as the items.
+    """
+    pending = deque()
+    try:
+        for item in items:
+            pending.append(asyncio.ensure_future(func(item)))
+            if len(pending) >= max_tasks:
+                yield await pending.popleft()
+        while pending:
+            yield await pending.popleft()
+    finally:
+        # if the caller stopped early don't leave the tasks running
+        for task in pending:
+            task.cancel()
+
+
+class AsyncAzureDevOpsAPI:
+    """An asyncio connection to the Azure DevOps API. It has the same methods
+    as AzureDevOpsAPI, but they are coroutines or async generators.
+
+    Use it as an async context manager, or call close() when done with it, so
+    that the connection pool is cleaned up.
+
+    Attributes:
+        project (str): The Azure DevOps project to use.
+        base_url (str): The URL of the Azure DevOps organisation.
+        max_workers (int): The maximum number of requests to have in flight at
+            once when an operation is split over multiple requests.
+    """
+    def __init__(self,
+                 cfg: PBIConfig,
+                 max_workers: int = MAX_CONCURRENT_REQUESTS,
+                 session: aiohttp.ClientSession = None) -> None:
+        """Create an asyncio connection to the Azure DevOps API.
+
+        Args:
+            cfg (PBIConfig): The config to use to connect to the API.
+            max_workers (int): The maximum number of concurrent requests.
+            session (aiohttp.ClientSession): The session to send requests with.
+                Sharing a session between connections shares its connection
+                pool. If not given, one is created and owned by this object.
+        """
+        self.project = cfg.project
+        self.base_url = organisation_url(cfg)
+        self.max_workers = max_workers
+        token = base64.b64encode(f":{cfg.access_token}".encode()).decode()
+        self._authorization = f"Basic {token}"
+        self._session = session
+        self._owns_session = session is None
+        self._column_field_names = {}
+
+    async def __aenter__(self) -> "AsyncAzureDevOpsAPI":
+        return self
+
+    async def __aexit__(self, *exc_details) -> None:
+        await self.close()
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """aiohttp.ClientSession: The session used to send requests."""
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_workers))
+        return self._session
+
+    async def close(self) -> None:
+        """Close the connection pool, if this object created it."""
+        if self._owns_session and self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _request(self,
+                       method: str,
+                       path: str,
+                       body: Any = None,
+                       content_type: str = "application/json",
+                       params: dict = None) -> Any:
+        """Send a request to the Azure DevOps REST API.
+
+        Args:
+            method (str): The HTTP method to use.
+            path (str): The path of the resource, relative to the organisation.
+            body (Any): The JSON body to send, if any.
+            content_type (str): The content type of the body.
+            params (dict): Query parameters to send, as well as the API
+                version.
+
+        Returns:
+            Any: The decoded JSON response, or None if it was empty.
+
+        Raises:
+            AzureDevOpsServiceError: If the service returned an error.
+            AzureDevOpsClientRequestError: If the request failed.
+        """
+        headers = {
+            "Accept": "application/json",
+            "Authorization": self._authorization
+        }
+        if body is not None:
+            headers["Content-Type"] = content_type
+        async with self.session.request(method,
+                                        self.base_url + path,
+                                        params={
+                                            "api-version": API_VERSION,
+                                            **(params or {})
+                                        },
+                                        json=body,
+                                        headers=headers) as response:
+            text = await response.text()
+            result = None
+            if text:
+                try:
+                    result = await response.json(content_type=None)
+                except ValueError:
+                    result = None
+
+            if response.status < 200 or response.status >= 300:
+                if isinstance(result, dict) and result.get("message"):
+                    raise AzureDevOpsServiceError(
+                        WrappedException.deserialize(result))
+                raise AzureDevOpsClientRequestError(
+                    f"Operation returned a {response.status} status code.")
+            return result
+
+    def _project_path(self, team: str = None) -> str:
+        """Get the URL path to the project, or a team in the project.
+
+        Args:
+            team (str): The team, if any.
+
+        Returns:
+            str: The path.
+        """
+        path = quote(self.project, safe="") + "/"
+        if team is not None:
+            path += quote(team, safe="") + "/"
+        return path
+
+    async def get_work_item(self,
+                            number: int) -> Optional[WorkItemContainer]:
+        """Get a work item by ID.
+
+        Args:
+            number (int): The ID number of the work item.
+
+        Returns:
+            WorkItemContainer: The work item, or None if it could not be found
+                or was of a type we don't allow.
+        """
+        containers = await self._get_work_items_batch([number])
+        return containers[0] if containers else None
+
+    async def get_work_items(self, numbers: Iterable[int]
+                             ) -> AsyncGenerator[WorkItemContainer, None]:
+        """Get multiple work items by ID.
+
+        The IDs are split into batches the size the service allows, which are
+        fetched concurrently. Duplicate IDs are only fetched once.
+
+        Args:
+            numbers (Iterable[int]): The IDs to get.
+
+        Yields:
+            WorkItemContainer: Work items, in the order their IDs were given.
+        """
+        unique_numbers = dict.fromkeys(numbers)
+        batches = chunks(unique_numbers, WORK_ITEM_BATCH_SIZE)
+        async for batch in bounded_gather(self._get_work_items_batch, batches,
+                                          self.max_workers):
+            for work_item in batch:
+                yield work_item
+
+    async def _get_work_items_batch(
+            self, numbers: List[int]) -> List[WorkItemContainer]:
+        """Get a single batch of work items by ID.
+
+        Args:
+            numbers (List[int]): The IDs to get. There can be at most
+                WORK_ITEM_BATCH_SIZE of them.
+
+        Returns:
+            List[WorkItemContainer]: The work items, in the order their IDs
+                were given.
+        """
+        try:
+            result = await self._request(
+                "POST", self._project_path() + "_apis/wit/workitemsbatch", {
+                    "ids": numbers,
+                    "fields": WORK_ITEM_FIELDS,
+                    "errorPolicy": "omit"
+                })
+        except AzureDevOpsServiceError as err:
+            logging.error(err)
+            return []
+        return containers_in_order(numbers, [
+            WorkItem.deserialize(work_item) if work_item is not None else None
+            for work_item in result["value"]
+        ])
+
+    async def _query_page(self, query: str, top: int) -> List[int]:
+        """Run a WIQL query.
+
+        Args:
+            query (str): The WIQL query.
+            top (int): The maximum number of results to return.
+
+        Returns:
+            List[int]: The IDs of the work items the query matched.
+        """
+        result = await self._request("POST",
+                                     self._project_path() + "_apis/wit/wiql",
+                                     {"query": query},
+                                     params={"$top": top})
+        return [item["id"] for item in result["workItems"]]
+
+    async def get_user_pbis(
+            self,
+            email: str,
+            top: int = None) -> AsyncGenerator[WorkItemContainer, None]:
+        """Get all of the PBIs assigned to a user.
+
+        The query is paged in ID order, and the work items from each page are
+        fetched before the next page is queried.
+
+        Args:
+            email (str): The email of the user whose PBIs to get.
+            top (int): The maximum number of work items to get, or None for
+                all of them.
+
+        Yields:
+            WorkItemContainer: Work items assigned to the user, in ID order.
+        """
+        last_id = 0
+        remaining = top
+        while remaining is None or remaining > 0:
+            size = WIQL_PAGE_SIZE if remaining is None \
+                else min(WIQL_PAGE_SIZE, remaining)
+            page = await self._query_page(user_pbis_query(email, last_id),
+                                          size)
+            # stop if the page went backwards, rather than looping forever
+            page = [number for number in page[:size] if number > last_id]
+            if not page and last_id == 0:
+                logging.warning(
+                    f"Could not find any work items for user '{email}'."
+                    " Did the user exist?")
+
+            async for work_item in self.get_work_items(page):
+                yield work_item
+            if len(page) < size:
+                return
+            last_id = page[-1]
+            if remaining is not None:
+                remaining -= len(page)
+
+    async def get_boards(self) -> AsyncGenerator[str, None]:
+        """Get all boards from the organisation.
+
+        Yields:
+            str: Board names.
+
+        Raises:
+            AzureDevOpsServiceError: If there was some error getting the boards.
+        """
+        try:
+            result = await self._request(
+                "GET", f"_apis/projects/{self._project_path()}teams")
+        except AzureDevOpsServiceError as err:
+            logging.error(err)
+            raise
+        for board in result["value"]:
+            yield board["name"]
+
+    async def get_board_states(self, board: str) -> AsyncGenerator[str, None]:
+        """Get all possible states of the board.
+
+        Args:
+            board (str): The board to get states for.
+
+        Yields:
+            str: Board states of the board.
+
+        Raises:
+            AzureDevOpsServiceError: If there was some error getting the states.
+        """
+        try:
+            result = await self._request(
+                "GET",
+                self._project_path(board) + "_apis/work/boards/" +
+                quote(BACKLOG_BOARD, safe="") + "/columns")
+        except AzureDevOpsServiceError as err:
+            logging.error(err)
+            raise
+        for column in result["value"]:
+            yield column["name"]
+
+    async def get_column_field_name(self, board: str) -> str:
+        """Get the name of the field that stores which column of a board a work
+        item is in. This is looked up once per board and cached.
+
+        Args:
+            board (str): The board to get the column field name for.
+
+        Returns:
+            str: The name of the column field.
+
+        Raises:
+            AzureDevOpsServiceError: If there was some error getting the board.
+        """
+        if board not in self._column_field_names:
+            result = await self._request(
+                "GET",
+                self._project_path(board) + "_apis/work/boards/" +
+                quote(BACKLOG_BOARD, safe=""))
+            self._column_field_names[board] = \
+                result["fields"]["columnField"]["referenceName"]
+        return self._column_field_names[board]
+
+    async def _update_work_item(self, number: int, path: str,
+                                value: str) -> Optional[WorkItemContainer]:
+        """Set a field on a work item.
+
+        Args:
+            number (int): The ID of the work item.
+            path (str): The JSON patch path of the field.
+            value (str): The value to set the field to.
+
+        Returns:
+            WorkItemContainer: The updated work item, or None if it could not
+                be updated.
+        """
+        try:
+            result = await self._request(
+                "PATCH",
+                f"_apis/wit/workitems/{number}", [{
+                    "op": "add",
+                    "path": path,
+                    "value": value
+                }],
+                content_type="application/json-patch+json")
+        except AzureDevOpsClientRequestError as err:
+            logging.error(err)
+            return None
+        return WorkItemContainer(WorkItem.deserialize(result),
+                                 keep_work_item=True)
+
+    async def move_work_item(self,
+                             number: int,
+                             state: str,
+                             board: str = None) -> Optional[WorkItemContainer]:
+        """Move a work item to a given board column.
+
+        Args:
+            number (int): The ID of the work item.
+            state (str): The board column to move it to.
+            board (str): The board the work item is on. If given, the column
+                field is looked up from the board instead of from the work
+                item itself.
+
+        Returns:
+            WorkItemContainer: The moved work item, or None if it could not be
+                moved.
+        """
+        if board is not None:
+            field_name = await self.get_column_field_name(board)
+        else:
+            try:
+                result = await self._request("GET",
+                                             f"_apis/wit/workitems/{number}")
+            except AzureDevOpsClientRequestError as err:
+                logging.error(err)
+                return None
+            field_name = next((field for field in result["fields"]
+                               if field.endswith("_Kanban.Column")), None)
+            if field_name is None:
+                logging.error(f"Work item #{number} is not on a board")
+                return None
+
+        return await self._update_work_item(number, f"/fields/{field_name}",
+                                            state)
+
+    async def assign_work_item(self, number: int,
+                               email: str) -> Optional[WorkItemContainer]:
+        """Assign a work item to a user by email.
+
+        Args:
+            number (int): The work item ID.
+            email (str): The email of the user to assign the item to.
+
+        Returns:
+            WorkItemContainer: The assigned work item, or None if it could not
+                be assigned.
+        """
+        return await self._update_work_item(number,
+                                            "/fields/System.AssignedTo", email)
@@ -0,0 +1,361 @@
+"""batch.py
+
+This module runs many get, mv and assign operations over one connection, read
+as lines of JSON. Reads are deduplicated and fetched together, and writes are
+combined into as few bulk updates as possible, so a job that would have run
+the CLI hundreds of times sends a handful of requests.
+
+Author:
+    Sam Gibson <sgibson@glasswallsolutions.com>
+"""
+
+import json
+from typing import Callable, Dict, Generator, Iterable, List, Optional, \
+    Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .pbi import AzureDevOpsAPI
+
+READ_OPERATIONS = {"get"}
+"""Operations that only read work items."""
+
+WRITE_OPERATIONS = {"mv", "assign"}
+"""Operations that update work items."""
+
+SEGMENT_SIZE = 1000
+"""The most operations to run together. Results are written once each segment
+has run, so this bounds how long the first results take and how much is held
+in memory."""
+
+
+class Operation:
+    """Operation is a single line of the input.
+
+    Attributes:
+        line (int): The line of the input it was read from, counting from 1.
+        op (str): What to do: 'get', 'mv' or 'assign'.
+        ids (List[int]): The IDs of the work items to do it to.
+        value (str): The column to move them to, or the email of the user to
+            assign them to.
+        board (str): The board the work items are on, for mv.
+        ref (Any): Anything the caller passed to identify the operation, which
+            is copied to its result.
+        error (str): Why the line could not be read, or None if it could.
+    """
+    def __init__(self,
+                 line: int,
+                 op: str = None,
+                 ids: List[int] = None,
+                 value: str = None,
+                 board: str = None,
+                 ref=None,
+                 error: str = None) -> None:
+        self.line = line
+        self.op = op
+        self.ids = list(dict.fromkeys(ids or []))
+        self.value = value
+        self.board = board
+        self.ref = ref
+        self.error = error
+
+    def result(self, **fields) -> dict:
+        """Create the result of the operation.
+
+        Args:
+            **fields: The outcome of the operation.
+
+        Returns:
+            dict: The result, identifying which operation it was for.
+        """
+        result = {"line": self.line, "op": self.op}
+        if self.ref is not None:
+            result["ref"] = self.ref
+        result.update(fields)
+        return result
+
+
+def parse_operation(line: int, text: str,
+                    user_email: Callable[[str], str]) -> Operation:
+    """Read an operation from a line of JSON, such as
+    '{"op": "mv", "ids": [1, 2], "column": "Done"}'.
+
+    Args:
+        line (int): The number of the line.
+        text (str): The line.
+        user_email (Callable[[str], str]): Gets the email of a user from what
+            was given for assign.
+
+    Returns:
+        Operation: The operation. If it was invalid, its error says why.
+    """
+    try:
+        data = json.loads(text)
+    except ValueError as err:
+        return Operation(line, error=f"Could not read JSON: {err}")
+    if not isinstance(data, dict):
+        return Operation(line, error="Each line should be a JSON object")
+
+    op = data.get("op")
+    ref = data.get("ref")
+    ids = data.get("ids", [data["id"]] if "id" in data else [])
+    if op not in READ_OPERATIONS | WRITE_OPERATIONS:
+        return Operation(line, op, ref=ref, error=f"Unknown op {op!r}")
+    if not isinstance(ids, list) or not ids \
+            or not all(isinstance(number, int) for number in ids):
+        return Operation(line, op, ref=ref,
+                         error="'ids' should be a list of work item IDs")
+
+    if op == "mv":
+        if not isinstance(data.get("column"), str):
+            return Operation(line, op, ref=ref, error="'column' is required")
+        return Operation(line, op, ids, data["column"], data.get("board"),
+                         ref)
+    if op == "assign":
+        if not isinstance(data.get("user"), str):
+            return Operation(line, op, ref=ref, error="'user' is required")
+        return Operation(line, op, ids, user_email(data["user"]), ref=ref)
+    return Operation(line, op, ids, ref=ref)
+
+
+def _field(operation: Operation) -> str:
+    """Get which field of its work items a write operation sets."""
+    return "column" if operation.op == "mv" else "assignee"
+
+
+def segments(operations: Iterable[Operation],
+             size: int = SEGMENT_SIZE
+             ) -> Generator[List[Operation], None, None]:
+    """Split operations into segments that can each be run together without
+    changing the outcome.
+
+    A segment is either all reads or all writes, so reads see the writes
+    before them and not the ones after. A write segment sets each field of a
+    work item at most once, so combining its writes doesn't reorder them.
+
+    Args:
+        operations (Iterable[Operation]): The operations, in order.
+        size (int): The most operations in a segment.
+
+    Yields:
+        List[Operation]: The segments, in order.
+    """
+    segment = []
+    kind = None
+    fields = {}
+    for operation in operations:
+        if operation.error is None:
+            op_kind = "read" if operation.op in READ_OPERATIONS else "write"
+            value = operation.value.lower() if op_kind == "write" else None
+            conflict = op_kind == "write" and any(
+                fields.get((number, _field(operation)), value) != value
+                for number in operation.ids)
+            if segment and (len(segment) >= size or conflict
+                            or (kind is not None and op_kind != kind)):
+                yield segment
+                segment = []
+                fields = {}
+            kind = op_kind
+            if op_kind == "write":
+                for number in operation.ids:
+                    fields[(number, _field(operation))] = value
+        segment.append(operation)
+    if segment:
+        yield segment
+
+
+class BatchRunner:
+    """BatchRunner runs operations over one connection.
+
+    Attributes:
+        api (AzureDevOpsAPI): The connection to run them on.
+    """
+    def __init__(self, api: "AzureDevOpsAPI") -> None:
+        self.api = api
+
+    def run(self, operations: Iterable[Operation]
+            ) -> Generator[dict, None, None]:
+        """Run operations.
+
+        Args:
+            operations (Iterable[Operation]): The operations to run. They are
+                taken from the iterable a segment at a time.
+
+        Yields:
+            dict: The result of each operation, in the order they were given.
+        """
+        for segment in segments(operations):
+            if any(operation.op in WRITE_OPERATIONS and operation.error is None
+                   for operation in segment):
+                yield from self._write(segment)
+            else:
+                yield from self._read(segment)
+
+    def _read(self, segment: List[Operation]) -> Generator[dict, None, None]:
+        """Run a segment of reads, fetching each work item once.
+
+        Args:
+            segment (List[Operation]): The operations.
+
+        Yields:
+            dict: The result of each operation.
+        """
+        from azure.devops.exceptions import AzureDevOpsServiceError
+        from msrest.exceptions import ClientRequestError
+        numbers = list(
+            dict.fromkeys(number for operation in segment
+                          if operation.error is None
+                          for number in operation.ids))
+        error = None
+        work_items = {}
+        try:
+            work_items = {
+                work_item.id_number: work_item
+                for work_item in self.api.get_work_items(numbers)
+            }
+        except (ClientRequestError, AzureDevOpsServiceError) as err:
+            error = str(err)
+
+        for operation in segment:
+            if operation.error is not None:
+                yield operation.result(ok=False, error=operation.error)
+                continue
+            if error is not None:
+                yield operation.result(ok=False, error=error)
+                continue
+            missing = [
+                number for number in operation.ids if number not in work_items
+            ]
+            yield operation.result(ok=not missing,
+                                   work_items=[
+                                       work_items[number].to_dict()
+                                       for number in operation.ids
+                                       if number in work_items
+                                   ],
+                                   missing=missing)
+
+    def _columns(self, segment: List[Operation]
+                 ) -> Dict[Tuple[str, Optional[str]], Optional[str]]:
+        """Check the columns work items are being moved to exist.
+
+        Args:
+            segment (List[Operation]): The operations.
+
+        Returns:
+            Dict[Tuple[str, Optional[str]], Optional[str]]: The name of each
+                column as the board spells it, or None if it didn't exist,
+                keyed by the column and board given.
+        """
+        columns = {}
+        for operation in segment:
+            key = (operation.value, operation.board)
+            if operation.op == "mv" and operation.error is None \
+                    and key not in columns:
+                columns[key] = self.api.match_column(*key)
+        return columns
+
+    def _write(self, segment: List[Operation]) -> Generator[dict, None, None]:
+        """Run a segment of writes, combining all of the changes to each work
+        item into one update, and all of the updates into bulk requests.
+
+        Args:
+            segment (List[Operation]): The operations.
+
+        Yields:
+            dict: The result of each operation.
+        """
+        from azure.devops.exceptions import AzureDevOpsServiceError
+        from azure.devops.v5_1.work_item_tracking.models import \
+            JsonPatchOperation
+        from msrest.exceptions import ClientRequestError
+        errors = {}
+        documents = {}
+        try:
+            columns = self._columns(segment)
+            moves = []
+            boards = {}
+            for operation in segment:
+                if operation.error is not None or operation.op != "mv":
+                    continue
+                column = columns[(operation.value, operation.board)]
+                if column is None:
+                    where = f"board '{operation.board}'" \
+                        if operation.board is not None else "any board"
+                    errors[operation.line] = \
+                        f"Column '{operation.value}' did not exist on {where}"
+                    continue
+                moves.append((operation, column))
+                boards.setdefault(operation.board, {}).update(
+                    dict.fromkeys(operation.ids))
+
+            # look up the column field of every work item on each board at once
+            field_names = {
+                board: self.api.get_column_field_names(list(numbers), board)
+                for board, numbers in boards.items()
+            }
+            for operation, column in moves:
+                for number in operation.ids:
+                    field_name = field_names[operation.board].get(number)
+                    if field_name is None:
+                        continue
+                    documents.setdefault(number, []).append(
+                        JsonPatchOperation(op="add",
+                                           path=f"/fields/{field_name}",
+                                           value=column))
+
+            for operation in segment:
+                if operation.error is None and operation.op == "assign":
+                    for number in operation.ids:
+                        documents.setdefault(number, []).append(
+                            JsonPatchOperation(
+                                op="add",
+                                path="/fields/System.AssignedTo",
+                                value=operation.value))
+
+            results = {
+                result.id_number: result
+                for result in self.api.update_work_items(documents)
+            } if documents else {}
+        except (ClientRequestError, AzureDevOpsServiceError) as err:
+            for operation in segment:
+                yield operation.result(ok=False,
+                                       error=operation.error or str(err))
+            return
+
+        for operation in segment:
+            error = operation.error or errors.get(operation.line)
+            if error is not None:
+                yield operation.result(ok=False, error=error)
+                continue
+            updated = []
+            failed = {}
+            for number in operation.ids:
+                result = results.get(number)
+                if result is None:
+                    failed[str(number)] = \
+                        f"Work item #{number} could not be found or is not " \
+                        "on a board"
+                elif result.succeeded:
+                    updated.append(number)
+                else:
+                    failed[str(number)] = result.error
+            yield operation.result(ok=not failed,
+                                   updated=updated,
+                                   errors=failed)
+
+
+def run_batch(api: "AzureDevOpsAPI", lines: Iterable[str],
+              user_email: Callable[[str], str]) -> Generator[dict, None, None]:
+    """Run operations read from lines of JSON.
+
+    Args:
+        api (AzureDevOpsAPI): The connection to run them on.
+        lines (Iterable[str]): The lines. Blank lines are skipped.
+        user_email (Callable[[str], str]): Gets the email of a user from what
+            was given for assign.
+
+    Yields:
+        dict: The result of each operation, in the order they were given.
+    """
+    operations = (parse_operation(number, line, user_email)
+                  for number, line in enumerate(lines, 1) if line.strip())
+    yield from BatchRunner(api).run(operations)
@@ -0,0 +1,125 @@
+"""cache.py
+
+This module contains a simple cache that persists between runs of the plugin,
+for things that are slow to get from Azure DevOps and rarely change.
+
+Author:
+    Sam Gibson <sgibson@glasswallsolutions.com>
+"""
+
+import json
+import logging
+import os
+import tempfile
+import time
+from typing import Any, Optional
+
+CACHE_DIR_ENV_VAR = "VICTORIA_PBI_CACHE_DIR"
+"""An environment variable that can be used to override where the cache is
+stored."""
+
+
+def default_cache_dir() -> str:
+    """Get the default directory to store the cache in.
+
+    Returns:
+        str: The path to the cache directory.
+    """
+    if os.environ.get(CACHE_DIR_ENV_VAR):
+        return os.environ[CACHE_DIR_ENV_VAR]
+    cache_home = os.environ.get("XDG_CACHE_HOME") \
+        or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "victoria_pbi")
+
+
+class DiskCache:
+    """A cache of JSON serialisable values that is stored in a file on disk.
+    Each entry expires a given number of seconds after it was stored.
+
+    Problems reading or writing the file are logged and otherwise ignored, as
+    the cache is only there to save on requests.
+
+    Attributes:
+        path (str): The path of the file the cache is stored in.
+        ttl (float): How many seconds entries are kept for.
+    """
+    def __init__(self, name: str, ttl: float, directory: str = None) -> None:
+        """Create a cache.
+
+        Args:
+            name (str): The name of the cache. Used as the file name.
+            ttl (float): How many seconds entries are kept for.
+            directory (str): The directory to store the cache in. Defaults to
+                default_cache_dir().
+        """
+        directory = directory or default_cache_dir()
+        self.path = os.path.join(directory, f"{name}.json")
+        self.ttl = ttl
+
+    def _load(self) -> dict:
+        """Load all entries from the cache file.
+
+        Returns:
+            dict: The entries, or an empty dict if the file could not be read.
+        """
+        try:
+            with open(self.path) as cache_file:
+                return json.load(cache_file)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as err:
+            logging.debug(f"Could not read cache '{self.path}': {err}")
+            return {}
+
+    def _save(self, entries: dict) -> None:
+        """Save all entries to the cache file. The file is replaced atomically
+        so concurrent runs never see half of it.
+
+        Args:
+            entries (dict): The entries to save.
+        """
+        directory = os.path.dirname(self.path)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, "w") as cache_file:
+                json.dump(entries, cache_file)
+            os.replace(temp_path, self.path)
+        except OSError as err:
+            logging.debug(f"Could not write cache '{self.path}': {err}")
+
+    def get(self, key: str) -> Optional[Any]:
+        """Get an entry from the cache.
+
+        Args:
+            key (str): The key of the entry.
+
+        Returns:
+            Any: The value of the entry, or None if it wasn't in the cache or
+                has expired.
+        """
+        entry = self._load().get(key)
+        if entry is None or time.time() - entry["time"] > self.ttl:
+            return None
+        return entry["value"]
+
+    def set(self, key: str, value: Any) -> None:
+        """Store an entry in the cache.
+
+        Args:
+            key (str): The key of the entry.
+            value (Any): The JSON serialisable value to store.
+        """
+        entries = self._load()
+        entries[key] = {"time": time.time(), "value": value}
+        self._save(entries)
+
+    def delete(self, key: str) -> None:
+        """Remove an entry from the cache, if it's there.
+
+        Args:
+            key (str): The key of the entry.
+        """
+        entries = self._load()
+        if entries.pop(key, None) is not None:
+            self._save(entries)
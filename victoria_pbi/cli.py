@@ -5,69 +5,524 @@ This is the module that contains the Click CLI for the PBI plugin.
 Author:
     Sam Gibson <sgibson@glasswallsolutions.com
 """
+import json
 import logging
-from typing import List, Iterable
+import os
+import sys
+import time
+from typing import Dict, IO, List, Iterable, Optional, TYPE_CHECKING
 
 import click
 import colorama
-from tabulate import tabulate
 
 from .config import PBIConfig
-from .pbi import AzureDevOpsAPI, AzureDevOpsServiceError, WorkItemContainer
+from .output import OUTPUT_FORMATS, StreamingTable, print_work_item_tree, \
+    write_work_items
+
+# the API wrapper imports the Azure DevOps SDK, which is slow to import, and
+# Victoria imports every plugin on startup, so we only import it when a
+# command actually needs it. Commands only import the SDK's exceptions
+# themselves, which are much quicker to import, so they stay quick when they
+# are sent to the daemon
+if TYPE_CHECKING:
+    from .instrumentation import Instrumentation
+    from .pbi import AzureDevOpsAPI, WorkItemContainer
+    from .replica import Replica
+    from .targets import MultiTargetAPI
+    from .workitem import Change, FieldInfo
+
+TIMINGS_HOOK_ENV_VAR = "VICTORIA_PBI_TIMINGS_HOOK"
+"""An environment variable naming a function to pass the timing of every
+request and stage to, as 'module:function'. Used to forward them to a metrics
+system."""
+
+INSTRUMENTATION_KEY = "victoria_pbi.instrumentation"
+"""The key the instrumentation is stored under in the Click context, if
+timings are being recorded."""
+
+COLOUR_KEY = "victoria_pbi.colour"
+"""The key in the Click context saying colour has been set up for the
+terminal, so it's only done once per command."""
+
+DEFAULT_WATCH_INTERVAL = 30
+"""How many seconds watch waits between checking for changes by default."""
+
+
+def _instrumentation() -> Optional["Instrumentation"]:
+    """Get the instrumentation for the current command.
+
+    Returns:
+        Instrumentation: The instrumentation, or None if timings aren't being
+            recorded.
+    """
+    ctx = click.get_current_context(silent=True)
+    return ctx.meta.get(INSTRUMENTATION_KEY) if ctx is not None else None
+
+
+def _connect(cfg: PBIConfig) -> "AzureDevOpsAPI":
+    """Connect to the Azure DevOps API, through the daemon if it's running.
+
+    Args:
+        cfg (PBIConfig): The config to use to connect to the API.
+
+    Returns:
+        AzureDevOpsAPI: The connection. If the daemon is running this is a
+            DaemonClient, which has the same methods.
+    """
+    instrumentation = _instrumentation()
+    # timings are of the requests this process sends, so they skip the daemon
+    if instrumentation is None:
+        from .daemon import connect
+        client = connect(cfg)
+        if client is not None:
+            return client
+
+    from .pbi import AzureDevOpsAPI
+    return AzureDevOpsAPI(cfg, instrumentation=instrumentation)
+
+
+def _connect_targets(cfg: PBIConfig) -> "MultiTargetAPI":
+    """Connect to the project in the config and every one of its targets, to
+    get work items from all of them at once.
+
+    Args:
+        cfg (PBIConfig): The config with the targets.
+
+    Returns:
+        MultiTargetAPI: The connection to the targets. Errors from a target
+            are logged, and the other targets carry on.
+    """
+    from azure.devops.exceptions import AzureDevOpsServiceError
+    from msrest.exceptions import ClientRequestError
+    from .daemon import DaemonError
+    from .targets import MultiTargetAPI
+    return MultiTargetAPI(
+        cfg.target_configs(), _connect,
+        (AzureDevOpsServiceError, ClientRequestError, DaemonError))
+
+
+def _user_email(cfg: PBIConfig, user: str) -> str:
+    """Get the email of a user, adding the domain from the config if it was
+    just a username.
+
+    Args:
+        cfg (PBIConfig): The config to get the domain from.
+        user (str): The username or email.
+
+    Returns:
+        str: The email.
+    """
+    if user.find("@") == -1:
+        user += "@" + cfg.email.split("@")[1]
+    return user
+
+
+def _user_emails(cfg: PBIConfig, users: Iterable[str]) -> List[str]:
+    """Get the emails of users, expanding the names of teams from the config
+    into their members.
+
+    Args:
+        cfg (PBIConfig): The config to get the teams and domain from.
+        users (Iterable[str]): The usernames, emails or team names. If there
+            are none, the user in the config is used.
+
+    Returns:
+        List[str]: The emails, without duplicates.
+    """
+    emails = {}
+    for user in users:
+        for member in cfg.teams.get(user, [user]):
+            email = _user_email(cfg, member)
+            emails.setdefault(email.lower(), email)
+    return list(emails.values()) or [cfg.email]
+
+
+def _replica(cfg: PBIConfig) -> "Replica":
+    """Open the local replica of the project's work items.
+
+    Args:
+        cfg (PBIConfig): The config of the project.
+
+    Returns:
+        Replica: The replica.
+    """
+    from .replica import Replica
+    return Replica(cfg.organisation, cfg.project, cfg.cache.directory)
+
+
+def _offline_replica(cfg: PBIConfig) -> Optional["Replica"]:
+    """Open the local replica to answer a command from, saying how out of date
+    it is.
+
+    Args:
+        cfg (PBIConfig): The config of the project.
+
+    Returns:
+        Replica: The replica, or None if it has never been synced.
+    """
+    from .replica import describe_age
+    replica = _replica(cfg)
+    age = replica.age()
+    if age is None:
+        logging.error("The replica has not been synced yet")
+        click.echo("\tTry running 'victoria pbi sync' first.", err=True)
+        return None
+    click.echo(f"Using the replica, synced {describe_age(age)}.", err=True)
+    return replica
+
+
+def _fields(cfg: PBIConfig, conn: "AzureDevOpsAPI", names: Optional[str],
+            offline: bool) -> Optional[List["FieldInfo"]]:
+    """Find the fields to show as well as the default ones.
+
+    Args:
+        cfg (PBIConfig): The config, with the fields to show by default.
+        conn (AzureDevOpsAPI): The connection to look the fields up with.
+        names (str): The comma separated names of the fields that were asked
+            for, or None to use the ones in the config.
+        offline (bool): Whether the work items are coming from the replica,
+            which only has the default fields.
+
+    Returns:
+        List[FieldInfo]: The fields, or None if they couldn't be found.
+    """
+    from azure.devops.exceptions import AzureDevOpsServiceError
+    names = [name for name in names.split(",") if name.strip()] \
+        if names is not None else cfg.fields
+    if not names:
+        return []
+    if offline:
+        logging.error("Only the default fields are in the replica")
+        click.echo("\tTry again without --offline, or with --fields ''.",
+                   err=True)
+        return None
+    try:
+        return conn.resolve_fields(names)
+    except ValueError as err:
+        logging.error(err)
+        click.echo("\tTry running 'victoria pbi fields' to view all fields.",
+                   err=True)
+    except AzureDevOpsServiceError as err:
+        logging.error(err)
+    return None
+
+
+FIELDS_HELP = "Comma separated names of fields to show as well as the " \
+    "default ones, i.e. 'Effort,Iteration Path'. Defaults to the fields in " \
+    "the config."
+"""The help text of the --fields option."""
+
+OUTPUT_HELP = "How to print the work items. 'jsonl', 'csv' and 'tsv' are " \
+    "for other programs to read, and print each work item as soon as it " \
+    "arrives, without colour."
+"""The help text of the --output option."""
+
+PLAN_HELP = "Show which work items would change, without changing them."
+"""The help text of the --plan option."""
 
 
 @click.group()
-@click.pass_obj
-def pbi(cfg: PBIConfig):
+@click.option('--timings',
+              is_flag=True,
+              help="Print how long each request to Azure DevOps took when "
+              "the command finishes.")
+@click.option('--timings-json',
+              type=click.File('w'),
+              default=None,
+              help="Write a line of JSON for each request to Azure DevOps, "
+              "and each stage of the command, to this file.")
+@click.pass_context
+def pbi(ctx: click.Context, timings: bool, timings_json: IO):
     """Manipulate Azure DevOps PBIs."""
-    colorama.init()
+    hook = os.environ.get(TIMINGS_HOOK_ENV_VAR)
+    if not (timings or timings_json or hook):
+        return
+
+    from .instrumentation import Instrumentation, load_hook
+    instrumentation = Instrumentation()
+    if hook:
+        try:
+            instrumentation.add_hook(load_hook(hook))
+        except (ValueError, ImportError, AttributeError) as err:
+            logging.error(f"Could not load timings hook '{hook}': {err}")
+    ctx.meta[INSTRUMENTATION_KEY] = instrumentation
+
+    def report():
+        if timings:
+            click.echo(instrumentation.summary(), err=True)
+        if timings_json:
+            instrumentation.write_json(timings_json)
+
+    ctx.call_on_close(report)
 
 
 @pbi.command()
 @click.argument('id', nargs=-1, type=int, required=True)
+@click.option('--offline',
+              is_flag=True,
+              help="Get the work items from the local replica rather than "
+              "Azure DevOps.")
+@click.option('-f', '--fields', type=str, default=None, help=FIELDS_HELP)
+@click.option('-o',
+              '--output',
+              type=click.Choice(OUTPUT_FORMATS),
+              default="table",
+              show_default=True,
+              help=OUTPUT_HELP)
+@click.option('--tree',
+              is_flag=True,
+              help="Show the work items under them too, i.e. the features of "
+              "an epic and their PBIs and tasks.")
+@click.option('--depth',
+              type=click.IntRange(min=0),
+              default=None,
+              help="How many levels under the work items to show. Implies "
+              "--tree. Defaults to all of them.")
 @click.pass_obj
-def get(cfg: PBIConfig, id: List[int]):
+def get(cfg: PBIConfig, id: List[int], offline: bool, fields: str,
+        output: str, tree: bool, depth: int):
     """Get work item(s) by ID."""
-    conn = AzureDevOpsAPI(cfg)
-    print_work_items(conn.get_work_items(id))
+    tree = tree or depth is not None
+    if tree and (offline or output != "table"):
+        raise click.UsageError(
+            "--tree can't be used with --offline or --output")
+    # trees are only got from the project at the top of the config
+    sources = bool(cfg.targets) and not offline and not tree
+    if offline:
+        conn = _offline_replica(cfg)
+    else:
+        conn = _connect_targets(cfg) if sources else _connect(cfg)
+    if conn is None:
+        return
+    fields = _fields(cfg, conn, fields, offline)
+    if fields is None:
+        return
+    # the replica doesn't take fields, but they're never asked of it
+    names = [field.reference_name for field in fields]
+    if tree:
+        from azure.devops.exceptions import AzureDevOpsServiceError
+        try:
+            print_work_items(conn.get_work_item_tree(id, depth, names),
+                             fields,
+                             tree=True)
+        except AzureDevOpsServiceError as err:
+            logging.error(err)
+        return
+    print_work_items(
+        conn.get_work_items(id, names) if names else conn.get_work_items(id),
+        fields, output, sources=sources)
+
+
+@pbi.command()
+@click.argument('users', nargs=-1, type=str, required=False)
+@click.option('-t',
+              '--top',
+              type=click.IntRange(min=1),
+              default=None,
+              help="The maximum number of work items to list.")
+@click.option('--offline',
+              is_flag=True,
+              help="List the work items from the local replica rather than "
+              "Azure DevOps.")
+@click.option('-f', '--fields', type=str, default=None, help=FIELDS_HELP)
+@click.option('-o',
+              '--output',
+              type=click.Choice(OUTPUT_FORMATS),
+              default="table",
+              show_default=True,
+              help=OUTPUT_HELP)
+@click.pass_obj
+def ls(cfg: PBIConfig, users: List[str], top: int, offline: bool,
+       fields: str, output: str):
+    """List work items. Optionally specify USERS to get work items for, or
+    the name of a team from the config."""
+    emails = _user_emails(cfg, users)
+    sources = bool(cfg.targets) and not offline
+    if offline:
+        conn = _offline_replica(cfg)
+    else:
+        conn = _connect_targets(cfg) if sources else _connect(cfg)
+    if conn is None:
+        return
+    fields = _fields(cfg, conn, fields, offline)
+    if fields is None:
+        return
+
+    user = emails[0] if len(emails) == 1 else emails
+    names = [field.reference_name for field in fields]
+    work_items = conn.get_user_pbis(user, top, names) if names \
+        else conn.get_user_pbis(user, top)
+    if len(emails) == 1 or output != "table":
+        # every record says who it's assigned to, so other programs can group
+        # them, without holding every work item in memory to sort them
+        print_work_items(work_items, fields, output, sources=sources)
+        return
+
+    # group the work items by assignee, in the order the users were given
+    order = {email.lower(): index for index, email in enumerate(emails)}
+    work_items = sorted(
+        work_items,
+        key=lambda item: (order.get(item.assigned_to.lower(), len(order)),
+                          item.id_number))
+    if work_items:
+        print_work_items(work_items, fields, sources=sources)
 
 
 @pbi.command()
 @click.argument('user', nargs=1, type=str, required=False, default=None)
+@click.option('-n',
+              '--interval',
+              type=click.FloatRange(min=1),
+              default=DEFAULT_WATCH_INTERVAL,
+              show_default=True,
+              help="How many seconds to wait between checking for changes.")
 @click.pass_obj
-def ls(cfg: PBIConfig, user: str):
-    """List work items. Optionally specify USER to get work items for."""
-    if user is None:
-        # if no user is specified, use the one in the config
-        user = cfg.email
-    elif user.find("@") == -1:
-        # if the user specified wasn't an email, add the domain from the config
-        user += "@" + cfg.email.split("@")[1]
+def watch(cfg: PBIConfig, user: str, interval: float):
+    """Watch work items, printing them as they change. Optionally specify
+    USER to watch work items for."""
+    from msrest.exceptions import ClientRequestError
+    from azure.devops.exceptions import AzureDevOpsServiceError
+    from .watch import Watcher
 
-    conn = AzureDevOpsAPI(cfg)
-    print_work_items(conn.get_user_pbis(user))
+    user = _user_email(cfg, user) if user is not None else cfg.email
+    watcher = Watcher(_connect(cfg), user)
+    try:
+        while True:
+            try:
+                changed = watcher.poll()
+            except (ClientRequestError, AzureDevOpsServiceError) as err:
+                # try again next time, the same changes will be picked up
+                logging.error(f"Could not check for changes: {err}")
+                changed = []
+            if changed:
+                print(time.strftime("%H:%M:%S"))
+                print_work_items(changed)
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        return
+
+
+@pbi.command()
+@click.option('--full',
+              is_flag=True,
+              help="Fetch every work item rather than only the ones changed "
+              "since the last sync, and drop any that were deleted.")
+@click.pass_obj
+def sync(cfg: PBIConfig, full: bool):
+    """Update the local replica of the project's work items."""
+    from azure.devops.exceptions import AzureDevOpsServiceError
+    replica = _replica(cfg)
+    conn = _connect(cfg)
+    try:
+        fetched = replica.sync(conn, full)
+    except AzureDevOpsServiceError as err:
+        logging.error(err)
+        return
+    print(f"Fetched {fetched} changed work items. The replica has "
+          f"{replica.count()} work items.")
 
 
 @pbi.command()
 @click.argument('board', nargs=1, type=str, required=True)
+@click.option('--refresh',
+              is_flag=True,
+              help="Get board metadata from Azure DevOps even if it is "
+              "cached.")
 @click.pass_obj
-def columns(cfg: PBIConfig, board: str):
+def columns(cfg: PBIConfig, board: str, refresh: bool):
     """List BOARD columns."""
-    conn = AzureDevOpsAPI(cfg)
+    from azure.devops.exceptions import AzureDevOpsServiceError
+    conn = _connect(cfg)
     try:
-        for col in conn.get_board_states(board):
+        for col in conn.get_board_states(board, refresh):
             print(col)
     except AzureDevOpsServiceError:
         print("\tTry running 'victoria pbi boards' to view all boards.")
 
 
 @pbi.command()
+@click.argument('board', nargs=1, type=str, required=True)
+@click.option('--offline',
+              is_flag=True,
+              help="Count the work items in the local replica rather than "
+              "in Azure DevOps.")
+@click.option('--refresh',
+              is_flag=True,
+              help="Get board metadata from Azure DevOps even if it is "
+              "cached.")
+@click.pass_obj
+def stats(cfg: PBIConfig, board: str, offline: bool, refresh: bool):
+    """Count the work items on BOARD by column, state and assignee."""
+    from msrest.exceptions import ClientRequestError
+    from azure.devops.exceptions import AzureDevOpsServiceError
+    conn = _connect(cfg)
+    if not offline:
+        try:
+            print_stats(conn.get_board_stats(board, refresh))
+            return
+        except AzureDevOpsServiceError as err:
+            logging.error(err)
+            print("\tTry running 'victoria pbi boards' to view all boards.")
+            return
+        except ClientRequestError as err:
+            # count what we have instead
+            logging.error(f"Could not reach Azure DevOps: {err}")
+
+    replica = _offline_replica(cfg)
+    if replica is None:
+        return
+    try:
+        # the board's metadata is cached, so this works without a connection
+        # as long as stats has been run for the board before
+        result = replica.get_board_stats(conn.get_board_areas(board),
+                                         list(conn.get_board_states(board)),
+                                         conn.get_states(),
+                                         conn.get_board_members(board))
+    except (ClientRequestError, AzureDevOpsServiceError, ValueError) as err:
+        logging.error(f"Could not count the work items on '{board}' in the "
+                      f"replica: {err}")
+        return
+    print_stats(result)
+
+
+@pbi.command()
+@click.option('--refresh',
+              is_flag=True,
+              help="Get the fields from Azure DevOps even if they are cached.")
+@click.pass_obj
+def fields(cfg: PBIConfig, refresh: bool):
+    """List the fields work items can have, which can be shown with
+    --fields."""
+    from azure.devops.exceptions import AzureDevOpsServiceError
+    conn = _connect(cfg)
+    try:
+        work_item_fields = sorted(conn.get_fields(refresh),
+                                  key=lambda field: field.name.lower())
+    except AzureDevOpsServiceError as err:
+        logging.error(err)
+        return
+    StreamingTable(["Name", "Reference name", "Type"]).print_rows(
+        [field.name, field.reference_name, field.type]
+        for field in work_item_fields)
+
+
+@pbi.command()
+@click.option('--refresh',
+              is_flag=True,
+              help="Get board metadata from Azure DevOps even if it is "
+              "cached.")
 @click.pass_obj
-def boards(cfg: PBIConfig):
+def boards(cfg: PBIConfig, refresh: bool):
     """List boards."""
-    conn = AzureDevOpsAPI(cfg)
+    from azure.devops.exceptions import AzureDevOpsServiceError
+    if cfg.targets:
+        StreamingTable(["Board", "Source"]).print_rows(
+            [board, name]
+            for name, board in _connect_targets(cfg).get_boards(refresh))
+        return
+    conn = _connect(cfg)
     try:
-        for board in conn.get_boards():
+        for board in conn.get_boards(refresh):
             print(board)
     except AzureDevOpsServiceError:
         return
@@ -76,59 +531,271 @@ def boards(cfg: PBIConfig):
 @pbi.command()
 @click.argument('id', nargs=-1, type=int, required=True)
 @click.argument('user', nargs=1, type=str, required=True)
+@click.option('--plan', is_flag=True, help=PLAN_HELP)
 @click.pass_obj
-def assign(cfg: PBIConfig, id: List[int], user: str):
-    """Assign work item(s) to someone by IDs and USER."""
-    if user.find("@") == -1:
-        # if the user specified wasn't an email, add the domain from the config
-        user += "@" + cfg.email.split("@")[1]
+def assign(cfg: PBIConfig, id: List[int], user: str, plan: bool):
+    """Assign work item(s) to someone by IDs and USER. Work items already
+    assigned to them are left as they are."""
+    from azure.devops.exceptions import AzureDevOpsServiceError
+    user = _user_email(cfg, user)
+    conn = _connect(cfg)
+    try:
+        changes = conn.plan_assign(id, user)
+        if plan:
+            print_plan(changes, "Unassigned")
+            return
 
-    conn = AzureDevOpsAPI(cfg)
-    for pbi_id in id:
-        conn.assign_work_item(pbi_id, user)
+        unchanged = 0
+        for result in conn.apply_changes(changes):
+            if not result.succeeded:
+                logging.error(
+                    f"Could not assign work item #{result.id_number}: "
+                    f"{result.error}")
+            elif not result.changed:
+                unchanged += 1
+        if unchanged:
+            print(
+                f"{unchanged} work item(s) were already assigned to {user}.")
+    except AzureDevOpsServiceError as err:
+        logging.error(err)
 
 
 @pbi.command()
 @click.argument('id', nargs=-1, type=int, required=True)
 @click.argument('column', nargs=1, type=str, required=True)
+@click.option('-b',
+              '--board',
+              type=str,
+              default=None,
+              help="The board the work items are on. Saves looking up "
+              "the column field from each work item.")
+@click.option('--refresh',
+              is_flag=True,
+              help="Get board metadata from Azure DevOps even if it is "
+              "cached.")
+@click.option('--plan', is_flag=True, help=PLAN_HELP)
 @click.pass_obj
-def mv(cfg: PBIConfig, id: List[int], column: str):
-    """Move work item(s) by IDs to a different COLUMN."""
-    conn = AzureDevOpsAPI(cfg)
+def mv(cfg: PBIConfig, id: List[int], column: str, board: str, refresh: bool,
+       plan: bool):
+    """Move work item(s) by IDs to a different COLUMN. Work items already in
+    the column are left as they are."""
+    from azure.devops.exceptions import AzureDevOpsServiceError
+    conn = _connect(cfg)
     try:
-        for pbi_id in id:
-            conn.move_work_item(pbi_id, column)
+        # check the column exists before sending any updates, so a typo fails
+        # straight away instead of once per work item
+        matched = conn.match_column(column, board, refresh)
+        if matched is None:
+            where = f"board '{board}'" if board is not None else "any board"
+            logging.error(f"Column '{column}' did not exist on {where}")
+            print("\tTry running 'victoria pbi columns BOARD' to view the "
+                  "columns of a board, or --refresh if it was just added.")
+            return
+        column = matched
+
+        changes = conn.plan_move(id, column, board)
+        if plan:
+            print_plan(changes, "-")
+            return
+
+        unchanged = 0
+        for result in conn.apply_changes(changes):
+            if result.succeeded:
+                if not result.changed:
+                    unchanged += 1
+                continue
+            if result.error.startswith("TF401320"):
+                logging.error(f"Could not move work item #{result.id_number}: "
+                              f"column '{column}' did not exist")
+            else:
+                logging.error(f"Could not move work item #{result.id_number}: "
+                              f"{result.error}")
+        if unchanged:
+            print(f"{unchanged} work item(s) were already in '{column}'.")
     except AzureDevOpsServiceError as err:
-        if err.message.startswith("TF401320"):
-            logging.error(
-                f"Could not move work item: column '{column}' did not exist")
-        else:
-            logging.error(err)
+        logging.error(err)
+
+
+@pbi.command()
+@click.argument('file', type=click.File('r'), default='-')
+@click.pass_obj
+def batch(cfg: PBIConfig, file: IO):
+    """Run many get, mv and assign operations, one JSON object per line of
+    FILE, or of stdin if FILE isn't given. Prints the result of each as a line
+    of JSON, in the same order."""
+    from .batch import run_batch
+    conn = _connect(cfg)
+    try:
+        for result in run_batch(conn, file,
+                                lambda user: _user_email(cfg, user)):
+            click.echo(json.dumps(result))
+    except BrokenPipeError:
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+
+
+@pbi.group()
+def daemon():
+    """Run a background process that keeps the connection to Azure DevOps
+    open, so commands start faster."""
+
+
+@daemon.command('start')
+@click.option('--foreground',
+              is_flag=True,
+              help="Run the daemon in this terminal until Ctrl+C, rather "
+              "than in the background.")
+@click.option('--idle-timeout',
+              type=click.FloatRange(min=0),
+              default=None,
+              help="How many seconds to wait for a command before stopping, "
+              "or 0 to never stop. Defaults to an hour.")
+@click.pass_obj
+def daemon_start(cfg: PBIConfig, foreground: bool, idle_timeout: float):
+    """Start the daemon."""
+    from .daemon import DEFAULT_IDLE_TIMEOUT, Daemon, DaemonError, start
+    if idle_timeout is None:
+        idle_timeout = DEFAULT_IDLE_TIMEOUT
+    try:
+        if foreground:
+            Daemon(cfg, idle_timeout).serve()
+            return
+        status = start(cfg, idle_timeout)
+    except DaemonError as err:
+        logging.error(err)
+        return
+    print(f"Started the daemon (pid {status['pid']}).")
+
+
+@daemon.command('stop')
+@click.pass_obj
+def daemon_stop(cfg: PBIConfig):
+    """Stop the daemon."""
+    from .daemon import stop
+    if stop(cfg) is None:
+        print("The daemon was not running.")
+    else:
+        print("Stopped the daemon.")
+
+
+@daemon.command('restart')
+@click.option('--idle-timeout',
+              type=click.FloatRange(min=0),
+              default=None,
+              help="How many seconds to wait for a command before stopping, "
+              "or 0 to never stop. Defaults to an hour.")
+@click.pass_obj
+def daemon_restart(cfg: PBIConfig, idle_timeout: float):
+    """Restart the daemon, i.e. to use a new config."""
+    from .daemon import DEFAULT_IDLE_TIMEOUT, DaemonError, start, stop
+    stop(cfg)
+    try:
+        status = start(cfg, idle_timeout if idle_timeout is not None else
+                       DEFAULT_IDLE_TIMEOUT)
+    except DaemonError as err:
+        logging.error(err)
+        return
+    print(f"Started the daemon (pid {status['pid']}).")
 
 
-def print_work_items(work_items: Iterable[WorkItemContainer]):
-    headers = ["ID", "Type", "Title", "State", "Assignee"]
-    table = []
-    for work_item in work_items:
-        item_type = "PBI" if work_item.work_type == "Product Backlog Item" \
-            else work_item.work_type
-
-        # figure out which colour to print the state as
-        state_colour = colorama.Fore.WHITE
-        if work_item.state == "New" or work_item.state == "Approved":
-            state_colour = colorama.Fore.LIGHTWHITE_EX
-        elif work_item.board_column == "On Hold":
-            state_colour = colorama.Fore.RED
-        elif work_item.state == "In Development":
-            state_colour = colorama.Fore.YELLOW
-        elif work_item.state == "Validation":
-            state_colour = colorama.Fore.BLUE
-        elif work_item.state == "Done":
-            state_colour = colorama.Fore.GREEN
-        state = f"{state_colour}● {colorama.Style.RESET_ALL}{work_item.board_column}"
-
-        table.append([
-            f"#{work_item.id_number}", item_type, work_item.title, state,
-            work_item.assigned_to
-        ])
-    print(tabulate(table, headers, tablefmt="plain"))
\ No newline at end of file
+@daemon.command('status')
+@click.pass_obj
+def daemon_status(cfg: PBIConfig):
+    """Say whether the daemon is running."""
+    from .daemon import connect
+    from .replica import describe_age
+    client = connect(cfg)
+    if client is None:
+        print("The daemon is not running.")
+        return
+    status = client.call("status")
+    print(f"The daemon is running (pid {status['pid']}). It started "
+          f"{describe_age(time.time() - status['started'])} and has handled "
+          f"{status['requests']} requests.")
+
+
+def _init_colour():
+    """Set up the terminal for printing colours, once per command."""
+    ctx = click.get_current_context(silent=True)
+    if ctx is not None and ctx.meta.get(COLOUR_KEY):
+        return
+    colorama.init()
+    if ctx is not None:
+        ctx.meta[COLOUR_KEY] = True
+
+
+def print_stats(stats: Dict[str, Dict[str, int]]) -> None:
+    """Print the counts of the work items on a board, with the columns in the
+    board's order and the rest from the most work items to the least.
+
+    Args:
+        stats (Dict[str, Dict[str, int]]): The counts, from get_board_stats().
+    """
+    tables = [("Column", "Work items", list(stats["column"].items())),
+              ("State", "Work items",
+               sorted(stats["state"].items(), key=lambda item: -item[1])),
+              ("Assignee", "Open work items",
+               sorted(stats["assignee"].items(), key=lambda item: -item[1]))]
+    for index, (name, header, counts) in enumerate(tables):
+        if index:
+            print()
+        StreamingTable([name, header]).print_rows(
+            [key, str(count)] for key, count in counts)
+
+
+def print_plan(changes: List["Change"], unset: str) -> None:
+    """Print which work items changes would change, and how.
+
+    Args:
+        changes (List[Change]): The changes.
+        unset (str): What to show for fields that aren't set.
+    """
+    changed = [change for change in changes if change.changed]
+    if changed:
+        StreamingTable(["ID", "From", "To", "Title"]).print_rows(
+            [f"#{change.id_number}", change.old or unset, change.new,
+             change.work_item.title] for change in changed)
+    print(f"{len(changed)} of {len(changes)} work item(s) would change.")
+
+
+def print_work_items(work_items: Iterable["WorkItemContainer"],
+                     fields: List["FieldInfo"] = None,
+                     output: str = "table",
+                     tree: bool = False,
+                     sources: bool = False):
+    """Print work items, as a table by default. Work items are printed as
+    they arrive, so the first ones show up without waiting for the rest.
+
+    Args:
+        work_items (Iterable[WorkItemContainer]): The work items to print.
+        fields (List[FieldInfo]): The other fields to show, after the default
+            ones.
+        output (str): Which of the OUTPUT_FORMATS to print them in.
+        tree (bool): Whether the work items are trees, from
+            get_work_item_tree(), to print as an indented table.
+        sources (bool): Whether to show which target each work item came
+            from.
+    """
+    if output == "table":
+        # only tables are coloured, and colorama checks every write to strip
+        # the colours when they aren't going to a terminal
+        _init_colour()
+    instrumentation = _instrumentation()
+    if instrumentation is not None:
+        # split the time spent waiting for work items from the time spent
+        # printing them
+        work_items = instrumentation.timed_iter(work_items, "fetch", "print")
+    try:
+        if tree:
+            print_work_item_tree(work_items, fields=fields)
+        else:
+            write_work_items(work_items,
+                             output,
+                             fields=fields,
+                             sources=sources)
+    except BrokenPipeError:
+        # whatever we were piped into stopped reading (i.e. head), so stop
+        # quietly and point stdout somewhere harmless so Python doesn't
+        # complain when it flushes it on exit
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
@@ -7,8 +7,167 @@ Author:
     Sam Gibson <sgibson@glasswallsolutions.com>
 """
 
+import copy
+from typing import Dict, List
+
 from marshmallow import Schema, fields, post_load
 
+DEFAULT_DISCOVERY_TTL = 7 * 24 * 60 * 60
+"""How many seconds to cache Azure DevOps service discovery for by default.
+It only changes if an organisation is moved, so it can be kept for a while."""
+
+DEFAULT_METADATA_TTL = 24 * 60 * 60
+"""How many seconds to cache board metadata, such as the boards in a project
+and their columns, for by default."""
+
+DEFAULT_POOL_SIZE = 8
+"""How many connections to Azure DevOps to keep open by default. This is also
+how many requests are sent at once when an operation is split up."""
+
+DEFAULT_TIMEOUT = 30
+"""How many seconds to wait for Azure DevOps to respond by default."""
+
+DEFAULT_RETRIES = 5
+"""How many times to retry a throttled or failed request by default."""
+
+
+class TransportConfigSchema(Schema):
+    """Marshmallow schema for the transport section of the PBI plugin
+    config."""
+    pool_size = fields.Int()
+    keep_alive = fields.Bool()
+    timeout = fields.Float()
+    compression = fields.Bool()
+    retries = fields.Int()
+
+    @post_load
+    def create_transport_config(self, data, **kwargs):
+        return TransportConfig(**data)
+
+
+class TransportConfig:
+    """TransportConfig is the config for how the PBI plugin connects to Azure
+    DevOps over HTTP.
+
+    Attributes:
+        pool_size (int): The maximum number of connections to keep open.
+        keep_alive (bool): Whether to reuse connections between requests.
+        timeout (float): How many seconds to wait for a response.
+        compression (bool): Whether to ask for compressed responses.
+        retries (int): How many times to retry a request that was throttled or
+            failed in a way that may succeed if sent again.
+    """
+    def __init__(self,
+                 pool_size: int = DEFAULT_POOL_SIZE,
+                 keep_alive: bool = True,
+                 timeout: float = DEFAULT_TIMEOUT,
+                 compression: bool = True,
+                 retries: int = DEFAULT_RETRIES) -> None:
+        self.pool_size = pool_size
+        self.keep_alive = keep_alive
+        self.timeout = timeout
+        self.compression = compression
+        self.retries = retries
+
+    def __eq__(self, other):
+        if isinstance(self, other.__class__):
+            return self.pool_size == other.pool_size \
+                and self.keep_alive == other.keep_alive \
+                and self.timeout == other.timeout \
+                and self.compression == other.compression \
+                and self.retries == other.retries
+        return False
+
+
+class CacheConfigSchema(Schema):
+    """Marshmallow schema for the cache section of the PBI plugin config."""
+    directory = fields.Str()
+    discovery_ttl = fields.Int()
+    metadata_ttl = fields.Int()
+
+    @post_load
+    def create_cache_config(self, data, **kwargs):
+        return CacheConfig(**data)
+
+
+class CacheConfig:
+    """CacheConfig is the config for the caches the PBI plugin keeps between
+    runs.
+
+    Attributes:
+        directory (str): The directory to store caches in. If None the default
+            cache directory is used.
+        discovery_ttl (int): How many seconds to cache service discovery for.
+            0 disables the cache.
+        metadata_ttl (int): How many seconds to cache board metadata for. 0
+            disables the cache.
+    """
+    def __init__(self,
+                 directory: str = None,
+                 discovery_ttl: int = DEFAULT_DISCOVERY_TTL,
+                 metadata_ttl: int = DEFAULT_METADATA_TTL) -> None:
+        self.directory = directory
+        self.discovery_ttl = discovery_ttl
+        self.metadata_ttl = metadata_ttl
+
+    def __eq__(self, other):
+        if isinstance(self, other.__class__):
+            return self.directory == other.directory \
+                and self.discovery_ttl == other.discovery_ttl \
+                and self.metadata_ttl == other.metadata_ttl
+        return False
+
+
+class TargetConfigSchema(Schema):
+    """Marshmallow schema for an entry in the targets section of the PBI
+    plugin config."""
+    name = fields.Str()
+    access_token = fields.Str()
+    organisation = fields.Str(required=True)
+    project = fields.Str(required=True)
+    url = fields.Url()
+
+    @post_load
+    def create_target_config(self, data, **kwargs):
+        return TargetConfig(**data)
+
+
+class TargetConfig:
+    """TargetConfig is the config for another Azure DevOps project to get work
+    items from, as well as the one at the top of the config.
+
+    Attributes:
+        organisation (str): The Azure DevOps organisation the project is in.
+        project (str): The Azure DevOps project.
+        access_token (str): The access token for the organisation. If None the
+            one at the top of the config is used.
+        url (str): The URL of the organisation, if it isn't hosted on
+            dev.azure.com.
+        name (str): What to call the project when showing where work items
+            came from. If None it's 'organisation/project'.
+    """
+    def __init__(self,
+                 organisation: str,
+                 project: str,
+                 access_token: str = None,
+                 url: str = None,
+                 name: str = None) -> None:
+        self.organisation = organisation
+        self.project = project
+        self.access_token = access_token
+        self.url = url
+        self.name = name if name is not None \
+            else f"{organisation}/{project}"
+
+    def __eq__(self, other):
+        if isinstance(self, other.__class__):
+            return self.organisation == other.organisation \
+                and self.project == other.project \
+                and self.access_token == other.access_token \
+                and self.url == other.url \
+                and self.name == other.name
+        return False
+
 
 class PBIConfigSchema(Schema):
     """Marshmallow schema for the PBI plugin config."""
@@ -16,6 +175,14 @@ class PBIConfigSchema(Schema):
     organisation = fields.Str()
     project = fields.Str()
     email = fields.Email()
+    url = fields.Url()
+    teams = fields.Dict(keys=fields.Str(), values=fields.List(fields.Str()))
+    cache = fields.Nested(CacheConfigSchema)
+    transport = fields.Nested(TransportConfigSchema)
+    targets = fields.List(fields.Nested(TargetConfigSchema))
+    # declared last, as it hides the fields module from the rest of the class
+    # body
+    fields = fields.List(fields.Str())
 
     @post_load
     def create_pbi_config(self, data, **kwargs):
@@ -30,17 +197,74 @@ class PBIConfig:
         organisation (str): The Azure DevOps organisation to use.
         project (str): The Azure DevOps plugin to use.
         email (str): The email the user uses with Azure DevOps.
+        url (str): The URL of the organisation, if it isn't hosted on
+            dev.azure.com. For Azure DevOps Server, or for testing.
+        teams (Dict[str, List[str]]): Names that can be used in place of a
+            user to stand for a list of users, such as everyone in a standup.
+        fields (List[str]): The names of the fields to show as well as the
+            default ones when getting and listing work items, unless others
+            are asked for.
+        cache (CacheConfig): The config for caches kept between runs.
+        transport (TransportConfig): The config for HTTP connections.
+        targets (List[TargetConfig]): Other projects, possibly in other
+            organisations, that get, ls and boards get work items and boards
+            from as well as this one.
     """
-    def __init__(self, access_token: str, organisation: str, project: str,
-                 email: str) -> None:
+    def __init__(self,
+                 access_token: str,
+                 organisation: str,
+                 project: str,
+                 email: str,
+                 cache: CacheConfig = None,
+                 transport: TransportConfig = None,
+                 url: str = None,
+                 teams: Dict[str, List[str]] = None,
+                 fields: List[str] = None,
+                 targets: List[TargetConfig] = None) -> None:
         self.access_token = access_token
         self.organisation = organisation
         self.project = project
         self.email = email
+        self.url = url
+        self.teams = teams if teams is not None else {}
+        self.fields = fields if fields is not None else []
+        self.targets = targets if targets is not None else []
+        self.cache = cache if cache is not None else CacheConfig()
+        self.transport = transport if transport is not None \
+            else TransportConfig()
 
     def __eq__(self, other):
         if isinstance(self, other.__class__):
             return self.access_token == other.access_token \
                 and self.organisation == other.organisation \
                 and self.project == other.project \
-                and self.email == other.email
\ No newline at end of file
+                and self.email == other.email \
+                and self.url == other.url \
+                and self.teams == other.teams \
+                and self.fields == other.fields \
+                and self.cache == other.cache \
+                and self.transport == other.transport \
+                and self.targets == other.targets
+
+    def target_configs(self) -> Dict[str, "PBIConfig"]:
+        """Get a config for this project and for each of the targets, to
+        connect to them with.
+
+        Returns:
+            Dict[str, PBIConfig]: The configs, keyed by the name of the
+                target, starting with this project as 'organisation/project'.
+                They share everything but the organisation, project, access
+                token and URL with this config, and have no targets.
+        """
+        configs = {}
+        for target in [TargetConfig(self.organisation, self.project,
+                                    self.access_token, self.url)] + \
+                self.targets:
+            cfg = copy.copy(self)
+            cfg.organisation = target.organisation
+            cfg.project = target.project
+            cfg.access_token = target.access_token or self.access_token
+            cfg.url = target.url
+            cfg.targets = []
+            configs.setdefault(target.name, cfg)
+        return configs
@@ -0,0 +1,802 @@
+"""daemon.py
+
+This module contains the daemon, a background process that keeps a connection
+to Azure DevOps open between commands, and the client the CLI uses to send it
+requests over a Unix domain socket. The daemon keeps its clients, connection
+pool and board metadata warm, so a command run while it's up doesn't pay for
+connecting to Azure DevOps.
+
+The client doesn't import the Azure DevOps SDK unless it has to raise one of
+its errors, so commands sent to the daemon start quickly too.
+
+Author:
+    Sam Gibson <sgibson@glasswallsolutions.com>
+"""
+
+import collections.abc
+import contextvars
+import hashlib
+import io
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, IO, Iterator, Optional, \
+    TYPE_CHECKING
+from urllib.parse import quote
+
+from .cache import default_cache_dir
+from .config import PBIConfig
+from .workitem import Change, FieldInfo, UpdateResult, WorkItemContainer
+
+if TYPE_CHECKING:
+    from .pbi import AzureDevOpsAPI
+
+NO_DAEMON_ENV_VAR = "VICTORIA_PBI_NO_DAEMON"
+"""An environment variable that stops commands from using the daemon when it
+is set, even if it's running."""
+
+DEFAULT_IDLE_TIMEOUT = 60 * 60
+"""How many seconds the daemon waits for a request before it stops by
+default."""
+
+POLL_INTERVAL = 1
+"""How many seconds the daemon waits between checking whether it has been
+stopped or idle for too long."""
+
+START_TIMEOUT = 10
+"""How many seconds to wait for a daemon that was just started to accept
+requests."""
+
+
+class DaemonError(Exception):
+    """DaemonError is raised when the daemon couldn't handle a request, or
+    couldn't be started or reached."""
+
+
+class ConfigChangedError(DaemonError):
+    """ConfigChangedError is raised when the daemon was started with a
+    different config to the one a request was sent with."""
+
+
+class RemoteWorkItem:
+    """RemoteWorkItem is a work item sent by the daemon. It has the parts of
+    the Azure DevOps SDK's WorkItem that the plugin uses.
+
+    Attributes:
+        id (int): The ID number of the work item.
+        fields (dict): The fields of the work item.
+    """
+    def __init__(self, id: int, fields: dict) -> None:
+        self.id = id
+        self.fields = fields
+
+
+def socket_path(cfg: PBIConfig) -> str:
+    """Get the path of the socket the daemon for a project listens on.
+
+    Args:
+        cfg (PBIConfig): The config of the project.
+
+    Returns:
+        str: The path of the socket.
+    """
+    directory = cfg.cache.directory or default_cache_dir()
+    name = quote(f"{cfg.organisation}_{cfg.project}".lower(), safe="")
+    return os.path.join(directory, f"daemon_{name}.sock")
+
+
+def config_fingerprint(cfg: PBIConfig) -> str:
+    """Get a fingerprint of the parts of a config that change how the daemon
+    connects to Azure DevOps, so a daemon started with an old config isn't
+    used after it has changed.
+
+    Args:
+        cfg (PBIConfig): The config.
+
+    Returns:
+        str: The fingerprint.
+    """
+    parts = [
+        cfg.access_token, cfg.organisation, cfg.project, cfg.url,
+        vars(cfg.transport),
+        vars(cfg.cache)
+    ]
+    return hashlib.sha256(
+        json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def encode(value: Any) -> Any:
+    """Encode a value as JSON to send between the daemon and the client.
+
+    Args:
+        value (Any): The value. Work items, fields, changes, update results
+            and JSON patch operations are encoded as themselves, and other
+            iterables as lists.
+
+    Returns:
+        Any: The JSON serialisable value.
+
+    Raises:
+        TypeError: If the value couldn't be encoded.
+    """
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, dict):
+        return {
+            "$type": "dict",
+            "value": [[encode(key), encode(item)]
+                      for key, item in value.items()]
+        }
+    if isinstance(value, WorkItemContainer):
+        return {
+            "$type": "WorkItemContainer",
+            "value": [
+                value.id_number, value.title, value.work_type,
+                value.assigned_to, value.state, value.board_column,
+                value.fields
+            ]
+        }
+    if isinstance(value, FieldInfo):
+        return {
+            "$type": "FieldInfo",
+            "value": [value.reference_name, value.name, value.type]
+        }
+    if isinstance(value, Change):
+        return {
+            "$type": "Change",
+            "value": [
+                value.id_number, value.field, value.old, value.new,
+                value.rev,
+                encode(value.work_item)
+            ]
+        }
+    if isinstance(value, UpdateResult):
+        return {
+            "$type": "UpdateResult",
+            "value": [
+                value.id_number,
+                encode(value.work_item), value.error, value.changed
+            ]
+        }
+    # the SDK's models are checked by name so the client doesn't import it
+    name = type(value).__name__
+    if name in ("WorkItem", "RemoteWorkItem"):
+        return {"$type": "WorkItem", "value": [value.id, value.fields]}
+    if name == "JsonPatchOperation":
+        return {
+            "$type": "JsonPatchOperation",
+            "value": [value.op, value.path, value.value]
+        }
+    if not isinstance(value, (bytes, str)) and hasattr(value, "__iter__"):
+        return [encode(item) for item in value]
+    raise TypeError(f"Could not send a {name} to the daemon")
+
+
+def decode(value: Any) -> Any:
+    """Decode a value encoded by encode().
+
+    Args:
+        value (Any): The JSON value.
+
+    Returns:
+        Any: The value. Work items are decoded as RemoteWorkItems.
+    """
+    if isinstance(value, list):
+        return [decode(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+
+    kind, value = value["$type"], value["value"]
+    if kind == "dict":
+        return {decode(key): decode(item) for key, item in value}
+    if kind == "WorkItemContainer":
+        return WorkItemContainer.from_values(*value)
+    if kind == "FieldInfo":
+        return FieldInfo(*value)
+    if kind == "Change":
+        return Change(*value[:5], decode(value[5]))
+    if kind == "UpdateResult":
+        return UpdateResult(value[0], decode(value[1]), value[2], value[3])
+    if kind == "WorkItem":
+        return RemoteWorkItem(*value)
+    if kind == "JsonPatchOperation":
+        from azure.devops.v5_1.work_item_tracking.models import \
+            JsonPatchOperation
+        return JsonPatchOperation(op=value[0], path=value[1], value=value[2])
+    raise ValueError(f"Unknown type '{kind}'")
+
+
+def raise_error(error: dict) -> None:
+    """Raise an error sent by the daemon as the exception it was raised as.
+
+    Args:
+        error (dict): The 'type' and 'message' of the error.
+
+    Raises:
+        AzureDevOpsServiceError: If that's what it was raised as.
+        ClientRequestError: If the daemon couldn't reach Azure DevOps.
+        ValueError: If the arguments were wrong, i.e. a column or field that
+            doesn't exist.
+        ConfigChangedError: If the daemon was started with a different
+            config.
+        DaemonError: If it was raised as anything else.
+    """
+    if error["type"] == "AzureDevOpsServiceError":
+        from types import SimpleNamespace
+        from azure.devops.exceptions import AzureDevOpsServiceError
+        raise AzureDevOpsServiceError(
+            SimpleNamespace(message=error["message"],
+                            inner_exception=None,
+                            exception_id=None,
+                            type_name=None,
+                            type_key=None,
+                            error_code=None,
+                            event_id=None,
+                            custom_properties=None))
+    if error["type"] == "ClientRequestError":
+        from msrest.exceptions import ClientRequestError
+        raise ClientRequestError(error["message"])
+    if error["type"] == "ValueError":
+        raise ValueError(error["message"])
+    if error["type"] == "ConfigChanged":
+        raise ConfigChangedError(error["message"])
+    raise DaemonError(error["message"])
+
+
+class _Channel:
+    """_Channel sends messages to a client as lines of JSON.
+
+    Attributes:
+        stream (IO[bytes]): The connection to the client.
+    """
+    def __init__(self, stream: IO[bytes]) -> None:
+        self.stream = stream
+        # output can be written from several threads at once
+        self._lock = threading.Lock()
+
+    def send(self, message: dict) -> None:
+        """Send a message.
+
+        Args:
+            message (dict): The message.
+        """
+        data = (json.dumps(message) + "\n").encode()
+        with self._lock:
+            self.stream.write(data)
+            self.stream.flush()
+
+
+_request_channel = contextvars.ContextVar("_request_channel", default=None)
+"""The channel to the client whose request is being handled. It's a context
+variable so the worker threads a request fans out to, which run in a copy of
+its context, send their output to the same client."""
+
+
+def _current_channel() -> Optional[_Channel]:
+    """Get the channel to the client whose request is being handled, if
+    any."""
+    return _request_channel.get()
+
+
+class _ForwardedOutput(io.TextIOBase):
+    """_ForwardedOutput replaces stdout in the daemon, so anything a request
+    prints is sent to the client that made it, and printed there.
+
+    Attributes:
+        fallback (IO[str]): Where to write output that isn't for a request.
+    """
+    def __init__(self, fallback: IO[str]) -> None:
+        self.fallback = fallback
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        channel = _current_channel()
+        if channel is None:
+            return self.fallback.write(text)
+        channel.send({"out": text})
+        return len(text)
+
+    def flush(self) -> None:
+        self.fallback.flush()
+
+
+class _ForwardedLogs(logging.Handler):
+    """_ForwardedLogs sends log records made while handling a request to the
+    client that made it, which logs them there."""
+    def emit(self, record: logging.LogRecord) -> None:
+        channel = _current_channel()
+        if channel is None:
+            return
+        try:
+            channel.send({"log": [record.levelno, record.getMessage()]})
+        except OSError:
+            pass
+
+
+class _Server(socketserver.ThreadingUnixStreamServer):
+    """_Server accepts connections from clients, handling each in its own
+    thread, and stops once it has been idle for long enough."""
+    daemon_threads = True
+
+    def __init__(self, path: str, daemon: "Daemon") -> None:
+        self.daemon = daemon
+        self.stopping = False
+        super().__init__(path, _Handler)
+
+    def stop(self) -> None:
+        """Stop serving. Requests already being handled are finished."""
+        if not self.stopping:
+            self.stopping = True
+            # shutdown() waits for serve_forever() to return, so it can't be
+            # called from the thread running it
+            threading.Thread(target=self.shutdown, daemon=True).start()
+
+    def service_actions(self) -> None:
+        if self.daemon.idle_timeout \
+                and self.daemon.idle() > self.daemon.idle_timeout:
+            logging.info("Stopping the daemon as it has been idle")
+            self.stop()
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """_Handler handles a single request from a client."""
+    def handle(self) -> None:
+        self.server.daemon.handle(self.rfile, self.wfile)
+
+
+class Daemon:
+    """Daemon holds a connection to Azure DevOps and runs the API's methods
+    on it for clients.
+
+    Each connection from a client is a single request: a line of JSON naming
+    the method to call and its arguments, which is answered with lines of
+    JSON. A method that returns a generator is streamed as it runs, so the
+    client sees the first work items without waiting for the rest. Output
+    printed and logged while handling a request is sent back to the client.
+
+    Attributes:
+        api (AzureDevOpsAPI): The connection to Azure DevOps.
+        path (str): The path of the socket the daemon listens on.
+        fingerprint (str): The fingerprint of the config it was started with.
+            Requests from clients with a different config are refused.
+        idle_timeout (float): How many seconds to wait for a request before
+            stopping.
+        started (float): When the daemon started, as a Unix timestamp.
+        requests (int): How many calls to the API the daemon has handled.
+    """
+    def __init__(self,
+                 cfg: PBIConfig,
+                 idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+                 api: "AzureDevOpsAPI" = None) -> None:
+        if api is None:
+            from .pbi import AzureDevOpsAPI
+            api = AzureDevOpsAPI(cfg)
+        self.api = api
+        self.path = socket_path(cfg)
+        self.fingerprint = config_fingerprint(cfg)
+        self.idle_timeout = idle_timeout
+        self.started = time.time()
+        self.requests = 0
+        self._active = 0
+        self._last_request = time.time()
+        self._lock = threading.Lock()
+        self._server = None
+
+    def idle(self) -> float:
+        """Get how long the daemon has been idle.
+
+        Returns:
+            float: How many seconds since the last request finished, or 0 if
+                one is being handled.
+        """
+        with self._lock:
+            if self._active:
+                return 0
+            return time.time() - self._last_request
+
+    def status(self) -> dict:
+        """Get the status of the daemon.
+
+        Returns:
+            dict: Its process ID, when it started, and how many requests it
+                has handled.
+        """
+        return {
+            "pid": os.getpid(),
+            "started": self.started,
+            "requests": self.requests
+        }
+
+    def _bind(self) -> _Server:
+        """Start listening on the socket, replacing it if it was left behind
+        by a daemon that didn't stop cleanly.
+
+        Returns:
+            _Server: The server listening on the socket.
+
+        Raises:
+            DaemonError: If there is already a daemon listening on it.
+        """
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if os.path.exists(self.path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.path)
+                raise DaemonError("The daemon is already running")
+            except (ConnectionRefusedError, FileNotFoundError):
+                os.unlink(self.path)
+            finally:
+                probe.close()
+
+        # only the user can connect, as the daemon acts with their token
+        umask = os.umask(0o177)
+        try:
+            return _Server(self.path, self)
+        finally:
+            os.umask(umask)
+
+    def serve(self) -> None:
+        """Handle requests until the daemon is stopped or idle for too long.
+
+        Raises:
+            DaemonError: If there is already a daemon listening on the socket.
+        """
+        self._server = self._bind()
+        stdout = sys.stdout
+        sys.stdout = _ForwardedOutput(stdout)
+        forwarded = _ForwardedLogs()
+        logging.getLogger().addHandler(forwarded)
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, _terminate)
+        try:
+            self._server.serve_forever(poll_interval=POLL_INTERVAL)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            sys.stdout = stdout
+            logging.getLogger().removeHandler(forwarded)
+            self._server.server_close()
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+            self.api.close()
+
+    def stop(self) -> None:
+        """Stop handling requests. Requests already being handled are
+        finished."""
+        if self._server is not None:
+            self._server.stop()
+
+    def handle(self, rfile: IO[bytes], wfile: IO[bytes]) -> None:
+        """Handle a request from a client.
+
+        Args:
+            rfile (IO[bytes]): Where to read the request from.
+            wfile (IO[bytes]): Where to write the response to.
+        """
+        channel = _Channel(wfile)
+        with self._lock:
+            self._active += 1
+        token = _request_channel.set(channel)
+        try:
+            request = json.loads(rfile.readline())
+            self._respond(channel, request)
+        except (BrokenPipeError, ConnectionResetError):
+            # the client went away, i.e. it was interrupted
+            pass
+        except ValueError as err:
+            channel.send({"error": {"type": "DaemonError",
+                                    "message": f"Bad request: {err}"}})
+        finally:
+            _request_channel.reset(token)
+            with self._lock:
+                self._active -= 1
+                self._last_request = time.time()
+
+    def _respond(self, channel: _Channel, request: dict) -> None:
+        """Run the method a client asked for and send back what it returned.
+
+        Args:
+            channel (_Channel): The channel to the client.
+            request (dict): The request.
+        """
+        method = request.get("method")
+        # only the user can connect, so it can always be stopped, i.e. to
+        # restart it with a new config
+        if method == "stop":
+            channel.send({"value": encode(self.status())})
+            self.stop()
+            return
+        if request.get("config") != self.fingerprint:
+            channel.send({"error": {
+                "type": "ConfigChanged",
+                "message": "The daemon was started with a different config"
+            }})
+            return
+        if method == "status":
+            channel.send({"value": encode(self.status())})
+            return
+
+        func = getattr(self.api, method, None) \
+            if isinstance(method, str) and not method.startswith("_") \
+            else None
+        if not callable(func):
+            channel.send({"error": {"type": "DaemonError",
+                                    "message": f"Unknown method {method!r}"}})
+            return
+
+        from azure.devops.exceptions import AzureDevOpsServiceError
+        from msrest.exceptions import ClientRequestError
+        # arguments that can't be decoded are a bad request, rather than a
+        # ValueError from the API
+        args = decode(request["args"])
+        kwargs = decode(request["kwargs"])
+        with self._lock:
+            self.requests += 1
+        try:
+            result = func(*args, **kwargs)
+            if isinstance(result, collections.abc.Iterator):
+                channel.send({"stream": True})
+                for item in result:
+                    channel.send({"item": encode(item)})
+                channel.send({"end": True})
+            else:
+                channel.send({"value": encode(result)})
+        except (BrokenPipeError, ConnectionResetError):
+            raise
+        except AzureDevOpsServiceError as err:
+            channel.send({"error": {"type": "AzureDevOpsServiceError",
+                                    "message": err.message}})
+        except ClientRequestError as err:
+            channel.send({"error": {"type": "ClientRequestError",
+                                    "message": str(err)}})
+        except ValueError as err:
+            # the API raises these for arguments that are wrong, like a field
+            # that doesn't exist, which the command tells the user about
+            channel.send({"error": {"type": "ValueError",
+                                    "message": str(err)}})
+        except Exception as err:
+            logging.exception(f"Could not handle a request for '{method}'")
+            channel.send({"error": {"type": type(err).__name__,
+                                    "message": str(err)}})
+
+
+def _terminate(signum: int, frame: Any) -> None:
+    """Stop the daemon cleanly when it's sent SIGTERM."""
+    raise KeyboardInterrupt
+
+
+class DaemonClient:
+    """DaemonClient sends requests to the daemon. It has the same methods as
+    AzureDevOpsAPI, so commands can use either.
+
+    Attributes:
+        path (str): The path of the socket the daemon listens on.
+        fingerprint (str): The fingerprint of the config to send with each
+            request.
+    """
+    def __init__(self, path: str, fingerprint: str) -> None:
+        self.path = path
+        self.fingerprint = fingerprint
+
+    def _open(self, method: str, args: tuple,
+              kwargs: dict) -> socket.socket:
+        """Connect to the daemon and send it a request.
+
+        Args:
+            method (str): The method to call.
+            args (tuple): Its arguments.
+            kwargs (dict): Its keyword arguments.
+
+        Returns:
+            socket.socket: The connection, to read the response from.
+        """
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.path)
+            request = {
+                "config": self.fingerprint,
+                "method": method,
+                "args": encode(args),
+                "kwargs": encode(kwargs)
+            }
+            sock.sendall((json.dumps(request) + "\n").encode())
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    @staticmethod
+    def _messages(sock: socket.socket) -> Iterator[dict]:
+        """Read the response to a request, printing and logging any output
+        that was forwarded.
+
+        Args:
+            sock (socket.socket): The connection to the daemon.
+
+        Yields:
+            dict: The messages of the response, other than output.
+
+        Raises:
+            DaemonError: If the daemon stopped before it finished responding.
+        """
+        with sock.makefile("rb") as stream:
+            for line in stream:
+                message = json.loads(line)
+                if "out" in message:
+                    print(message["out"], end="")
+                elif "log" in message:
+                    logging.log(*message["log"])
+                else:
+                    yield message
+        raise DaemonError("The daemon stopped while handling the request")
+
+    def call(self, method: str, *args, **kwargs) -> Any:
+        """Call a method of the API in the daemon.
+
+        Args:
+            method (str): The method to call.
+            *args: Its arguments.
+            **kwargs: Its keyword arguments.
+
+        Returns:
+            Any: What the method returned. If it returned a generator, this is
+                a generator of what it yields, which streams them from the
+                daemon.
+
+        Raises:
+            DaemonError: If the daemon couldn't be reached or couldn't handle
+                the request.
+        """
+        try:
+            sock = self._open(method, args, kwargs)
+        except OSError as err:
+            raise DaemonError(f"Could not reach the daemon: {err}")
+        messages = self._messages(sock)
+        try:
+            first = next(messages)
+        except BaseException:
+            sock.close()
+            raise
+        if "stream" in first:
+            return self._stream(sock, messages)
+        sock.close()
+        if "error" in first:
+            raise_error(first["error"])
+        return decode(first["value"])
+
+    @staticmethod
+    def _stream(sock: socket.socket,
+                messages: Iterator[dict]) -> Iterator[Any]:
+        """Read the items a generator in the daemon yields.
+
+        Args:
+            sock (socket.socket): The connection to the daemon.
+            messages (Iterator[dict]): The messages of the response.
+
+        Yields:
+            Any: The items.
+        """
+        try:
+            for message in messages:
+                if "item" in message:
+                    yield decode(message["item"])
+                elif "error" in message:
+                    raise_error(message["error"])
+                else:
+                    return
+        finally:
+            sock.close()
+
+    def __getattr__(self, name: str) -> Callable[..., Any]:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return lambda *args, **kwargs: self.call(name, *args, **kwargs)
+
+    def close(self) -> None:
+        """Nothing to close, as each request has its own connection. The
+        daemon keeps running."""
+
+
+def connect(cfg: PBIConfig) -> Optional[DaemonClient]:
+    """Connect to the daemon for a project, if it's running.
+
+    Args:
+        cfg (PBIConfig): The config of the project.
+
+    Returns:
+        DaemonClient: The client, or None if the daemon isn't running, was
+            started with a different config, or NO_DAEMON_ENV_VAR is set.
+    """
+    if os.environ.get(NO_DAEMON_ENV_VAR) or not hasattr(socket, "AF_UNIX"):
+        return None
+    path = socket_path(cfg)
+    if not os.path.exists(path):
+        return None
+
+    client = DaemonClient(path, config_fingerprint(cfg))
+    try:
+        client.call("status")
+    except ConfigChangedError as err:
+        logging.warning(f"{err}, so it wasn't used. Run 'victoria pbi daemon "
+                        "restart' to use the new config.")
+        return None
+    except DaemonError as err:
+        logging.debug(f"Not using the daemon: {err}")
+        return None
+    return client
+
+
+def start(cfg: PBIConfig,
+          idle_timeout: float = DEFAULT_IDLE_TIMEOUT) -> Dict[str, Any]:
+    """Start the daemon for a project in the background.
+
+    Args:
+        cfg (PBIConfig): The config of the project.
+        idle_timeout (float): How many seconds it waits for a request before
+            stopping.
+
+    Returns:
+        Dict[str, Any]: The status of the daemon.
+
+    Raises:
+        DaemonError: If it couldn't be started, or is already running.
+    """
+    if not hasattr(os, "fork") or not hasattr(socket, "AF_UNIX"):
+        raise DaemonError("The daemon needs Unix domain sockets")
+    client = connect(cfg)
+    if client is not None:
+        raise DaemonError("The daemon is already running")
+
+    pid = os.fork()
+    if pid == 0:
+        # detach from the terminal, and fork again so we can't reacquire it
+        os.setsid()
+        if os.fork() != 0:
+            os._exit(0)
+        devnull = os.open(os.devnull, os.O_RDWR)
+        for fd in range(3):
+            os.dup2(devnull, fd)
+        try:
+            Daemon(cfg, idle_timeout).serve()
+        except BaseException:
+            logging.exception("The daemon stopped")
+        finally:
+            os._exit(0)
+
+    os.waitpid(pid, 0)
+    deadline = time.time() + START_TIMEOUT
+    client = DaemonClient(socket_path(cfg), config_fingerprint(cfg))
+    while True:
+        try:
+            return client.call("status")
+        except DaemonError:
+            if time.time() > deadline:
+                raise DaemonError("The daemon did not start")
+            time.sleep(0.05)
+
+
+def stop(cfg: PBIConfig) -> Optional[Dict[str, Any]]:
+    """Stop the daemon for a project.
+
+    Args:
+        cfg (PBIConfig): The config of the project.
+
+    Returns:
+        Dict[str, Any]: The status of the daemon when it stopped, or None if
+            it wasn't running.
+    """
+    path = socket_path(cfg)
+    if not os.path.exists(path):
+        return None
+    try:
+        return DaemonClient(path, config_fingerprint(cfg)).call("stop")
+    except DaemonError:
+        return None
@@ -0,0 +1,98 @@
+"""discovery.py
+
+Before the Azure DevOps SDK can send a request it has to discover which URL
+each service lives at (resource areas), and the routes and API versions of
+each resource (resource locations). This module persists the result of that
+discovery per organisation, so a fresh process can skip it.
+
+Author:
+    Sam Gibson <sgibson@glasswallsolutions.com>
+"""
+
+import logging
+
+from azure.devops._models import ApiResourceLocation
+from azure.devops.client import Client
+from azure.devops.connection import Connection
+from azure.devops.v5_0.location.models import ResourceAreaInfo
+from msrest import Deserializer, Serializer
+from msrest.exceptions import DeserializationError
+
+from .cache import DiskCache
+
+_MODELS = {
+    "ApiResourceLocation": ApiResourceLocation,
+    "ResourceAreaInfo": ResourceAreaInfo
+}
+_serialize = Serializer(_MODELS)
+_deserialize = Deserializer(_MODELS)
+
+
+class DiscoveryCache:
+    """Persists the resource areas and resource locations discovered for an
+    Azure DevOps organisation.
+
+    Attributes:
+        organisation (str): The organisation the discovery is for.
+        cache (DiskCache): The cache to store the discovery in.
+    """
+    def __init__(self, organisation: str, cache: DiskCache) -> None:
+        self.organisation = organisation.lower()
+        self.cache = cache
+        self._entry = None
+
+    def prime(self, connection: Connection) -> bool:
+        """Load the cached discovery into a connection, so it doesn't have to
+        discover resource areas or the locations of any cached client URLs.
+
+        Args:
+            connection (Connection): The connection to prime.
+
+        Returns:
+            bool: Whether there was a cached discovery to load.
+        """
+        entry = self.cache.get(self.organisation)
+        if entry is None:
+            return False
+        try:
+            resource_areas = _deserialize("[ResourceAreaInfo]",
+                                          entry["resource_areas"])
+            locations = {
+                url: _deserialize("[ApiResourceLocation]", url_locations)
+                for url, url_locations in entry["locations"].items()
+            }
+        except (KeyError, TypeError, DeserializationError) as err:
+            # a bad cache entry shouldn't stop us from connecting
+            logging.debug(f"Could not load cached discovery: {err}")
+            return False
+
+        connection._resource_areas = resource_areas
+        Client._locations_cache.update(locations)
+        self._entry = entry
+        return True
+
+    def ensure(self, connection: Connection, client: Client) -> None:
+        """Make sure the discovery needed by a newly created client is cached.
+        If the client's locations aren't cached yet they are discovered now, as
+        the client's first request would have to do it anyway.
+
+        Args:
+            connection (Connection): The connection the client came from.
+            client (Client): The client.
+        """
+        url = client.config.base_url
+        if self._entry is not None and url in self._entry["locations"]:
+            return
+
+        locations = client._get_resource_locations(all_host_types=False)
+        # kept where the client looks first, so its first request doesn't
+        # discover them again
+        Client._locations_cache[url] = locations
+        entry = self._entry or {"resource_areas": [], "locations": {}}
+        if connection._resource_areas is not None:
+            entry["resource_areas"] = _serialize.serialize_data(
+                connection._resource_areas, "[ResourceAreaInfo]")
+        entry["locations"][url] = _serialize.serialize_data(
+            locations, "[ApiResourceLocation]")
+        self.cache.set(self.organisation, entry)
+        self._entry = entry
@@ -0,0 +1,310 @@
+"""instrumentation.py
+
+This module records how long each request to Azure DevOps takes, along with
+how big it was, how many times it was retried and how many items it returned,
+plus how long the stages of a command around the requests took. The records
+can be summarised, written out as JSON, or passed to hooks as they happen so
+they can be forwarded to a metrics system.
+
+Author:
+    Sam Gibson <sgibson@glasswallsolutions.com>
+"""
+
+from contextlib import contextmanager
+import importlib
+import json
+import logging
+import re
+import threading
+import time
+from typing import Any, Callable, Generator, IO, Iterable, List, Optional, \
+    TypeVar
+from urllib.parse import unquote, urlsplit
+
+T = TypeVar("T")
+
+
+class Timing:
+    """Timing is a single timed event: either a request, or a stage of a
+    command.
+
+    Attributes:
+        kind (str): Either 'request' or 'stage'.
+        name (str): The endpoint of the request, i.e.
+            'POST wit/workitemsbatch', or the name of the stage.
+        seconds (float): How long it took.
+        started (float): When it started, as a Unix timestamp.
+        status (int): The status code of the response, for requests.
+        request_bytes (int): The size of the request body, for requests.
+        response_bytes (int): The size of the response body, for requests.
+        retries (int): How many times the request was retried.
+        items (int): How many items the response contained, if it was a
+            collection or a single work item.
+    """
+    def __init__(self,
+                 kind: str,
+                 name: str,
+                 seconds: float,
+                 started: float = None,
+                 status: int = None,
+                 request_bytes: int = None,
+                 response_bytes: int = None,
+                 retries: int = None,
+                 items: int = None) -> None:
+        self.kind = kind
+        self.name = name
+        self.seconds = seconds
+        self.started = started if started is not None \
+            else time.time() - seconds
+        self.status = status
+        self.request_bytes = request_bytes
+        self.response_bytes = response_bytes
+        self.retries = retries
+        self.items = items
+
+    def to_dict(self) -> dict:
+        """Get the timing as a JSON serialisable dict.
+
+        Returns:
+            dict: The timing, leaving out anything that wasn't recorded.
+        """
+        return {
+            key: value
+            for key, value in vars(self).items() if value is not None
+        }
+
+
+def endpoint_name(method: str, url: str) -> str:
+    """Get the name of the endpoint a request was sent to, without anything
+    that changes between requests to the same endpoint, such as IDs.
+
+    Args:
+        method (str): The HTTP method of the request.
+        url (str): The URL of the request.
+
+    Returns:
+        str: The endpoint name, i.e. 'PATCH wit/workItems/{id}'.
+    """
+    path = unquote(urlsplit(url).path)
+    _, apis, resource = path.partition("_apis")
+    resource = resource.strip("/") if apis else path.strip("/")
+    resource = re.sub(r"(?<=/)\d+(?=/|$)", "{id}", resource)
+    return f"{method} {resource or '_apis'}"
+
+
+def count_items(body: Any) -> Optional[int]:
+    """Count the items in a decoded response body.
+
+    Args:
+        body (Any): The decoded JSON body.
+
+    Returns:
+        int: The number of items, or None if it wasn't something with items.
+    """
+    if isinstance(body, dict):
+        for key in ("value", "workItems"):
+            if isinstance(body.get(key), list):
+                return len(body[key])
+        if "id" in body and "fields" in body:
+            return 1
+    return None
+
+
+def load_hook(name: str) -> Callable[[Timing], None]:
+    """Import a hook function by name.
+
+    Args:
+        name (str): The hook, as 'module:function'.
+
+    Returns:
+        Callable[[Timing], None]: The hook.
+
+    Raises:
+        ValueError: If the name wasn't in the right format.
+        ImportError: If the module could not be imported.
+        AttributeError: If the module didn't have the function.
+    """
+    module_name, _, function_name = name.partition(":")
+    if not module_name or not function_name:
+        raise ValueError(f"Hook '{name}' should be 'module:function'")
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+class Instrumentation:
+    """Instrumentation records timings and passes them on to hooks.
+
+    It is safe to record timings from several threads at once.
+
+    Attributes:
+        timings (List[Timing]): Everything that has been recorded, in the
+            order it finished.
+        hooks (List[Callable[[Timing], None]]): Functions to pass each timing
+            to as it is recorded.
+    """
+    def __init__(self, hooks: List[Callable[[Timing], None]] = None) -> None:
+        self.timings = []
+        self.hooks = list(hooks or [])
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add_hook(self, hook: Callable[[Timing], None]) -> None:
+        """Pass every timing recorded from now on to a function.
+
+        Args:
+            hook (Callable[[Timing], None]): The function.
+        """
+        self.hooks.append(hook)
+
+    def record(self, timing: Timing) -> None:
+        """Record a timing and pass it to the hooks. Hooks that fail are
+        logged rather than stopping the command.
+
+        Args:
+            timing (Timing): The timing to record.
+        """
+        with self._lock:
+            self.timings.append(timing)
+        for hook in self.hooks:
+            try:
+                hook(timing)
+            except Exception as err:
+                logging.debug(f"Timings hook {hook!r} failed: {err}")
+
+    @contextmanager
+    def stage(self, name: str) -> Generator[None, None, None]:
+        """Time a stage of a command.
+
+        Args:
+            name (str): The name of the stage.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(Timing("stage", name, time.perf_counter() - start))
+
+    def timed_iter(self, items: Iterable[T], wait_stage: str,
+                   use_stage: str) -> Generator[T, None, None]:
+        """Time how long is spent waiting for the items of an iterable, and
+        how long the caller spends using them, as two stages.
+
+        Args:
+            items (Iterable[T]): The items.
+            wait_stage (str): The name of the stage spent waiting for items.
+            use_stage (str): The name of the stage spent using them.
+
+        Yields:
+            T: The items.
+        """
+        waited = 0.0
+        used = 0.0
+        started = time.time()
+        items = iter(items)
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(items)
+                except StopIteration:
+                    return
+                finally:
+                    waited += time.perf_counter() - start
+                start = time.perf_counter()
+                yield item
+                used += time.perf_counter() - start
+        finally:
+            self.record(Timing("stage", wait_stage, waited, started))
+            self.record(Timing("stage", use_stage, used, started))
+
+    def instrument(self, session) -> None:
+        """Record every request sent with a requests session.
+
+        Args:
+            session (requests.Session): The session.
+        """
+        session.hooks["response"].append(self._on_response)
+
+    def _on_response(self, response, *args, **kwargs) -> None:
+        """requests response hook that records a request."""
+        # the hook runs before the body is read, so read it here to include
+        # the time it takes to download in the timing
+        start = time.perf_counter()
+        content = response.content
+        seconds = response.elapsed.total_seconds() \
+            + time.perf_counter() - start
+
+        items = None
+        if response.headers.get("Content-Type", "").startswith(
+                "application/json") and content:
+            try:
+                items = count_items(json.loads(content))
+            except ValueError:
+                pass
+
+        # urllib3 retries connection errors, and the scheduler retries
+        # throttled and failed requests
+        retries = getattr(response, "retried", 0)
+        history = getattr(response.raw, "retries", None)
+        if history is not None:
+            retries += len(history.history)
+        request = response.request
+        self.record(
+            Timing("request",
+                   endpoint_name(request.method, request.url),
+                   seconds,
+                   status=response.status_code,
+                   request_bytes=len(request.body or b""),
+                   response_bytes=len(content or b""),
+                   retries=retries,
+                   items=items))
+
+    def summary(self) -> str:
+        """Summarise the timings, with the totals for each endpoint and stage.
+
+        Returns:
+            str: The summary, as a table.
+        """
+        with self._lock:
+            timings = list(self.timings)
+
+        groups = {}
+        for timing in timings:
+            groups.setdefault((timing.kind, timing.name), []).append(timing)
+
+        lines = [
+            f"{'endpoint':<40} {'calls':>5} {'total s':>8} {'mean ms':>8} "
+            f"{'max ms':>8} {'kB in':>8} {'retries':>7} {'items':>6}"
+        ]
+        for (kind, name), group in sorted(
+                groups.items(),
+                key=lambda item: (item[0][0] != "request", item[0][1])):
+            total = sum(timing.seconds for timing in group)
+            label = name if kind == "request" else f"[{name}]"
+            line = f"{label:<40} {len(group):>5} {total:>8.3f} " \
+                f"{total / len(group) * 1000:>8.1f} " \
+                f"{max(timing.seconds for timing in group) * 1000:>8.1f}"
+            if kind == "request":
+                received = sum(timing.response_bytes for timing in group)
+                retries = sum(timing.retries for timing in group)
+                items = sum(timing.items or 0 for timing in group)
+                line += f" {received / 1024:>8.1f} {retries:>7} {items:>6}"
+            lines.append(line)
+
+        requests = [timing for timing in timings if timing.kind == "request"]
+        lines.append(
+            f"{len(requests)} requests taking "
+            f"{sum(timing.seconds for timing in requests):.3f}s between them, "
+            f"in {time.perf_counter() - self.started:.3f}s of wall time")
+        return "\n".join(lines)
+
+    def write_json(self, file: IO) -> None:
+        """Write each timing as a line of JSON.
+
+        Args:
+            file (IO): Where to write them.
+        """
+        with self._lock:
+            timings = list(self.timings)
+        for timing in timings:
+            file.write(json.dumps(timing.to_dict()) + "\n")
+        file.flush()
@@ -0,0 +1,94 @@
+"""metadata.py
+
+This module caches metadata about the boards in an Azure DevOps project, such
+as which boards there are and what their columns are called. It rarely
+changes, but is needed by several commands, so it is kept between runs.
+
+Author:
+    Sam Gibson <sgibson@glasswallsolutions.com>
+"""
+
+import threading
+import time
+from typing import Any, Callable, Optional
+
+from .cache import DiskCache
+
+
+class MetadataCache:
+    """Caches board metadata for a project in memory, and optionally on disk
+    so it persists between runs.
+
+    Entries are keyed by organisation, project and team, so projects and
+    teams with the same name in different places don't clash. Entries kept in
+    memory expire with the disk cache's TTL too, so a long running process,
+    such as the daemon, picks up changes to the boards.
+
+    Attributes:
+        organisation (str): The organisation the metadata is for.
+        project (str): The project the metadata is for.
+        cache (DiskCache): The cache to store the metadata in between runs, or
+            None to only keep it for this run.
+    """
+    def __init__(self, organisation: str, project: str,
+                 cache: Optional[DiskCache]) -> None:
+        self.organisation = organisation.lower()
+        self.project = project.lower()
+        self.cache = cache
+        self._memory = {}
+        # entries can be fetched from several threads at once, and each write
+        # rewrites the whole cache file
+        self._lock = threading.Lock()
+
+    def _key(self, kind: str, team: str = None) -> str:
+        """Get the key of an entry.
+
+        Args:
+            kind (str): What kind of metadata the entry is.
+            team (str): The team the entry is for, if any.
+
+        Returns:
+            str: The key.
+        """
+        parts = [self.organisation, self.project]
+        if team is not None:
+            parts.append(team.lower())
+        parts.append(kind)
+        return "/".join(parts)
+
+    def get(self,
+            kind: str,
+            fetch: Callable[[], Any],
+            team: str = None,
+            refresh: bool = False) -> Any:
+        """Get an entry, fetching it from the service if it isn't cached.
+
+        Args:
+            kind (str): What kind of metadata the entry is.
+            fetch (Callable[[], Any]): Gets the JSON serialisable value of the
+                entry from the service.
+            team (str): The team the entry is for, if any.
+            refresh (bool): Whether to fetch the entry even if it is cached.
+
+        Returns:
+            Any: The value of the entry.
+        """
+        key = self._key(kind, team)
+        if not refresh:
+            if key in self._memory:
+                stored, value = self._memory[key]
+                if self.cache is None \
+                        or time.time() - stored <= self.cache.ttl:
+                    return value
+            if self.cache is not None:
+                value = self.cache.get(key)
+                if value is not None:
+                    self._memory[key] = (time.time(), value)
+                    return value
+
+        value = fetch()
+        with self._lock:
+            self._memory[key] = (time.time(), value)
+            if self.cache is not None:
+                self.cache.set(key, value)
+        return value
@@ -0,0 +1,365 @@
+"""output.py
+
+This module contains the functions used to print work items.
+
+Author:
+    Sam Gibson <sgibson@glasswallsolutions.com>
+"""
+
+import csv
+import html
+from itertools import islice
+import json
+import re
+import sys
+from typing import Any, IO, Iterable, List, Tuple, TYPE_CHECKING
+
+import colorama
+
+if TYPE_CHECKING:
+    from .pbi import WorkItemContainer
+    from .workitem import FieldInfo
+
+DEFAULT_LOOKAHEAD = 50
+"""How many rows to look at to decide how wide to make the columns of a table
+when printing it a row at a time."""
+
+WORK_ITEM_HEADERS = ["ID", "Type", "Title", "State", "Assignee"]
+"""The headers of the table work items are printed in."""
+
+ANSI_ESCAPE = re.compile(r"\x1b\[[0-9;]*m")
+"""Matches the ANSI escape codes used to colour text."""
+
+HTML_TAG = re.compile(r"<[^>]*>")
+"""Matches the tags in the HTML of a rich text field."""
+
+MAX_FIELD_WIDTH = 60
+"""How many characters of a field's value to show in a table."""
+
+OUTPUT_FORMATS = ["table", "jsonl", "csv", "tsv"]
+"""The formats work items can be written in. All but 'table' are meant to be
+read by other programs."""
+
+TSV_SEPARATORS = re.compile(r"[\t\r\n]")
+"""Matches the characters that separate values and records in TSV."""
+
+WORK_ITEM_KEYS = ["id", "type", "title", "state", "column", "assigned_to"]
+"""The keys of a work item's dict, which are also the headers of the columns
+when writing work items as CSV or TSV."""
+
+
+def visible_len(text: str) -> int:
+    """Get the length of a string as it appears in a terminal, ignoring any
+    colour codes.
+
+    Args:
+        text (str): The text to measure.
+
+    Returns:
+        int: The number of visible characters.
+    """
+    return len(ANSI_ESCAPE.sub("", text))
+
+
+class StreamingTable:
+    """StreamingTable prints a table a row at a time, so rows appear as soon
+    as they are available instead of when the whole table is.
+
+    The column widths are either fixed, or worked out from the headers and the
+    first few rows. Cells in later rows that don't fit push the rest of their
+    row along rather than being cut off.
+
+    Attributes:
+        headers (List[str]): The headers of the columns.
+        widths (List[int]): Fixed widths of the columns, or None to work them
+            out from the rows.
+        lookahead (int): How many rows to look at to work out the widths.
+        file (IO): Where to print the table to.
+        separator (str): What to print between columns.
+    """
+    def __init__(self,
+                 headers: List[str],
+                 widths: List[int] = None,
+                 lookahead: int = DEFAULT_LOOKAHEAD,
+                 file: IO = None,
+                 separator: str = "  ") -> None:
+        self.headers = headers
+        self.widths = widths
+        self.lookahead = lookahead
+        self.file = file
+        self.separator = separator
+
+    def _format_row(self, row: List[str], widths: List[int]) -> str:
+        """Format a row of the table.
+
+        Args:
+            row (List[str]): The cells of the row.
+            widths (List[int]): The width of each column.
+
+        Returns:
+            str: The formatted row.
+        """
+        cells = [
+            cell + " " * (width - visible_len(cell))
+            for cell, width in zip(row[:-1], widths)
+        ]
+        # don't pad the last column, it would just be trailing whitespace
+        cells.append(row[-1])
+        return self.separator.join(cells)
+
+    def print_rows(self, rows: Iterable[List[str]]) -> None:
+        """Print the table.
+
+        Args:
+            rows (Iterable[List[str]]): The rows of the table. Each row is
+                printed as soon as it is taken from the iterable, once the
+                column widths are known.
+        """
+        file = self.file or sys.stdout
+        rows = iter(rows)
+
+        widths = self.widths
+        first_rows = []
+        if widths is None:
+            first_rows = list(islice(rows, self.lookahead))
+            widths = [
+                max(visible_len(cell) for cell in column)
+                for column in zip(self.headers, *first_rows)
+            ]
+
+        print(self._format_row(self.headers, widths), file=file, flush=True)
+        for row in first_rows:
+            print(self._format_row(row, widths), file=file)
+        file.flush()
+        for row in rows:
+            print(self._format_row(row, widths), file=file, flush=True)
+
+
+def format_field(value: Any, field: "FieldInfo") -> str:
+    """Format the value of a field to show in a table, depending on its type.
+
+    Args:
+        value (Any): The value, as Azure DevOps returns it.
+        field (FieldInfo): The field.
+
+    Returns:
+        str: The formatted value. Values longer than MAX_FIELD_WIDTH are cut
+            short.
+    """
+    if value is None:
+        return ""
+    if isinstance(value, dict):
+        # people are returned as identities
+        text = value.get("uniqueName") or value.get("displayName") or ""
+    elif field.type == "dateTime":
+        # i.e. 2020-01-02T03:04:05.67Z, shown to the minute
+        text = str(value)[:16].replace("T", " ")
+    elif field.type == "double" and isinstance(value, float) \
+            and value.is_integer():
+        text = str(int(value))
+    elif field.type in ("html", "history"):
+        text = " ".join(html.unescape(HTML_TAG.sub(" ", str(value))).split())
+    else:
+        text = " ".join(str(value).split())
+
+    if len(text) > MAX_FIELD_WIDTH:
+        text = text[:MAX_FIELD_WIDTH - 1] + "…"
+    return text
+
+
+def work_item_row(work_item: "WorkItemContainer",
+                  fields: List["FieldInfo"] = None,
+                  sources: bool = False) -> List[str]:
+    """Get the row of the work item table for a work item.
+
+    Args:
+        work_item (WorkItemContainer): The work item.
+        fields (List[FieldInfo]): The other fields to show, after the default
+            ones.
+        sources (bool): Whether to show which target the work item came from,
+            after the default fields.
+
+    Returns:
+        List[str]: The cells of the row.
+    """
+    item_type = "PBI" if work_item.work_type == "Product Backlog Item" \
+        else work_item.work_type
+
+    # figure out which colour to print the state as
+    state_colour = colorama.Fore.WHITE
+    if work_item.state == "New" or work_item.state == "Approved":
+        state_colour = colorama.Fore.LIGHTWHITE_EX
+    elif work_item.board_column == "On Hold":
+        state_colour = colorama.Fore.RED
+    elif work_item.state == "In Development":
+        state_colour = colorama.Fore.YELLOW
+    elif work_item.state == "Validation":
+        state_colour = colorama.Fore.BLUE
+    elif work_item.state == "Done":
+        state_colour = colorama.Fore.GREEN
+    state = f"{state_colour}● {colorama.Style.RESET_ALL}{work_item.board_column}"
+
+    values = work_item.fields or {}
+    return [
+        f"#{work_item.id_number}", item_type, work_item.title, state,
+        work_item.assigned_to
+    ] + ([work_item.source or ""] if sources else []) + [
+        format_field(values.get(field.reference_name), field)
+        for field in fields or []
+    ]
+
+
+def print_work_item_table(work_items: Iterable["WorkItemContainer"],
+                          lookahead: int = DEFAULT_LOOKAHEAD,
+                          file: IO = None,
+                          fields: List["FieldInfo"] = None,
+                          sources: bool = False) -> None:
+    """Print work items as a table, a row at a time as they arrive.
+
+    Args:
+        work_items (Iterable[WorkItemContainer]): The work items to print.
+        lookahead (int): How many work items to look at to work out the
+            widths of the columns.
+        file (IO): Where to print the table to. Defaults to stdout.
+        fields (List[FieldInfo]): The other fields to show a column for,
+            after the default ones.
+        sources (bool): Whether to show which target each work item came
+            from, after the default fields.
+    """
+    headers = WORK_ITEM_HEADERS + (["Source"] if sources else []) + \
+        [field.name for field in fields or []]
+    table = StreamingTable(headers, lookahead=lookahead, file=file)
+    table.print_rows(
+        work_item_row(work_item, fields, sources) for work_item in work_items)
+
+
+def print_work_item_tree(work_items: Iterable[Tuple[int,
+                                                   "WorkItemContainer"]],
+                         lookahead: int = DEFAULT_LOOKAHEAD,
+                         file: IO = None,
+                         fields: List["FieldInfo"] = None) -> None:
+    """Print trees of work items as a table, with the IDs of the work items
+    indented under their parents, a row at a time as they arrive.
+
+    Args:
+        work_items (Iterable[Tuple[int, WorkItemContainer]]): How many levels
+            below the top of its tree each work item is, and the work item,
+            going down the trees depth first.
+        lookahead (int): How many work items to look at to work out the
+            widths of the columns.
+        file (IO): Where to print the table to. Defaults to stdout.
+        fields (List[FieldInfo]): The other fields to show a column for,
+            after the default ones.
+    """
+    def tree_row(level: int, work_item: "WorkItemContainer") -> List[str]:
+        row = work_item_row(work_item, fields)
+        row[0] = "  " * level + row[0]
+        return row
+
+    headers = WORK_ITEM_HEADERS + [field.name for field in fields or []]
+    table = StreamingTable(headers, lookahead=lookahead, file=file)
+    table.print_rows(
+        tree_row(level, work_item) for level, work_item in work_items)
+
+
+def plain_field(value: Any) -> str:
+    """Format the value of a field for another program to read, without
+    shortening it.
+
+    Args:
+        value (Any): The value, as Azure DevOps returns it.
+
+    Returns:
+        str: The value. People are given by their unique name.
+    """
+    if value is None:
+        return ""
+    if isinstance(value, dict):
+        return value.get("uniqueName") or value.get("displayName") or ""
+    return str(value)
+
+
+def work_item_record(work_item: "WorkItemContainer",
+                     fields: List["FieldInfo"] = None,
+                     sources: bool = False) -> List[str]:
+    """Get the record for a work item when writing it as CSV or TSV.
+
+    Args:
+        work_item (WorkItemContainer): The work item.
+        fields (List[FieldInfo]): The other fields to write, after the
+            default ones.
+        sources (bool): Whether to write which target the work item came
+            from, after the default fields.
+
+    Returns:
+        List[str]: The values, in the same order as WORK_ITEM_KEYS, then the
+            source and then the fields.
+    """
+    values = work_item.fields or {}
+    return [
+        str(work_item.id_number), work_item.work_type, work_item.title,
+        work_item.state, work_item.board_column, work_item.assigned_to
+    ] + ([work_item.source or ""] if sources else []) + [
+        plain_field(values.get(field.reference_name))
+        for field in fields or []
+    ]
+
+
+def write_work_items(work_items: Iterable["WorkItemContainer"],
+                     output_format: str,
+                     file: IO = None,
+                     fields: List["FieldInfo"] = None,
+                     sources: bool = False) -> None:
+    """Write work items in one of the OUTPUT_FORMATS.
+
+    Other than 'table', each work item is written as soon as it arrives and
+    then forgotten, so any number of work items can be written, and nothing is
+    coloured.
+
+    - 'jsonl' writes each work item's dict as a line of JSON.
+    - 'csv' writes a header and a record for each work item.
+    - 'tsv' is the same, separated by tabs. Tabs and line breaks in values are
+      replaced with spaces, so every line is a work item.
+
+    Args:
+        work_items (Iterable[WorkItemContainer]): The work items to write.
+        output_format (str): The format to write them in.
+        file (IO): Where to write them to. Defaults to stdout.
+        fields (List[FieldInfo]): The other fields to write, after the
+            default ones. CSV and TSV headers give them by reference name.
+        sources (bool): Whether to write which target each work item came
+            from, as 'source'. JSON lines always have it if it's set.
+
+    Raises:
+        ValueError: If the format isn't one of the OUTPUT_FORMATS.
+    """
+    if output_format == "table":
+        print_work_item_table(work_items,
+                              file=file,
+                              fields=fields,
+                              sources=sources)
+        return
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Output format '{output_format}' did not exist")
+
+    file = file or sys.stdout
+    if output_format == "jsonl":
+        for work_item in work_items:
+            print(json.dumps(work_item.to_dict()), file=file, flush=True)
+        return
+
+    headers = WORK_ITEM_KEYS + (["source"] if sources else []) + \
+        [field.reference_name for field in fields or []]
+    if output_format == "csv":
+        writer = csv.writer(file, lineterminator="\n")
+        write_row = writer.writerow
+    else:
+        def write_row(row):
+            print("\t".join(TSV_SEPARATORS.sub(" ", value) for value in row),
+                  file=file)
+
+    write_row(headers)
+    file.flush()
+    for work_item in work_items:
+        write_row(work_item_record(work_item, fields, sources))
+        file.flush()
@@ -7,22 +7,42 @@ Author:
     Sam Gibson <sgibson@glasswallsolutions.com>
 """
 
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+import contextvars
+from functools import partial
+import itertools
 import json
 import logging
-from typing import Generator, List
+import threading
+from typing import Any, Callable, ContextManager, Dict, Generator, \
+    Iterable, List, Optional, Tuple, TYPE_CHECKING, TypeVar, Union
 from urllib.parse import quote
 
+from azure.devops.client import Client
 from azure.devops.connection import Connection
 from msrest.authentication import BasicAuthentication
+from msrest.universal_http import ClientRequest
 from azure.devops.released.work_item_tracking import WorkItemTrackingClient
 from azure.devops.v5_1.work_item_tracking import WorkItem, WorkItemQueryResult,\
     Wiql, WorkItemBatchGetRequest
 from azure.devops.v5_1.work_item_tracking.models import JsonPatchOperation
 from azure.devops.released.work import WorkClient
 from azure.devops.v5_1.work import TeamContext
-from azure.devops.exceptions import AzureDevOpsServiceError
+from azure.devops.exceptions import AzureDevOpsClientRequestError, \
+    AzureDevOpsServiceError
 
-from .config import PBIConfig
+from .cache import DiskCache
+from .config import DEFAULT_POOL_SIZE, PBIConfig
+from .discovery import DiscoveryCache
+from .metadata import MetadataCache
+from .replica import CLOSED_STATES
+from .transport import Transport
+from .workitem import Change, FieldInfo, UpdateResult, WorkItemContainer
+
+if TYPE_CHECKING:
+    from .instrumentation import Instrumentation
 
 AZURE_DEVOPS_URL = "https://dev.azure.com/{0}/"
 """The URL of Azure DevOps to substitute the organisation into."""
@@ -32,91 +52,578 @@ ALLOWED_WORK_ITEM_TYPES = ["Product Backlog Item", "Bug"]
 missing fields which we need, so instead of putting a bunch of messy handling
 code in we'll just stop the user from getting them."""
 
+WORK_ITEM_BATCH_SIZE = 200
+"""The maximum number of work items Azure DevOps allows in a single batch get
+or batch update request."""
+
+MAX_CONCURRENT_REQUESTS = DEFAULT_POOL_SIZE
+"""The default maximum number of requests to have in flight at once when an
+operation is split over multiple requests."""
+
+WORK_ITEM_FIELDS = [
+    "System.Id", "System.Title", "System.WorkItemType", "System.AssignedTo",
+    "System.State", "System.BoardColumn"
+]
+"""The fields we need to get for a work item to create a WorkItemContainer."""
+
+SYNC_FIELDS = WORK_ITEM_FIELDS + [
+    "System.ChangedDate", "System.Rev", "System.AreaPath"
+]
+"""The fields we need to get for a work item to store it in the replica."""
+
+WIQL_PAGE_SIZE = 1000
+"""How many work item IDs to get from each page of a WIQL query. The service
+won't return more than 20,000 from a single query, so large results have to be
+paged."""
+
+WIQL_COUNT_PAGE_SIZE = 20000
+"""How many work item IDs to get from each page of a WIQL query that only
+counts them. As the work items aren't fetched, pages are as big as the service
+allows."""
 
-class WorkItemContainer:
-    """WorkItemContainer is used as a wrapper for an Azure DevOps work item.
+HIERARCHY_LINK_TYPE = "System.LinkTypes.Hierarchy-Forward"
+"""The type of the links from work items to their children."""
 
-    Attributes:
-        id_number (int): The ID number of the work item.
-        title (str): The title of the work item.
-        work_type (str): The type of the work item.
-        assigned_to (str): The unique name of who the work item is assigned to.
-            This is usually their email.
-        state (str): The current state of the work item.
-        board_column (str): Which board column the work item is in.
-        work_item (WorkItem): The Azure DevOps work item used to generate this.
+BACKLOG_BOARD = "Backlog items"
+"""The name of the board that PBIs and Bugs are shown on."""
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def organisation_url(cfg: PBIConfig) -> str:
+    """Get the URL of the Azure DevOps organisation to connect to.
+
+    Args:
+        cfg (PBIConfig): The config to get the URL from.
+
+    Returns:
+        str: The URL, ending with a slash.
     """
-    def __init__(self, work_item: WorkItem) -> None:
-        """Create a WorkItemContainer from an Azure DevOps WorkItem.
+    if cfg.url:
+        return cfg.url.rstrip("/") + "/"
+    return AZURE_DEVOPS_URL.format(cfg.organisation)
 
-        Args:
-            work_item (WorkItem): The WorkItem to create this container from.
-        """
-        self.id_number = work_item.id
-        self.title = work_item.fields["System.Title"]
-        self.work_type = work_item.fields["System.WorkItemType"]
 
-        # if the work item is unassigned the field will not be present
-        if work_item.fields.get("System.AssignedTo") is not None:
-            self.assigned_to = work_item.fields["System.AssignedTo"][
-                "uniqueName"]
-        else:
-            self.assigned_to = "Unassigned"
+def chunks(items: Iterable[T], size: int) -> Generator[List[T], None, None]:
+    """Split an iterable into lists of at most a given size.
+
+    Args:
+        items (Iterable[T]): The items to split up.
+        size (int): The maximum size of each chunk.
+
+    Yields:
+        List[T]: Chunks of the items, in order.
+    """
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def unique(items: Iterable[T]) -> Generator[T, None, None]:
+    """Remove duplicates from an iterable whilst keeping the order, without
+    having to take every item from it first.
+
+    Args:
+        items (Iterable[T]): The items to remove duplicates from.
+
+    Yields:
+        T: The first occurrence of each item.
+    """
+    seen = set()
+    for item in items:
+        if item not in seen:
+            seen.add(item)
+            yield item
+
+
+def bounded_map(func: Callable[[T], R], items: Iterable[T],
+                max_workers: int) -> Generator[R, None, None]:
+    """Call a function on each item concurrently, with at most max_workers
+    calls in flight at once. Items are only taken from the iterable when there
+    is room for them, so it can be lazily generated.
+
+    Args:
+        func (Callable[[T], R]): The function to call on each item.
+        items (Iterable[T]): The items to call the function on.
+        max_workers (int): The maximum number of calls to have in flight.
+
+    Yields:
+        R: The result of each call, in the same order as the items.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque()
+        for item in items:
+            # calls run in the context of the caller, so the daemon knows
+            # which request anything they print or log belongs to
+            pending.append(
+                executor.submit(contextvars.copy_context().run, func, item))
+            if len(pending) >= max_workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def assigned_to_condition(emails: Union[str, List[str]]) -> str:
+    """Create a WIQL condition matching work items assigned to any of a list of
+    users.
+
+    Args:
+        emails (Union[str, List[str]]): The email of the user, or of each user.
+
+    Returns:
+        str: The condition.
+    """
+    if isinstance(emails, str):
+        emails = [emails]
+    quoted = [f"""'{email.replace("'", "''")}'""" for email in emails]
+    if len(quoted) == 1:
+        return f"[System.AssignedTo]={quoted[0]}"
+    return f"[System.AssignedTo] IN ({', '.join(quoted)})"
+
+
+def user_pbis_query(email: Union[str, List[str]],
+                    after: int = 0,
+                    project: str = None) -> str:
+    """Create a WIQL query for the open PBIs and Bugs assigned to a user, or to
+    any of a list of users.
+
+    Args:
+        email (Union[str, List[str]]): The email of the user, or of each user.
+        after (int): Only match work items with an ID greater than this. Used
+            to page through the results in ID order.
+        project (str): Only match work items in this project. If None work
+            items anywhere in the organisation match.
+
+    Returns:
+        str: The WIQL query.
+    """
+    condition = assigned_to_condition(email)
+    if project is not None:
+        quoted = project.replace("'", "''")
+        condition += f" AND [System.TeamProject]='{quoted}'"
+    return f"""SELECT [System.ID], [System.Title] 
+                    FROM workitems 
+                    WHERE {condition} 
+                    AND [System.State]<>'Done' 
+                    AND [System.State]<>'Removed'
+                    AND ([System.WorkItemType]='Product Backlog Item'
+                        OR [System.WorkitemType]='Bug')
+                    AND [System.Id]>{after}
+                    ORDER BY [System.Id]"""
+
+
+def changed_user_pbis_query(email: str, since: str, after: int = 0) -> str:
+    """Create a WIQL query for the PBIs and Bugs that have ever been assigned
+    to a user and have changed since a given time, so ones that have been
+    closed or assigned to someone else are found too.
+
+    Args:
+        email (str): The email of the user.
+        since (str): Only match work items changed at or after this time, as
+            an ISO 8601 UTC timestamp.
+        after (int): Only match work items with an ID greater than this. Used
+            to page through the results in ID order.
+
+    Returns:
+        str: The WIQL query. It needs time precision turning on, so the time
+            isn't rounded to the day.
+    """
+    email = email.replace("'", "''")
+    return f"""SELECT [System.ID]
+                    FROM workitems
+                    WHERE [System.AssignedTo] EVER '{email}'
+                    AND ([System.WorkItemType]='Product Backlog Item'
+                        OR [System.WorkitemType]='Bug')
+                    AND [System.ChangedDate]>='{since}'
+                    AND [System.Id]>{after}
+                    ORDER BY [System.Id]"""
+
 
-        self.state = work_item.fields["System.State"]
-        self.board_column = work_item.fields["System.BoardColumn"]
-        self.work_item = work_item
+def changed_work_items_query(project: str,
+                             since: str = None,
+                             after: int = 0) -> str:
+    """Create a WIQL query for the PBIs and Bugs in a project that have changed
+    since a given time.
 
-    def __str__(self):
-        return f"#{self.id_number} ({self.work_type}):" + \
-            f" {self.title}, {self.assigned_to} => {self.board_column}"
+    Args:
+        project (str): The project to find work items in.
+        since (str): Only match work items changed at or after this time, as
+            an ISO 8601 UTC timestamp. None matches every work item.
+        after (int): Only match work items with an ID greater than this. Used
+            to page through the results in ID order.
 
-    def __eq__(self, other):
-        if isinstance(self, other.__class__):
-            return self.id_number == other.id_number \
-                and self.title == other.title \
-                and self.work_type == other.work_type \
-                and self.assigned_to == other.assigned_to \
-                and self.state == other.state \
-                and self.board_column == other.board_column \
-                and self.work_item == other.work_item
-        return False
+    Returns:
+        str: The WIQL query. It needs time precision turning on, so the time
+            isn't rounded to the day.
+    """
+    changed = f"AND [System.ChangedDate]>='{since}'" if since else ""
+    project = project.replace("'", "''")
+    return f"""SELECT [System.ID]
+                    FROM workitems
+                    WHERE [System.TeamProject]='{project}'
+                    AND ([System.WorkItemType]='Product Backlog Item'
+                        OR [System.WorkitemType]='Bug')
+                    {changed}
+                    AND [System.Id]>{after}
+                    ORDER BY [System.Id]"""
+
+
+def board_condition(field: str, values: List[List[Union[str, bool]]]) -> str:
+    """Create a WIQL condition matching the work items on a board, by the
+    values of the field the board's team owns work items by.
+
+    Args:
+        field (str): The reference name of the field, usually
+            'System.AreaPath'.
+        values (List[List[Union[str, bool]]]): Each value the team owns, and
+            whether it owns the values under it too.
+
+    Returns:
+        str: The condition.
+    """
+    conditions = []
+    for value, include_children in values:
+        value = value.replace("'", "''")
+        operator = "UNDER" if include_children else "="
+        conditions.append(f"[{field}] {operator} '{value}'")
+    return f"({' OR '.join(conditions) or '1=0'})"
+
+
+def board_count_query(board: str, condition: str, after: int = 0) -> str:
+    """Create a WIQL query for the IDs of the PBIs and Bugs on a board that
+    match a condition, so they can be counted.
+
+    Args:
+        board (str): The condition matching the work items on the board, from
+            board_condition().
+        condition (str): The condition to count the work items matching.
+        after (int): Only match work items with an ID greater than this. Used
+            to page through the results in ID order.
+
+    Returns:
+        str: The WIQL query.
+    """
+    return f"""SELECT [System.ID]
+                    FROM workitems
+                    WHERE {board}
+                    AND {condition}
+                    AND ([System.WorkItemType]='Product Backlog Item'
+                        OR [System.WorkitemType]='Bug')
+                    AND [System.Id]>{after}
+                    ORDER BY [System.Id]"""
+
+
+def tree_query(numbers: List[int]) -> str:
+    """Create a WIQL query for the links from work items to their children,
+    their children's children and so on.
+
+    Args:
+        numbers (List[int]): The IDs of the work items at the top of the
+            trees.
+
+    Returns:
+        str: The WIQL query.
+    """
+    ids = ", ".join(str(number) for number in numbers)
+    return f"""SELECT [System.Id]
+                    FROM WorkItemLinks
+                    WHERE [Source].[System.Id] IN ({ids})
+                    AND [System.Links.LinkType]='{HIERARCHY_LINK_TYPE}'
+                    MODE (Recursive)"""
+
+
+def tree_levels(numbers: List[int],
+                links: Iterable[Tuple[Optional[int], int]],
+                depth: int = None) -> List[List[int]]:
+    """Split the work items in trees into levels, from the links between
+    them.
+
+    Each level is in the order the work items are shown in the trees: the
+    children of each work item in the level above, in order. So going down the
+    trees depth first takes the work items of each level in order.
+
+    Args:
+        numbers (List[int]): The IDs of the work items at the top of the
+            trees.
+        links (Iterable[Tuple[Optional[int], int]]): The ID of each parent and
+            child. Links with no parent are ignored.
+        depth (int): How many levels below the top to go, or None for all of
+            them.
+
+    Returns:
+        List[List[int]]: The IDs in each level, starting with the top.
+    """
+    children = {}
+    for parent, child in links:
+        if parent is not None:
+            children.setdefault(parent, []).append(child)
+
+    levels = [list(dict.fromkeys(numbers))]
+    seen = set(levels[0])
+    while depth is None or len(levels) <= depth:
+        level = []
+        for parent in levels[-1]:
+            for child in children.get(parent, []):
+                # a work item given at the top is only shown there
+                if child not in seen:
+                    seen.add(child)
+                    level.append(child)
+        if not level:
+            break
+        levels.append(level)
+    return levels
+
+
+def paged_query_ids(query_page: Callable[[int, int], List[int]],
+                    top: int = None,
+                    page_size: int = WIQL_PAGE_SIZE
+                    ) -> Generator[int, None, None]:
+    """Page through the results of a WIQL query in ID order. Each page is only
+    queried once the IDs from the one before it have been used up, so the IDs
+    can be fetched as they arrive.
+
+    Args:
+        query_page (Callable[[int, int], List[int]]): Runs the query for work
+            items with IDs after the first argument, returning at most the
+            second argument of their IDs in ascending order.
+        top (int): The maximum number of IDs to get, or None for all of them.
+        page_size (int): How many IDs to get in each page.
+
+    Yields:
+        int: The IDs of the work items, in ascending order.
+    """
+    last_id = 0
+    remaining = top
+    while remaining is None or remaining > 0:
+        size = page_size if remaining is None else min(page_size, remaining)
+        page = query_page(last_id, size)
+        # stop if the page went backwards, rather than looping forever
+        page = [number for number in page[:size] if number > last_id]
+        yield from page
+        if len(page) < size:
+            return
+        last_id = page[-1]
+        if remaining is not None:
+            remaining -= len(page)
+
+
+def containers_in_order(numbers: List[int],
+                        work_items: Iterable[WorkItem],
+                        fields: List[str] = None,
+                        missing_ok: bool = False) -> List[WorkItemContainer]:
+    """Create WorkItemContainers for the result of a batch get, in the order the
+    IDs were requested.
+
+    Args:
+        numbers (List[int]): The IDs that were requested.
+        work_items (Iterable[WorkItem]): The work items that were returned.
+        fields (List[str]): The reference names of the fields that were asked
+            for as well as WORK_ITEM_FIELDS.
+        missing_ok (bool): Whether to leave out work items that could not be
+            found without logging an error.
+
+    Returns:
+        List[WorkItemContainer]: The work items, in the order their IDs were
+            given. Work items that could not be found or were of a type we
+            don't allow are left out.
+    """
+    # missing work items come back as None when using the omit error policy
+    by_id = {
+        work_item.id: work_item
+        for work_item in work_items if work_item is not None
+    }
+    containers = []
+    for number in numbers:
+        work_item = by_id.get(number)
+        if work_item is None:
+            if not missing_ok:
+                logging.error(f"Work item #{number} could not be found")
+            continue
+        if work_item.fields["System.WorkItemType"] \
+                not in ALLOWED_WORK_ITEM_TYPES:
+            logging.error(f"Work item #{work_item.id} was not a PBI or a Bug")
+            continue
+        containers.append(WorkItemContainer(work_item, fields=fields))
+    return containers
+
+
+class WorkItemBatchClient(Client):
+    """A client for the work item batch endpoint, which lets us send updates
+    for many work items in a single request. The Azure DevOps SDK doesn't have
+    a client for it.
+    """
+    resource_area_identifier = WorkItemTrackingClient.resource_area_identifier
+
+    def update_work_items_batch(
+            self, documents: Dict[int, List[JsonPatchOperation]]
+    ) -> List[dict]:
+        """Update multiple work items in a single request.
+
+        Args:
+            documents (Dict[int, List[JsonPatchOperation]]): The JSON patch
+                document for each work item, keyed by work item ID. There can
+                be at most WORK_ITEM_BATCH_SIZE of them.
+
+        Returns:
+            List[dict]: The response for each work item, in the same order as
+                the documents. Each one has the status 'code' and the response
+                'body' of the update.
+
+        Raises:
+            AzureDevOpsClientRequestError: If the batch request was rejected.
+        """
+        content = [{
+            "method": "PATCH",
+            "uri": f"/_apis/wit/workitems/{number}?api-version=5.1",
+            "headers": {
+                "Content-Type": "application/json-patch+json"
+            },
+            "body": [op.serialize() for op in document]
+        } for number, document in documents.items()]
+        url = self._combine_url(self.config.base_url, "_apis/wit/$batch")
+        request = ClientRequest(method="POST",
+                                url=self._client.format_url(url))
+        request.format_parameters({"api-version": "5.1"})
+        headers = {
+            "Content-Type": "application/json; charset=utf-8",
+            "Accept": "application/json"
+        }
+        response = self._send_request(request,
+                                      headers=headers,
+                                      content=content,
+                                      media_type="application/json")
+        return response.json()["value"]
 
 
 class AzureDevOpsAPI:
     """A connection to the Azure DevOps API.
 
+    Clients are only created when they are first used, and the service
+    discovery they need is cached between runs, so that commands only send the
+    requests they actually need.
+
     Parameters:
         credentials (BasicAuthentication): The credentials used to connect.
         connection (Connection): The actual connection to the API.
         work_item_client (WorkItemTrackingClient): A client for work item tracking.
         work_client (WorkClient): A client for work tracking.
+        core_client (CoreClient): A client for projects and teams.
+        batch_client (WorkItemBatchClient): A client for batch work item
+            updates.
+        transport (Transport): The connection pool shared by the clients.
+        max_workers (int): The maximum number of requests to have in flight at
+            once when an operation is split over multiple requests.
+        instrumentation (Instrumentation): Records the timing of every
+            request, or None if they aren't being recorded.
     """
-    def __init__(self, cfg: PBIConfig) -> None:
+    def __init__(self,
+                 cfg: PBIConfig,
+                 max_workers: int = None,
+                 instrumentation: "Instrumentation" = None) -> None:
         """Connect to the Azure DevOps API using the PBI config.
 
         Args:
-            project (str): The Azure DevOps project to use.
             cfg (PBIConfig): The config to use to connect to the API.
+            max_workers (int): The maximum number of concurrent requests.
+                Defaults to the size of the connection pool.
+            instrumentation (Instrumentation): Records the timing of every
+                request and of setting up each client.
         """
         self.project = cfg.project
-        self._connect(cfg.access_token, cfg.organisation)
+        self.transport = Transport(cfg.transport)
+        self.instrumentation = instrumentation
+        if instrumentation is not None:
+            instrumentation.instrument(self.transport.session)
+        self.max_workers = max_workers or cfg.transport.pool_size
+        self._clients = {}
+        self._clients_lock = threading.Lock()
+
+        self._discovery = None
+        if cfg.cache.discovery_ttl > 0:
+            self._discovery = DiscoveryCache(
+                cfg.organisation,
+                DiskCache("discovery", cfg.cache.discovery_ttl,
+                          cfg.cache.directory))
+        self._metadata = MetadataCache(
+            cfg.organisation, cfg.project,
+            DiskCache("metadata", cfg.cache.metadata_ttl, cfg.cache.directory)
+            if cfg.cache.metadata_ttl > 0 else None)
+        self._connect(cfg.access_token, organisation_url(cfg))
 
-    def _connect(self, access_token: str, organisation: str):
+    def _connect(self, access_token: str, url: str):
         """Connect to the Azure DevOps API.
 
         Args:
             access_token (str): The access token to authenticate with.
-            organisation (str): The Azure DevOps organisation to use.
+            url (str): The URL of the Azure DevOps organisation to use.
         """
         self.credentials = BasicAuthentication("", access_token)
-        self.connection = Connection(
-            base_url=AZURE_DEVOPS_URL.format(organisation),
-            creds=self.credentials)
-        self.work_item_client = self.connection.clients\
-            .get_work_item_tracking_client()
-        self.work_client = self.connection.clients.get_work_client()
-        self.core_client = self.connection.clients.get_core_client()
+        self.connection = Connection(base_url=url, creds=self.credentials)
+        if self._discovery is not None:
+            self._discovery.prime(self.connection)
+
+    def _client(self, name: str, create: Callable[[], Client]) -> Client:
+        """Get a client, creating it if this is the first time it's used.
+
+        Args:
+            name (str): The name of the client.
+            create (Callable[[], Client]): Creates the client.
+
+        Returns:
+            Client: The client.
+        """
+        with self._clients_lock:
+            if name not in self._clients:
+                with self._stage(f"connect {name}"):
+                    client = create()
+                    self.transport.configure(client)
+                    if self._discovery is not None:
+                        self._discovery.ensure(self.connection, client)
+                self._clients[name] = client
+            return self._clients[name]
+
+    def _stage(self, name: str) -> ContextManager[None]:
+        """Time a stage, if timings are being recorded.
+
+        Args:
+            name (str): The name of the stage.
+
+        Returns:
+            ContextManager[None]: Times the stage.
+        """
+        if self.instrumentation is None:
+            return nullcontext()
+        return self.instrumentation.stage(name)
+
+    @property
+    def work_item_client(self) -> WorkItemTrackingClient:
+        return self._client(
+            "work_item_tracking",
+            self.connection.clients.get_work_item_tracking_client)
+
+    @property
+    def work_client(self) -> WorkClient:
+        return self._client("work", self.connection.clients.get_work_client)
+
+    @property
+    def core_client(self) -> Client:
+        return self._client("core", self.connection.clients.get_core_client)
+
+    @property
+    def batch_client(self) -> WorkItemBatchClient:
+        return self._client(
+            "batch", lambda: self.connection.get_client(
+                f"{__name__}.{WorkItemBatchClient.__name__}"))
+
+    def close(self) -> None:
+        """Close the connections to the API."""
+        self.transport.close()
 
     def _find_column_field_name(self, work_item: WorkItem) -> str:
         """The field on a work item that stores which Kanban column it's in
@@ -133,6 +640,109 @@ class AzureDevOpsAPI:
             if field.endswith("_Kanban.Column"):
                 return field
 
+    def _find_column_field_names(self,
+                                 numbers: Iterable[int]) -> Dict[int, str]:
+        """Find the Kanban column field names for multiple work items, using
+        batched requests to get their fields.
+
+        Args:
+            numbers (Iterable[int]): The IDs of the work items.
+
+        Returns:
+            Dict[int, str]: The column field name of each work item that could
+                be found, keyed by ID.
+        """
+        # leaving out the fields gets all of them, which we need as we don't
+        # know the name of the field we're looking for
+        return {
+            number: self._find_column_field_name(work_item)
+            for number, work_item in self._read_work_items(numbers).items()
+        }
+
+    def _read_work_items(self,
+                         numbers: Iterable[int],
+                         fields: List[str] = None) -> Dict[int, WorkItem]:
+        """Read the current state of multiple work items, using batched
+        requests.
+
+        Args:
+            numbers (Iterable[int]): The IDs of the work items.
+            fields (List[str]): The fields to get, or None to get all of them.
+
+        Returns:
+            Dict[int, WorkItem]: The work items that could be found, keyed by
+                ID.
+        """
+        def get_batch(batch: List[int]) -> List[WorkItem]:
+            return self.work_item_client.get_work_items_batch(
+                WorkItemBatchGetRequest(ids=batch,
+                                        fields=fields,
+                                        error_policy="Omit"))
+
+        work_items = {}
+        for result in bounded_map(get_batch,
+                                  chunks(dict.fromkeys(numbers),
+                                         WORK_ITEM_BATCH_SIZE),
+                                  self.max_workers):
+            for work_item in result:
+                if work_item is not None:
+                    work_items[work_item.id] = work_item
+        return work_items
+
+    def get_column_field_name(self, board: str, refresh: bool = False) -> str:
+        """Get the name of the field that stores which column of a board a work
+        item is in. This is looked up once per board and cached.
+
+        Args:
+            board (str): The board to get the column field name for.
+            refresh (bool): Whether to look it up even if it is cached.
+
+        Returns:
+            str: The name of the column field.
+
+        Raises:
+            AzureDevOpsServiceError: If there was some error getting the board.
+        """
+        def fetch():
+            result = self.work_client.get_board(
+                TeamContext(project=self.project, team=board), BACKLOG_BOARD)
+            return result.fields.column_field.reference_name
+
+        return self._metadata.get("column_field", fetch, board, refresh)
+
+    def get_column_field_names(self,
+                               numbers: Iterable[int],
+                               board: str = None) -> Dict[int, str]:
+        """Get the name of the field that stores which board column each of
+        multiple work items is in.
+
+        Args:
+            numbers (Iterable[int]): The IDs of the work items.
+            board (str): The board the work items are on. If given, the column
+                field is looked up from the board instead of from the work
+                items themselves.
+
+        Returns:
+            Dict[int, str]: The column field name of each work item, keyed by
+                ID. Work items that could not be found or are not on a board
+                are logged and left out.
+
+        Raises:
+            AzureDevOpsServiceError: If there was some error getting the board.
+        """
+        if board is not None:
+            field_name = self.get_column_field_name(board)
+            return {number: field_name for number in dict.fromkeys(numbers)}
+
+        field_names = self._find_column_field_names(numbers)
+        for number in dict.fromkeys(numbers):
+            if number not in field_names:
+                logging.error(f"Work item #{number} could not be found")
+            elif field_names[number] is None:
+                logging.error(f"Work item #{number} is not on a board")
+                del field_names[number]
+        return field_names
+
     def get_work_item(self, number: int) -> WorkItemContainer:
         """Get a work item by ID.
 
@@ -147,65 +757,390 @@ class AzureDevOpsAPI:
             return None
         return WorkItemContainer(work_item)
 
-    def get_work_items(self, numbers: List[int]
+    def get_work_items(self,
+                       numbers: Iterable[int],
+                       fields: List[str] = None,
+                       missing_ok: bool = False
                        ) -> Generator[WorkItemContainer, None, None]:
         """Get multiple work items by ID.
 
+        The IDs are split into batches the size the service allows, which are
+        fetched concurrently. Duplicate IDs are only fetched once. IDs are only
+        taken from the iterable as they are needed, so it can be lazily
+        generated.
+
+        Args:
+            numbers (Iterable[int]): The IDs to get.
+            fields (List[str]): The reference names of fields to get as well as
+                WORK_ITEM_FIELDS. Only the fields asked for are sent back, so
+                each one adds to the size of the response.
+            missing_ok (bool): Whether to leave out work items that could not
+                be found without logging an error, such as when looking for
+                them in several organisations.
+
+        Yields:
+            WorkItemContainer: Work items, in the order their IDs were given.
+        """
+        for batch in bounded_map(
+                partial(self._get_work_items_batch,
+                        fields=fields,
+                        missing_ok=missing_ok),
+                chunks(unique(numbers), WORK_ITEM_BATCH_SIZE),
+                self.max_workers):
+            yield from batch
+
+    def _get_work_items_batch(self,
+                              numbers: List[int],
+                              fields: List[str] = None,
+                              missing_ok: bool = False
+                              ) -> List[WorkItemContainer]:
+        """Get a single batch of work items by ID.
+
+        Args:
+            numbers (List[int]): The IDs to get. There can be at most
+                WORK_ITEM_BATCH_SIZE of them.
+            fields (List[str]): The reference names of fields to get as well as
+                WORK_ITEM_FIELDS.
+            missing_ok (bool): Whether to leave out work items that could not
+                be found without logging an error.
+
+        Returns:
+            List[WorkItemContainer]: The work items, in the order their IDs
+                were given. Work items that could not be found or were of a
+                type we don't allow are left out.
+        """
+        try:
+            result = self.work_item_client.get_work_items_batch(
+                WorkItemBatchGetRequest(ids=numbers,
+                                        fields=WORK_ITEM_FIELDS +
+                                        (fields or []),
+                                        error_policy="Omit"))
+        except AzureDevOpsServiceError as err:
+            logging.error(err)
+            return []
+
+        return containers_in_order(numbers, result, fields, missing_ok)
+
+    def get_work_item_tree(
+            self,
+            numbers: Iterable[int],
+            depth: int = None,
+            fields: List[str] = None
+    ) -> Generator[Tuple[int, WorkItemContainer], None, None]:
+        """Get work items and the work items under them, i.e. the features of
+        an epic and their PBIs and tasks.
+
+        The whole hierarchy is found with a single links query, then each
+        level is fetched in concurrent batches, so the number of requests
+        depends on the number of levels rather than the number of work items.
+        All of the levels are fetched at once, and each work item is yielded
+        as soon as it and the ones before it have arrived. Work items of every
+        type are included.
+
         Args:
-            numbers (List[int]): The list of IDs to get.
+            numbers (Iterable[int]): The IDs of the work items at the top.
+            depth (int): How many levels below them to go, or None for all of
+                them.
+            fields (List[str]): The reference names of fields to get as well as
+                WORK_ITEM_FIELDS.
 
         Yields:
-            WorkItemContainer: Work items.
+            Tuple[int, WorkItemContainer]: How many levels below the top each
+                work item is, and the work item, going down the trees depth
+                first. Work items that could not be found are logged and left
+                out, but the work items under them aren't.
+
+        Raises:
+            AzureDevOpsServiceError: If there was some error finding the
+                links.
         """
-        if len(numbers) == 0:
+        numbers = list(dict.fromkeys(numbers))
+        if not numbers:
             return
+        links = []
+        if depth != 0:
+            result = self.work_item_client.query_by_wiql(
+                Wiql(tree_query(numbers)))
+            links = [(link.source.id if link.source is not None else None,
+                      link.target.id)
+                     for link in result.work_item_relations or []]
+        levels = tree_levels(numbers, links, depth)
+        children = {}
+        for parent, child in links:
+            children.setdefault(parent, []).append(child)
+
+        fetched = [
+            itertools.chain.from_iterable(
+                bounded_map(
+                    partial(self._get_tree_batch, fields=fields),
+                    chunks(level, WORK_ITEM_BATCH_SIZE), self.max_workers))
+            for level in levels
+        ]
+        in_levels = [set(level) for level in levels]
+
+        def visit(number: int, level: int):
+            work_item = next(fetched[level])
+            if work_item is None:
+                logging.error(f"Work item #{number} could not be found")
+            else:
+                yield level, work_item
+            if level + 1 < len(levels):
+                for child in children.get(number, []):
+                    if child in in_levels[level + 1]:
+                        yield from visit(child, level + 1)
+
+        for number in levels[0]:
+            yield from visit(number, 0)
+
+    def _get_tree_batch(self,
+                        numbers: List[int],
+                        fields: List[str] = None
+                        ) -> List[Optional[WorkItemContainer]]:
+        """Get a single batch of work items in a tree, of any type.
 
+        Args:
+            numbers (List[int]): The IDs to get. There can be at most
+                WORK_ITEM_BATCH_SIZE of them.
+            fields (List[str]): The reference names of fields to get as well as
+                WORK_ITEM_FIELDS.
+
+        Returns:
+            List[Optional[WorkItemContainer]]: The work item for each ID, in
+                the order they were given, or None if it could not be found.
+        """
         try:
             result = self.work_item_client.get_work_items_batch(
                 WorkItemBatchGetRequest(ids=numbers,
-                                        fields=[
-                                            "System.Id", "System.Title",
-                                            "System.WorkItemType",
-                                            "System.AssignedTo",
-                                            "System.State",
-                                            "System.BoardColumn"
-                                        ]))
-            for work_item in result:
-                if work_item.fields["System.WorkItemType"] \
-                        not in ALLOWED_WORK_ITEM_TYPES:
-                    logging.error(
-                        f"Work item #{work_item.id} was not a PBI or a Bug")
-                    continue
-                yield WorkItemContainer(work_item)
+                                        fields=WORK_ITEM_FIELDS +
+                                        (fields or []),
+                                        error_policy="Omit"))
         except AzureDevOpsServiceError as err:
             logging.error(err)
+            return [None] * len(numbers)
+
+        by_id = {
+            work_item.id: work_item
+            for work_item in result if work_item is not None
+        }
+        return [
+            WorkItemContainer(by_id[number], fields=fields)
+            if number in by_id else None for number in numbers
+        ]
+
+    def _query_page(self,
+                    query: str,
+                    top: int,
+                    time_precision: bool = None) -> List[int]:
+        """Run a WIQL query.
+
+        Args:
+            query (str): The WIQL query.
+            top (int): The maximum number of results to return.
+            time_precision (bool): Whether to compare dates to the second,
+                rather than the day.
+
+        Returns:
+            List[int]: The IDs of the work items the query matched.
+        """
+        result = self.work_item_client.query_by_wiql(
+            Wiql(query), time_precision=time_precision, top=top)
+        return [item.id for item in result.work_items]
 
     def get_user_pbis(self,
-                      email: str) -> Generator[WorkItemContainer, None, None]:
-        """Get all of the PBIs assigned to a user.
+                      email: Union[str, List[str]],
+                      top: int = None,
+                      fields: List[str] = None,
+                      project: str = None,
+                      missing_ok: bool = False
+                      ) -> Generator[WorkItemContainer, None, None]:
+        """Get all of the PBIs assigned to a user, or to any of a list of
+        users. Several users are found with a single query.
+
+        The query is paged, so there is no limit on how many work items it can
+        find, and work items are fetched as each page of IDs arrives.
+
+        Args:
+            email (Union[str, List[str]]): The email of the user whose PBIs to
+                get, or of each user.
+            top (int): The maximum number of work items to get, or None for
+                all of them.
+            fields (List[str]): The reference names of fields to get as well as
+                WORK_ITEM_FIELDS.
+            project (str): Only get work items in this project. If None work
+                items anywhere in the organisation are got.
+            missing_ok (bool): Whether finding no work items is expected, so
+                it isn't reported. For when the users' work items may be in
+                another project instead.
+
+        Yields:
+            WorkItemContainer: Work items assigned to the users, in ID order.
+        """
+        numbers = paged_query_ids(
+            lambda after, size: self._query_page(
+                user_pbis_query(email, after, project), size), top)
+        first = next(numbers, None)
+        if first is None:
+            if missing_ok:
+                return
+            # logged rather than printed, so it doesn't end up in the middle
+            # of output meant for other programs
+            if isinstance(email, str):
+                logging.warning(
+                    f"Could not find any work items for user '{email}'."
+                    " Did the user exist?")
+            else:
+                logging.warning(
+                    "Could not find any work items for users "
+                    f"{', '.join(repr(user) for user in email)}."
+                    " Did the users exist?")
+            return
+
+        yield from self.get_work_items(itertools.chain([first], numbers),
+                                       fields)
+
+    def _get_synced_work_items(self, query: Callable[[int], str]
+                               ) -> Generator[WorkItem, None, None]:
+        """Get the work items a WIQL query matches, with the fields needed to
+        tell whether they have changed.
+
+        Like get_work_items the query is paged and the work items are fetched
+        in concurrent batches, but errors aren't caught, so callers know not
+        to trust a partial result.
+
+        Args:
+            query (Callable[[int], str]): Creates the WIQL query for the work
+                items with IDs greater than its argument, in ID order. Dates
+                in it are compared to the second.
+
+        Yields:
+            WorkItem: The work items, in ID order.
+
+        Raises:
+            AzureDevOpsServiceError: If there was some error getting them.
+        """
+        numbers = paged_query_ids(
+            lambda after, size: self._query_page(query(after), size, True))
+
+        def get_batch(batch: List[int]) -> List[WorkItem]:
+            return self.work_item_client.get_work_items_batch(
+                WorkItemBatchGetRequest(ids=batch,
+                                        fields=SYNC_FIELDS,
+                                        error_policy="Omit"))
+
+        for result in bounded_map(get_batch,
+                                  chunks(numbers, WORK_ITEM_BATCH_SIZE),
+                                  self.max_workers):
+            # work items deleted since the query come back as None
+            yield from (work_item for work_item in result
+                        if work_item is not None)
+
+    def get_changed_work_items(self, since: str = None
+                               ) -> Generator[WorkItem, None, None]:
+        """Get the PBIs and Bugs in the project that have changed since a given
+        time, with the fields needed to store them in the replica.
+
+        Args:
+            since (str): Only get work items changed at or after this time, as
+                an ISO 8601 UTC timestamp. None gets every work item.
+
+        Yields:
+            WorkItem: The work items, in ID order.
+
+        Raises:
+            AzureDevOpsServiceError: If there was some error getting them.
+        """
+        return self._get_synced_work_items(
+            lambda after: changed_work_items_query(self.project, since, after))
+
+    def get_changed_user_pbis(self, email: str, since: str = None
+                              ) -> Generator[WorkItem, None, None]:
+        """Get the PBIs assigned to a user that have changed since a given
+        time, with the fields needed to tell whether they have changed again.
 
         Args:
             email (str): The email of the user whose PBIs to get.
+            since (str): Only get work items changed at or after this time, as
+                an ISO 8601 UTC timestamp, including ones that have been
+                closed or were assigned to the user before. None gets all of
+                the user's open work items.
 
         Yields:
-            WorkItemContainer: Work items assigned to the user.
+            WorkItem: The work items, in ID order.
+
+        Raises:
+            AzureDevOpsServiceError: If there was some error getting them.
         """
-        result = self.work_item_client.query_by_wiql(
-            Wiql(f"""SELECT [System.ID], [System.Title] 
-                    FROM workitems 
-                    WHERE [System.AssignedTo]='{email}' 
-                    AND [System.State]<>'Done' 
-                    AND [System.State]<>'Removed'
-                    AND ([System.WorkItemType]='Product Backlog Item'
-                        OR [System.WorkitemType]='Bug')"""))
-        if len(result.work_items) == 0:
-            print(f"Could not find any work items for user '{email}'."
-                  " Did the user exist?")
+        if since is None:
+            return self._get_synced_work_items(
+                lambda after: user_pbis_query(email, after))
+        return self._get_synced_work_items(
+            lambda after: changed_user_pbis_query(email, since, after))
+
+    def get_fields(self, refresh: bool = False) -> List[FieldInfo]:
+        """Get the work item fields in the project. They are cached between
+        runs, like the boards.
+
+        Args:
+            refresh (bool): Whether to get them from the service even if they
+                are cached.
+
+        Returns:
+            List[FieldInfo]: The fields.
+
+        Raises:
+            AzureDevOpsServiceError: If there was some error getting the
+                fields.
+        """
+        def fetch():
+            fields = self.work_item_client.get_fields(self.project)
+            return [[field.reference_name, field.name, field.type]
+                    for field in fields]
+
+        return [
+            FieldInfo(*field)
+            for field in self._metadata.get("fields", fetch, refresh=refresh)
+        ]
+
+    def resolve_fields(self, names: Iterable[str],
+                       refresh: bool = False) -> List[FieldInfo]:
+        """Find the fields a user asked for by name or reference name,
+        ignoring case, i.e. 'effort' or 'Microsoft.VSTS.Scheduling.Effort'.
+
+        Args:
+            names (Iterable[str]): The names of the fields.
+            refresh (bool): Whether to get the fields from the service even if
+                they are cached.
+
+        Returns:
+            List[FieldInfo]: The fields, in the order they were asked for.
+                Duplicates, and the fields in WORK_ITEM_FIELDS, which are
+                always got, are left out.
+
+        Raises:
+            ValueError: If a field didn't exist.
+            AzureDevOpsServiceError: If there was some error getting the
+                fields.
+        """
+        by_name = {}
+        for field in self.get_fields(refresh):
+            by_name.setdefault(field.name.lower(), field)
+            by_name[field.reference_name.lower()] = field
+
+        resolved = {}
+        for name in names:
+            field = by_name.get(name.strip().lower())
+            if field is None:
+                raise ValueError(f"Field '{name.strip()}' did not exist")
+            if field.reference_name not in WORK_ITEM_FIELDS:
+                resolved.setdefault(field.reference_name, field)
+        return list(resolved.values())
 
-        return self.get_work_items([item.id for item in result.work_items])
+    def get_boards(self, refresh: bool = False) -> Generator[str, None, None]:
+        """Get all boards from the organisation. They are cached between runs.
 
-    def get_boards(self) -> Generator[str, None, None]:
-        """Get all boards from the organisation.
+        Args:
+            refresh (bool): Whether to get them from the service even if they
+                are cached.
 
         Yields:
             str: Board names.
@@ -214,17 +1149,48 @@ class AzureDevOpsAPI:
             AzureDevOpsServiceError: If there was some error getting the boards.
         """
         try:
-            for board in self.core_client.get_teams(self.project):
-                yield board.name
+            boards = self._metadata.get(
+                "boards", lambda: [
+                    team.name
+                    for team in self.core_client.get_teams(self.project)
+                ],
+                refresh=refresh)
         except AzureDevOpsServiceError as err:
             logging.error(err)
             raise
+        yield from boards
+
+    def _get_board_columns(self, board: str, refresh: bool) -> List[str]:
+        """Get the names of the columns of a board, from the cache if they're
+        in it.
+
+        Args:
+            board (str): The board to get columns for.
+            refresh (bool): Whether to get them from the service even if they
+                are cached.
+
+        Returns:
+            List[str]: The column names.
 
-    def get_board_states(self, board: str) -> Generator[str, None, None]:
-        """Get all possible states of the board.
+        Raises:
+            AzureDevOpsServiceError: If there was some error getting the
+                columns.
+        """
+        def fetch():
+            result = self.work_client.get_board_columns(
+                TeamContext(project=self.project, team=board), BACKLOG_BOARD)
+            return [column.name for column in result]
+
+        return self._metadata.get("columns", fetch, board, refresh)
+
+    def get_board_states(self, board: str,
+                         refresh: bool = False) -> Generator[str, None, None]:
+        """Get all possible states of the board. They are cached between runs.
 
         Args:
             board (str): The board to get states for.
+            refresh (bool): Whether to get them from the service even if they
+                are cached.
 
         Yields:
             str: Board states of the board.
@@ -233,15 +1199,477 @@ class AzureDevOpsAPI:
             AzureDevOpsServiceError: If there was some error getting the states.
         """
         try:
-            result = self.work_client.get_board_columns(
-                TeamContext(project=self.project, team=board), "Backlog items")
-            for column in result:
-                yield column.name
+            columns = self._get_board_columns(board, refresh)
         except AzureDevOpsServiceError as err:
             logging.error(err)
             raise
+        yield from columns
+
+    def match_column(self,
+                     column: str,
+                     board: str = None,
+                     refresh: bool = False) -> Optional[str]:
+        """Check a column exists before moving work items to it, using the
+        cached board metadata so that a bad column name is caught without
+        sending any updates.
+
+        Args:
+            column (str): The column name to check. Case is ignored.
+            board (str): The board the column should be on. If not given, the
+                column can be on any board in the project.
+            refresh (bool): Whether to get the columns from the service even
+                if they are cached.
+
+        Returns:
+            str: The name of the column as the board spells it, or None if no
+                board has it. If the columns of no board could be found, the
+                column is returned as given, so the service can decide.
+
+        Raises:
+            AzureDevOpsServiceError: If there was some error getting the
+                columns of the board that was given, or the list of boards.
+        """
+        if board is not None:
+            columns = [self._get_board_columns(board, refresh)]
+        else:
+            def board_columns(board: str) -> List[str]:
+                # not every team has a backlog board, so skip those that don't
+                try:
+                    return self._get_board_columns(board, refresh)
+                except AzureDevOpsServiceError as err:
+                    logging.debug(f"Could not get columns of '{board}': {err}")
+                    return []
+
+            columns = list(
+                bounded_map(board_columns, self.get_boards(refresh),
+                            self.max_workers))
+
+        if not any(columns):
+            return column
+        for name in itertools.chain.from_iterable(columns):
+            if name.casefold() == column.casefold():
+                return name
+        return None
+
+    def get_board_areas(self, board: str,
+                        refresh: bool = False) -> Dict[str, Any]:
+        """Get which work items are on a board: the field its team owns work
+        items by, usually the area path, and the values it owns. They are
+        cached between runs.
 
-    def move_work_item(self, number: int, state: str) -> WorkItemContainer:
+        Args:
+            board (str): The board.
+            refresh (bool): Whether to get them from the service even if they
+                are cached.
+
+        Returns:
+            Dict[str, Any]: The reference name of the 'field', and the
+                'values' the team owns, each with whether it owns the values
+                under it too.
+
+        Raises:
+            AzureDevOpsServiceError: If there was some error getting them.
+        """
+        def fetch():
+            result = self.work_client.get_team_field_values(
+                TeamContext(project=self.project, team=board))
+            return {
+                "field": result.field.reference_name,
+                "values": [[value.value, bool(value.include_children)]
+                           for value in result.values]
+            }
+
+        return self._metadata.get("areas", fetch, board, refresh)
+
+    def get_board_members(self, board: str,
+                          refresh: bool = False) -> List[str]:
+        """Get the unique names of the members of a board's team. They are
+        cached between runs.
+
+        Args:
+            board (str): The board.
+            refresh (bool): Whether to get them from the service even if they
+                are cached.
+
+        Returns:
+            List[str]: The unique names, which are usually emails.
+
+        Raises:
+            AzureDevOpsServiceError: If there was some error getting them.
+        """
+        def fetch():
+            return [
+                member.identity.unique_name
+                for member in self.core_client.
+                get_team_members_with_extended_properties(self.project, board)
+            ]
+
+        return self._metadata.get("members", fetch, board, refresh)
+
+    def get_states(self, refresh: bool = False) -> List[str]:
+        """Get the states PBIs and Bugs can be in. They are cached between
+        runs.
+
+        Args:
+            refresh (bool): Whether to get them from the service even if they
+                are cached.
+
+        Returns:
+            List[str]: The states, in the order the work item types give them.
+
+        Raises:
+            AzureDevOpsServiceError: If there was some error getting them.
+        """
+        def fetch():
+            states = {}
+            for work_type in ALLOWED_WORK_ITEM_TYPES:
+                result = self.work_item_client.get_work_item_type(
+                    self.project, work_type)
+                states.update(dict.fromkeys(state.name
+                                            for state in result.states))
+            return list(states)
+
+        return self._metadata.get("states", fetch, refresh=refresh)
+
+    def _count(self, board: str, condition: str) -> int:
+        """Count the PBIs and Bugs on a board that match a condition, without
+        fetching them.
+
+        Args:
+            board (str): The condition matching the work items on the board.
+            condition (str): The condition to count the work items matching.
+
+        Returns:
+            int: How many work items matched.
+        """
+        return sum(1 for _ in paged_query_ids(
+            lambda after, size: self._query_page(
+                board_count_query(board, condition, after), size),
+            page_size=WIQL_COUNT_PAGE_SIZE))
+
+    def get_board_stats(self, board: str,
+                        refresh: bool = False) -> Dict[str, Dict[str, int]]:
+        """Count the PBIs and Bugs on a board by column, by state and by who
+        they are assigned to.
+
+        Only the IDs of the work items are queried, a query for each column,
+        state and member of the board's team, so the cost doesn't grow with
+        the number of work items. The board's columns, areas and members, and
+        the states, are cached metadata. Removed work items aren't counted.
+
+        Args:
+            board (str): The board.
+            refresh (bool): Whether to get the board's metadata from the
+                service even if it is cached.
+
+        Returns:
+            Dict[str, Dict[str, int]]: The number of work items in each
+                'column' of the board, in order, and each 'state'. The open
+                work items assigned to each 'assignee' of the team, to no-one
+                ('Unassigned') and to anyone else ('Others'). Assignees with no
+                work items are left out.
+
+        Raises:
+            AzureDevOpsServiceError: If there was some error getting the
+                metadata or running the queries.
+        """
+        areas = self.get_board_areas(board, refresh)
+        scope = board_condition(areas["field"], areas["values"])
+        columns = self._get_board_columns(board, refresh)
+        states = [
+            state for state in self.get_states(refresh)
+            if state != "Removed"
+        ]
+        members = self.get_board_members(board, refresh)
+
+        def equals(field: str, value: str) -> str:
+            value = value.replace("'", "''")
+            return f"[{field}]='{value}'"
+
+        open_work = " AND ".join(
+            f"[System.State]<>'{state}'" for state in CLOSED_STATES)
+        queries = [("column", column,
+                    f"{equals('System.BoardColumn', column)} "
+                    "AND [System.State]<>'Removed'") for column in columns]
+        queries += [("state", state, equals("System.State", state))
+                    for state in states]
+        queries += [("assignee", member,
+                     f"{equals('System.AssignedTo', member)} AND {open_work}")
+                    for member in members]
+        # unassigned work items have an empty assignee
+        queries.append(("assignee", "Unassigned",
+                        f"[System.AssignedTo]='' AND {open_work}"))
+
+        counts = bounded_map(lambda query: self._count(scope, query[2]),
+                             queries, self.max_workers)
+        stats = {"column": {}, "state": {}, "assignee": {}}
+        for (kind, name, _), count in zip(queries, counts):
+            if kind != "assignee" or count:
+                stats[kind][name] = count
+
+        others = sum(count for state, count in stats["state"].items()
+                     if state not in CLOSED_STATES) \
+            - sum(stats["assignee"].values())
+        if others > 0:
+            stats["assignee"]["Others"] = others
+        return stats
+
+    def plan_move(self,
+                  numbers: Iterable[int],
+                  state: str,
+                  board: str = None,
+                  keep_work_items: bool = False) -> List[Change]:
+        """Work out how moving work items to a board column would change them,
+        from their current state. Nothing is updated.
+
+        Args:
+            numbers (Iterable[int]): The IDs of the work items.
+            state (str): The board column to move them to.
+            board (str): The board the work items are on. If given, the column
+                field is looked up from the board, and only the fields that are
+                needed are read from the work items.
+            keep_work_items (bool): Whether the work items in the changes
+                should keep the Azure DevOps work items they were created from.
+
+        Returns:
+            List[Change]: The change to each work item, in the order they were
+                given. Work items that could not be found or are not on a board
+                are logged and left out.
+
+        Raises:
+            AzureDevOpsServiceError: If there was some error getting the board.
+        """
+        numbers = list(dict.fromkeys(numbers))
+        field_name = None
+        if board is not None:
+            field_name = self.get_column_field_name(board)
+            work_items = self._read_work_items(
+                numbers, WORK_ITEM_FIELDS + [field_name, "System.Rev"])
+        else:
+            # we don't know the name of the column field, so get all of them
+            work_items = self._read_work_items(numbers)
+
+        changes = []
+        for number in numbers:
+            work_item = work_items.get(number)
+            if work_item is None:
+                logging.error(f"Work item #{number} could not be found")
+                continue
+            name = field_name or self._find_column_field_name(work_item)
+            if name is None:
+                logging.error(f"Work item #{number} is not on a board")
+                continue
+            changes.append(
+                self._change(work_item, name, state, keep_work_items))
+        return changes
+
+    def plan_assign(self,
+                    numbers: Iterable[int],
+                    email: str,
+                    keep_work_items: bool = False) -> List[Change]:
+        """Work out how assigning work items to a user would change them, from
+        their current state. Nothing is updated.
+
+        Args:
+            numbers (Iterable[int]): The work item IDs.
+            email (str): The email of the user to assign the items to.
+            keep_work_items (bool): Whether the work items in the changes
+                should keep the Azure DevOps work items they were created from.
+
+        Returns:
+            List[Change]: The change to each work item, in the order they were
+                given. Work items that could not be found are logged and left
+                out.
+
+        Raises:
+            AzureDevOpsServiceError: If there was some error getting the work
+                items.
+        """
+        numbers = list(dict.fromkeys(numbers))
+        work_items = self._read_work_items(numbers,
+                                           WORK_ITEM_FIELDS + ["System.Rev"])
+        changes = []
+        for number in numbers:
+            if number not in work_items:
+                logging.error(f"Work item #{number} could not be found")
+                continue
+            changes.append(
+                self._change(work_items[number], "System.AssignedTo", email,
+                             keep_work_items))
+        return changes
+
+    def _change(self, work_item: WorkItem, field_name: str, value: str,
+                keep_work_item: bool) -> Change:
+        """Create the change setting a field of a work item.
+
+        Args:
+            work_item (WorkItem): The work item, as it currently is.
+            field_name (str): The reference name of the field to set.
+            value (str): What to set it to.
+            keep_work_item (bool): Whether the work item in the change should
+                keep the Azure DevOps work item.
+
+        Returns:
+            Change: The change.
+        """
+        old = work_item.fields.get(field_name)
+        if isinstance(old, dict):
+            # people are returned as identities
+            old = old.get("uniqueName")
+        return Change(work_item.id, field_name, old, value,
+                      work_item.fields.get("System.Rev"),
+                      WorkItemContainer(work_item, keep_work_item))
+
+    def apply_changes(self,
+                      changes: Iterable[Change],
+                      keep_work_items: bool = False
+                      ) -> Generator[UpdateResult, None, None]:
+        """Make changes worked out by plan_move() or plan_assign().
+
+        Work items the change wouldn't change aren't updated, so they don't
+        get a new revision. The rest are only updated if they are still at the
+        revision they were read at, so edits made since then aren't
+        overwritten. The update fails instead, and can be planned again.
+
+        Args:
+            changes (Iterable[Change]): The changes to make.
+            keep_work_items (bool): Whether the updated work items should keep
+                the Azure DevOps work items they were created from.
+
+        Yields:
+            UpdateResult: The result of each change. The work items that were
+                left as they were come first, with their changed attribute
+                False.
+        """
+        documents = {}
+        for change in changes:
+            if not change.changed:
+                yield UpdateResult(change.id_number,
+                                   change.work_item,
+                                   changed=False)
+                continue
+            document = [
+                JsonPatchOperation(op="add",
+                                   path=f"/fields/{change.field}",
+                                   value=change.new)
+            ]
+            if change.rev is not None:
+                document.insert(
+                    0, JsonPatchOperation(op="test",
+                                          path="/rev",
+                                          value=change.rev))
+            documents[change.id_number] = document
+        if documents:
+            yield from self.update_work_items(documents, keep_work_items)
+
+    def update_work_items(self,
+                          documents: Dict[int, List[JsonPatchOperation]],
+                          keep_work_items: bool = False
+                          ) -> Generator[UpdateResult, None, None]:
+        """Update multiple work items.
+
+        The updates are packed into as few batch requests as possible, which
+        are sent concurrently. If the service rejects a batch request, the
+        work items in it are updated individually instead.
+
+        Args:
+            documents (Dict[int, List[JsonPatchOperation]]): The JSON patch
+                document for each work item, keyed by work item ID.
+            keep_work_items (bool): Whether the updated work items should keep
+                the Azure DevOps work items they were created from.
+
+        Yields:
+            UpdateResult: The result of each update, in the same order as the
+                documents.
+        """
+        update_work_item = partial(self._update_work_item,
+                                   keep_work_item=keep_work_items)
+        if len(documents) == 1:
+            # a batch request would be pointless for a single update
+            yield update_work_item(next(iter(documents.items())))
+            return
+
+        batches = [
+            dict(batch)
+            for batch in chunks(documents.items(), WORK_ITEM_BATCH_SIZE)
+        ]
+        for batch, results in zip(
+                batches,
+                bounded_map(
+                    partial(self._update_work_items_batch,
+                            keep_work_items=keep_work_items), batches,
+                    self.max_workers)):
+            if results is None:
+                results = bounded_map(update_work_item, batch.items(),
+                                      self.max_workers)
+            yield from results
+
+    def _update_work_item(self,
+                          document,
+                          keep_work_item: bool = False) -> UpdateResult:
+        """Update a single work item.
+
+        Args:
+            document (Tuple[int, List[JsonPatchOperation]]): The ID of the work
+                item and the JSON patch document to update it with.
+            keep_work_item (bool): Whether the updated work item should keep
+                the Azure DevOps work item it was created from.
+
+        Returns:
+            UpdateResult: The result of the update.
+        """
+        number, ops = document
+        try:
+            result = self.work_item_client.update_work_item(ops, number)
+        except AzureDevOpsClientRequestError as err:
+            return UpdateResult(number, error=str(err))
+        return UpdateResult(number,
+                            WorkItemContainer(result, keep_work_item))
+
+    def _update_work_items_batch(
+            self,
+            documents: Dict[int, List[JsonPatchOperation]],
+            keep_work_items: bool = False) -> Optional[List[UpdateResult]]:
+        """Update a batch of work items in a single request.
+
+        Args:
+            documents (Dict[int, List[JsonPatchOperation]]): The JSON patch
+                document for each work item, keyed by work item ID.
+            keep_work_items (bool): Whether the updated work items should keep
+                the Azure DevOps work items they were created from.
+
+        Returns:
+            List[UpdateResult]: The result of each update, or None if the
+                service rejected the batch request.
+        """
+        try:
+            responses = self.batch_client.update_work_items_batch(documents)
+        except AzureDevOpsClientRequestError as err:
+            logging.info(
+                f"Batch update was rejected, updating individually: {err}")
+            return None
+
+        results = []
+        for number, response in zip(documents, responses):
+            body = response.get("body")
+            if isinstance(body, str):
+                body = json.loads(body) if body else None
+
+            if 200 <= response["code"] < 300:
+                work_item = WorkItemContainer(WorkItem.deserialize(body),
+                                              keep_work_items)
+                results.append(UpdateResult(number, work_item))
+            elif isinstance(body, dict) and body.get("message"):
+                results.append(UpdateResult(number, error=body["message"]))
+            else:
+                results.append(
+                    UpdateResult(number,
+                                 error=f"Operation returned a "
+                                 f"{response['code']} status code."))
+        return results
+
+    def move_work_item(self, number: int,
+                       state: str) -> Optional[WorkItemContainer]:
         """Move a work item to a given board column.
 
         Args:
@@ -249,18 +1677,47 @@ class AzureDevOpsAPI:
             state (str): The board column to move it to.
 
         Returns:
-            WorkItemContainer: The moved work item.
+            WorkItemContainer: The moved work item, which keeps the Azure
+                DevOps work item, or None if it could not be moved.
         """
-        field_name = self._find_column_field_name(
-            self.get_work_item(number).work_item)
+        for result in self.move_work_items([number],
+                                           state,
+                                           keep_work_items=True):
+            if not result.succeeded:
+                logging.error(result.error)
+            return result.work_item
+        return None
 
-        op = JsonPatchOperation(op="add",
-                                path=f"/fields/{field_name}",
-                                value=state)
-        result = self.work_item_client.update_work_item([op], number)
-        return WorkItemContainer(result)
+    def move_work_items(self,
+                        numbers: Iterable[int],
+                        state: str,
+                        board: str = None,
+                        keep_work_items: bool = False
+                        ) -> Generator[UpdateResult, None, None]:
+        """Move multiple work items to a given board column.
 
-    def assign_work_item(self, number: int, email: str):
+        Args:
+            numbers (Iterable[int]): The IDs of the work items.
+            state (str): The board column to move them to.
+            board (str): The board the work items are on. If given, the column
+                field is looked up from the board instead of from the work
+                items themselves.
+            keep_work_items (bool): Whether the moved work items should keep
+                the Azure DevOps work items they were created from.
+
+        Yields:
+            UpdateResult: The result of moving each work item. Work items
+                already in the column aren't updated.
+
+        Raises:
+            AzureDevOpsServiceError: If there was some error getting the board.
+        """
+        yield from self.apply_changes(
+            self.plan_move(numbers, state, board, keep_work_items),
+            keep_work_items)
+
+    def assign_work_item(self, number: int,
+                         email: str) -> Optional[WorkItemContainer]:
         """Assign a work item to a user by email.
 
         Args:
@@ -268,14 +1725,34 @@ class AzureDevOpsAPI:
             email (str): The email of the user to assign the item to.
 
         Returns:
-            WorkItemContainer: The assigned work item.
+            WorkItemContainer: The assigned work item, which keeps the Azure
+                DevOps work item, or None if it could not be assigned.
         """
-        op = JsonPatchOperation(op="add",
-                                path="/fields/System.AssignedTo",
-                                value=email)
-        try:
-            result = self.work_item_client.update_work_item([op], number)
-        except AzureDevOpsServiceError as err:
-            logging.error(err)
-            return None
-        return WorkItemContainer(result)
\ No newline at end of file
+        for result in self.assign_work_items([number],
+                                             email,
+                                             keep_work_items=True):
+            if not result.succeeded:
+                logging.error(result.error)
+            return result.work_item
+        return None
+
+    def assign_work_items(self,
+                          numbers: Iterable[int],
+                          email: str,
+                          keep_work_items: bool = False
+                          ) -> Generator[UpdateResult, None, None]:
+        """Assign multiple work items to a user by email.
+
+        Args:
+            numbers (Iterable[int]): The work item IDs.
+            email (str): The email of the user to assign the items to.
+            keep_work_items (bool): Whether the assigned work items should keep
+                the Azure DevOps work items they were created from.
+
+        Yields:
+            UpdateResult: The result of assigning each work item. Work items
+                already assigned to the user aren't updated.
+        """
+        yield from self.apply_changes(
+            self.plan_assign(numbers, email, keep_work_items),
+            keep_work_items)
@@ -0,0 +1,444 @@
+"""replica.py
+
+This module contains a local copy of the PBIs and Bugs in a project, stored in
+SQLite, so commands can answer from it without going to Azure DevOps. After the
+first sync only the work items that changed since the last one are fetched.
+
+It doesn't import the Azure DevOps SDK, so reading from the replica stays fast.
+
+Author:
+    Sam Gibson <sgibson@glasswallsolutions.com>
+"""
+
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+import logging
+import os
+import sqlite3
+import time
+from typing import Any, Dict, Generator, Iterable, List, Optional, \
+    Sequence, TYPE_CHECKING, Union
+from urllib.parse import quote
+
+from .cache import default_cache_dir
+from .workitem import WorkItemContainer
+
+if TYPE_CHECKING:
+    from .pbi import AzureDevOpsAPI
+
+SCHEMA_VERSION = 2
+"""The version of the replica's tables. Replicas with any other version are
+rebuilt by the next sync."""
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS work_items (
+    id INTEGER PRIMARY KEY,
+    title TEXT NOT NULL,
+    work_type TEXT NOT NULL,
+    assigned_to TEXT NOT NULL COLLATE NOCASE,
+    state TEXT NOT NULL,
+    board_column TEXT NOT NULL,
+    changed_date TEXT NOT NULL,
+    rev INTEGER NOT NULL,
+    area_path TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS work_items_assigned_to
+    ON work_items (assigned_to, state, id);
+CREATE TABLE IF NOT EXISTS sync_state (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+"""The tables the replica is stored in."""
+
+CLOSED_STATES = ("Done", "Removed")
+"""The states of work items that are no longer listed."""
+
+SYNC_OVERLAP = 5 * 60
+"""How many seconds before the newest change seen by the last sync to look for
+changes from. Changes are stamped when they are saved, so one saved while we
+were syncing can have an earlier time than the newest one we saw."""
+
+STORE_BATCH_SIZE = 1000
+"""How many work items to store in each transaction during a sync, so an
+interrupted sync keeps what it had already fetched."""
+
+DATE_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ"
+"""The format dates are stored in. Every date has the same number of digits, so
+they sort as strings."""
+
+
+def parse_date(value: str) -> datetime:
+    """Parse a date as Azure DevOps returns it, i.e. '2020-01-02T03:04:05.67Z'.
+    The number of digits after the second varies.
+
+    Args:
+        value (str): The date.
+
+    Returns:
+        datetime: The date, in UTC.
+
+    Raises:
+        ValueError: If it wasn't a date.
+    """
+    value, _, fraction = value.rstrip("Z").partition(".")
+    date = datetime.strptime(value, "%Y-%m-%dT%H:%M:%S")
+    if fraction:
+        date = date.replace(microsecond=int(fraction[:6].ljust(6, "0")))
+    return date.replace(tzinfo=timezone.utc)
+
+
+def format_date(date: datetime) -> str:
+    """Format a date the way the replica stores it.
+
+    Args:
+        date (datetime): The date, in UTC.
+
+    Returns:
+        str: The formatted date.
+    """
+    return date.strftime(DATE_FORMAT)
+
+
+def placeholders(values: Sequence[Any]) -> str:
+    """Create the placeholders for a list of values in an SQL query.
+
+    Args:
+        values (Sequence[Any]): The values.
+
+    Returns:
+        str: The placeholders, i.e. '?, ?, ?'.
+    """
+    return ", ".join("?" * len(values))
+
+
+def describe_age(seconds: float) -> str:
+    """Describe how long ago something happened.
+
+    Args:
+        seconds (float): How many seconds ago it happened.
+
+    Returns:
+        str: The description, i.e. '5 minutes ago'.
+    """
+    for unit, size in [("day", 86400), ("hour", 3600), ("minute", 60)]:
+        if seconds >= size:
+            count = int(seconds // size)
+            return f"{count} {unit}{'s' if count != 1 else ''} ago"
+    return "just now"
+
+
+class Replica:
+    """Replica is a local copy of the PBIs and Bugs in a project.
+
+    Work items that are deleted, or whose type changes to one we don't allow,
+    stay in the replica until a full sync.
+
+    Attributes:
+        path (str): The path of the SQLite database the replica is stored in.
+    """
+    def __init__(self,
+                 organisation: str,
+                 project: str,
+                 directory: str = None) -> None:
+        """Open the replica of a project.
+
+        Args:
+            organisation (str): The organisation the project is in.
+            project (str): The project.
+            directory (str): The directory to store the replica in. Defaults
+                to default_cache_dir().
+        """
+        directory = directory or default_cache_dir()
+        name = quote(f"{organisation}_{project}".lower(), safe="")
+        self.path = os.path.join(directory, f"replica_{name}.sqlite3")
+        self._db = None
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open the database, creating it if it doesn't exist.
+
+        Returns:
+            sqlite3.Connection: The database.
+        """
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._db = sqlite3.connect(self.path)
+            version = self._db.execute("PRAGMA user_version").fetchone()[0]
+            with self._db:
+                if version != SCHEMA_VERSION:
+                    self._db.execute("DROP TABLE IF EXISTS work_items")
+                    self._db.execute("DROP TABLE IF EXISTS sync_state")
+                    self._db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+                self._db.executescript(SCHEMA)
+        return self._db
+
+    def close(self) -> None:
+        """Close the database."""
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def _state(self, key: str) -> Optional[str]:
+        """Get a value recorded by the last sync.
+
+        Args:
+            key (str): The name of the value.
+
+        Returns:
+            str: The value, or None if there has never been a sync.
+        """
+        if self._db is None and not os.path.exists(self.path):
+            return None
+        row = self._connect().execute(
+            "SELECT value FROM sync_state WHERE key = ?", (key, )).fetchone()
+        return row[0] if row is not None else None
+
+    @property
+    def synced_at(self) -> Optional[float]:
+        """float: When the replica was last synced, as a Unix timestamp, or
+        None if it never has been."""
+        value = self._state("synced_at")
+        return float(value) if value is not None else None
+
+    def age(self) -> Optional[float]:
+        """Get how out of date the replica could be.
+
+        Returns:
+            float: How many seconds ago the last sync started, or None if the
+                replica has never been synced.
+        """
+        synced_at = self.synced_at
+        return time.time() - synced_at if synced_at is not None else None
+
+    def count(self) -> int:
+        """Count the work items in the replica.
+
+        Returns:
+            int: The number of work items.
+        """
+        return self._connect().execute(
+            "SELECT COUNT(*) FROM work_items").fetchone()[0]
+
+    @staticmethod
+    def _row(work_item: Any) -> tuple:
+        """Get the row a work item is stored as.
+
+        Args:
+            work_item (WorkItem): The work item, with the SYNC_FIELDS.
+
+        Returns:
+            tuple: The row.
+        """
+        container = WorkItemContainer(work_item)
+        fields = work_item.fields
+        return (container.id_number, container.title, container.work_type,
+                container.assigned_to, container.state,
+                container.board_column,
+                format_date(parse_date(fields["System.ChangedDate"])),
+                fields["System.Rev"], fields.get("System.AreaPath", ""))
+
+    def sync(self, api: "AzureDevOpsAPI", full: bool = False) -> int:
+        """Bring the replica up to date with Azure DevOps.
+
+        Args:
+            api (AzureDevOpsAPI): The connection to fetch work items with.
+            full (bool): Whether to fetch every work item, rather than only the
+                ones changed since the last sync. Work items that are no longer
+                in the project are removed.
+
+        Returns:
+            int: How many work items were fetched.
+
+        Raises:
+            AzureDevOpsServiceError: If there was some error fetching work
+                items. Whatever was already fetched is kept, and the next sync
+                starts from the same place.
+        """
+        started = time.time()
+        watermark = self._state("watermark")
+        db = self._connect()
+
+        since = None
+        if not full and watermark is not None:
+            since = format_date(
+                parse_date(watermark) - timedelta(seconds=SYNC_OVERLAP))
+        if full:
+            db.execute("CREATE TEMP TABLE IF NOT EXISTS seen "
+                       "(id INTEGER PRIMARY KEY)")
+            db.execute("DELETE FROM seen")
+
+        count = 0
+        work_items = api.get_changed_work_items(since)
+        while True:
+            rows = [
+                self._row(work_item)
+                for work_item in islice(work_items, STORE_BATCH_SIZE)
+            ]
+            if not rows:
+                break
+            with db:
+                db.executemany(
+                    "INSERT OR REPLACE INTO work_items VALUES "
+                    "(?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                if full:
+                    db.executemany("INSERT OR IGNORE INTO seen VALUES (?)",
+                                   ((row[0], ) for row in rows))
+            newest = max(row[6] for row in rows)
+            watermark = max(watermark or newest, newest)
+            count += len(rows)
+
+        with db:
+            if full:
+                db.execute("DELETE FROM work_items "
+                           "WHERE id NOT IN (SELECT id FROM seen)")
+            if watermark is not None:
+                db.execute(
+                    "INSERT OR REPLACE INTO sync_state VALUES "
+                    "('watermark', ?)", (watermark, ))
+            db.execute(
+                "INSERT OR REPLACE INTO sync_state VALUES ('synced_at', ?)",
+                (str(started), ))
+        return count
+
+    @staticmethod
+    def _container(row: tuple) -> WorkItemContainer:
+        """Create a WorkItemContainer from a row of the replica."""
+        return WorkItemContainer.from_values(*row)
+
+    def get_work_items(self, numbers: Iterable[int]
+                       ) -> Generator[WorkItemContainer, None, None]:
+        """Get multiple work items by ID.
+
+        Args:
+            numbers (Iterable[int]): The IDs to get.
+
+        Yields:
+            WorkItemContainer: Work items, in the order their IDs were given.
+                Work items that aren't in the replica are left out.
+        """
+        db = self._connect()
+        for number in dict.fromkeys(numbers):
+            row = db.execute(
+                "SELECT id, title, work_type, assigned_to, state, "
+                "board_column FROM work_items WHERE id = ?",
+                (number, )).fetchone()
+            if row is None:
+                logging.error(f"Work item #{number} was not in the replica")
+                continue
+            yield self._container(row)
+
+    def get_user_pbis(self,
+                      email: Union[str, List[str]],
+                      top: int = None
+                      ) -> Generator[WorkItemContainer, None, None]:
+        """Get the open PBIs and Bugs assigned to a user, or to any of a list
+        of users.
+
+        Args:
+            email (Union[str, List[str]]): The email of the user whose PBIs to
+                get, or of each user.
+            top (int): The maximum number of work items to get, or None for
+                all of them.
+
+        Yields:
+            WorkItemContainer: Work items assigned to the users, in ID order.
+        """
+        emails = [email] if isinstance(email, str) else list(email)
+        cursor = self._connect().execute(
+            "SELECT id, title, work_type, assigned_to, state, board_column "
+            f"FROM work_items WHERE assigned_to IN ({placeholders(emails)}) "
+            f"AND state NOT IN ({placeholders(CLOSED_STATES)}) "
+            "ORDER BY id LIMIT ?",
+            tuple(emails) + CLOSED_STATES +
+            (top if top is not None else -1, ))
+        found = False
+        for row in cursor:
+            found = True
+            yield self._container(row)
+        if not found:
+            users = ", ".join(repr(user) for user in emails)
+            logging.warning(f"Could not find any work items for {users} in "
+                            "the replica. Did the user exist?")
+
+    def get_board_stats(self, areas: Dict[str, Any], columns: List[str],
+                        states: List[str],
+                        members: List[str]) -> Dict[str, Dict[str, int]]:
+        """Count the PBIs and Bugs on a board by column, by state and by who
+        they are assigned to, the same as AzureDevOpsAPI.get_board_stats().
+        Removed work items aren't counted.
+
+        Args:
+            areas (Dict[str, Any]): Which work items are on the board, from
+                AzureDevOpsAPI.get_board_areas().
+            columns (List[str]): The columns of the board.
+            states (List[str]): The states work items can be in, from
+                AzureDevOpsAPI.get_states().
+            members (List[str]): The members of the board's team, from
+                AzureDevOpsAPI.get_board_members().
+
+        Returns:
+            Dict[str, Dict[str, int]]: The number of work items in each
+                'column' of the board, in order, and each 'state'. The open
+                work items assigned to each 'assignee' of the team, to no-one
+                ('Unassigned') and to anyone else ('Others'). Assignees with no
+                work items are left out.
+
+        Raises:
+            ValueError: If the board's work items aren't chosen by their area
+                path, which is the only field the replica stores.
+        """
+        if areas["field"] != "System.AreaPath":
+            raise ValueError(f"The replica doesn't store {areas['field']}, "
+                             "which the board's work items are chosen by")
+
+        # area paths are compared ignoring case, like Azure DevOps does
+        conditions = []
+        parameters = []
+        for path, include_children in areas["values"]:
+            conditions.append("lower(area_path) = lower(?)")
+            parameters.append(path)
+            if include_children:
+                conditions.append(
+                    "lower(substr(area_path, 1, ?)) = lower(?)")
+                parameters += [len(path) + 1, path + "\\"]
+        board = f"({' OR '.join(conditions) or '0'}) AND state <> 'Removed'"
+
+        db = self._connect()
+
+        def count(group: str, condition: str = "1",
+                  values: tuple = ()) -> Dict[str, int]:
+            return dict(
+                db.execute(
+                    f"SELECT {group}, COUNT(*) FROM work_items "
+                    f"WHERE {board} AND {condition} GROUP BY {group}",
+                    tuple(parameters) + values))
+
+        by_column = count("board_column")
+        by_state = count("state")
+        # assignees are compared ignoring case, like Azure DevOps does
+        open_work = {}
+        for assignee, number in count(
+                "assigned_to",
+                f"state NOT IN ({placeholders(CLOSED_STATES)})",
+                CLOSED_STATES).items():
+            key = assignee.casefold()
+            open_work[key] = open_work.get(key, 0) + number
+        assignees = {}
+        for member in members + ["Unassigned"]:
+            number = open_work.pop(member.casefold(), 0)
+            if number:
+                assignees[member] = number
+        others = sum(open_work.values())
+        if others:
+            assignees["Others"] = others
+        return {
+            "column": {
+                column: by_column.get(column, 0)
+                for column in columns
+            },
+            "state": {
+                state: by_state.get(state, 0)
+                for state in states if state != "Removed"
+            },
+            "assignee": assignees
+        }
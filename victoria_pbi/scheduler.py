@@ -0,0 +1,182 @@
+"""scheduler.py
+
+This module contains the scheduler every request to Azure DevOps goes through.
+It keeps requests under the rate the service allows, using the throttling
+headers Azure DevOps sends, and decides when a failed request should be
+retried and how long to wait first.
+
+Author:
+    Sam Gibson <sgibson@glasswallsolutions.com>
+"""
+
+from email.utils import parsedate_to_datetime
+import random
+import threading
+import time
+from typing import Mapping, Optional
+
+from .config import DEFAULT_RETRIES
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+"""Status codes for requests that may succeed if sent again."""
+
+THROTTLED_STATUSES = {429}
+"""Status codes that mean the request was rejected without being processed,
+so any request can be safely sent again."""
+
+LOW_REMAINING = 0.1
+"""The share of the rate limit left below which we start slowing down, before
+the service starts rejecting requests."""
+
+
+def retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    """Get how long the service asked us to wait before sending more requests.
+
+    Args:
+        headers (Mapping[str, str]): The headers of the response.
+
+    Returns:
+        float: The number of seconds to wait, or None if it didn't say.
+    """
+    value = headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def near_limit(headers: Mapping[str, str]) -> bool:
+    """Check whether the service is telling us we're close to being throttled.
+
+    Azure DevOps delays requests that are over the limit, and says so with
+    X-RateLimit-Delay, and says how much of the limit is left with
+    X-RateLimit-Remaining and X-RateLimit-Limit.
+
+    Args:
+        headers (Mapping[str, str]): The headers of the response.
+
+    Returns:
+        bool: Whether we should slow down.
+    """
+    try:
+        if float(headers.get("X-RateLimit-Delay", 0)) > 0:
+            return True
+        remaining = headers.get("X-RateLimit-Remaining")
+        limit = headers.get("X-RateLimit-Limit")
+        if remaining is not None and limit is not None and float(limit) > 0:
+            return float(remaining) / float(limit) < LOW_REMAINING
+    except ValueError:
+        pass
+    return False
+
+
+class RequestScheduler:
+    """RequestScheduler limits how many requests are in flight at once, and
+    adapts the limit to what the service allows.
+
+    The limit grows by one for every limit's worth of requests that go
+    through without a sign of throttling (additive increase), and halves when
+    the service throttles a request or says we're close to the limit
+    (multiplicative decrease). When the service asks us to wait, no requests
+    are sent until the wait is over.
+
+    Attributes:
+        max_concurrency (int): The most requests to ever have in flight.
+        min_concurrency (int): The fewest requests to allow in flight.
+        retries (int): How many times to retry a request.
+        backoff (float): The base number of seconds to back off by when the
+            service doesn't say how long to wait. It doubles on each retry.
+        max_backoff (float): The most seconds to back off by.
+        limit (float): How many requests are currently allowed in flight.
+    """
+    def __init__(self,
+                 max_concurrency: int,
+                 min_concurrency: int = 1,
+                 retries: int = DEFAULT_RETRIES,
+                 backoff: float = 0.5,
+                 max_backoff: float = 60.0) -> None:
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min(min_concurrency, max_concurrency)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.limit = float(max_concurrency)
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._last_decrease = float("-inf")
+        self._condition = threading.Condition()
+
+    def acquire(self) -> None:
+        """Wait until another request can be sent."""
+        with self._condition:
+            while True:
+                wait = self._paused_until - time.monotonic()
+                if wait > 0:
+                    self._condition.wait(wait)
+                elif self._in_flight < int(self.limit):
+                    self._in_flight += 1
+                    return
+                else:
+                    self._condition.wait()
+
+    def release(self) -> None:
+        """Mark a request as no longer in flight."""
+        with self._condition:
+            self._in_flight -= 1
+            self._condition.notify_all()
+
+    def _decrease(self) -> None:
+        """Halve the limit. It is only halved once per backoff period, as the
+        requests already in flight will tell us about the same congestion."""
+        now = time.monotonic()
+        if now - self._last_decrease >= self.backoff:
+            self.limit = max(float(self.min_concurrency), self.limit / 2)
+            self._last_decrease = now
+
+    def observe(self, status: int, headers: Mapping[str, str],
+                attempt: int) -> Optional[float]:
+        """Update the limit from the response to a request, and work out
+        whether it should be retried.
+
+        Args:
+            status (int): The status code of the response.
+            headers (Mapping[str, str]): The headers of the response.
+            attempt (int): How many times the request has already been
+                retried.
+
+        Returns:
+            float: How many seconds to wait before retrying the request, or
+                None if it shouldn't be retried.
+        """
+        wait = retry_after(headers)
+        with self._condition:
+            if status in RETRYABLE_STATUSES or wait is not None:
+                self._decrease()
+            elif near_limit(headers):
+                self._decrease()
+                return None
+            else:
+                self.limit = min(float(self.max_concurrency),
+                                 self.limit + 1 / self.limit)
+                self._condition.notify_all()
+                return None
+
+            if status not in RETRYABLE_STATUSES or attempt >= self.retries:
+                return None
+            if wait is None:
+                # exponential backoff with full jitter, so the requests that
+                # failed together don't all retry together
+                wait = random.uniform(
+                    0, min(self.max_backoff, self.backoff * 2**attempt))
+            else:
+                # the service asked every request to wait, so hold them all
+                self._paused_until = max(self._paused_until,
+                                         time.monotonic() + wait)
+                wait += random.uniform(0, self.backoff)
+            return wait
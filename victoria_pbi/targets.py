@@ -0,0 +1,304 @@
+"""targets.py
+
+This module contains the API used to get work items and boards from several
+Azure DevOps projects at once, possibly in different organisations. Every
+target is asked at the same time and what they send back is merged as it
+arrives, so it takes as long as the slowest target rather than all of them
+added together.
+
+Author:
+    Sam Gibson <sgibson@glasswallsolutions.com>
+"""
+
+import logging
+import queue
+import threading
+from typing import Callable, Dict, Generator, Iterable, List, Tuple, Type, \
+    TypeVar, Union, TYPE_CHECKING
+
+from .config import PBIConfig
+
+if TYPE_CHECKING:
+    from .pbi import AzureDevOpsAPI
+    from .workitem import FieldInfo, WorkItemContainer
+
+T = TypeVar("T")
+
+TEAM_PROJECT_FIELD = "System.TeamProject"
+"""The reference name of the field saying which project a work item is in."""
+
+
+def merge_streams(streams: Dict[str, Callable[[], Iterable[T]]],
+                  errors: Tuple[Type[Exception], ...] = ()
+                  ) -> Generator[Tuple[str, T], None, None]:
+    """Take the items from several iterables at once, each in its own thread,
+    in the order they arrive.
+
+    Args:
+        streams (Dict[str, Callable[[], Iterable[T]]]): Creates each iterable,
+            keyed by a name for it. They are created in their threads, so
+            any requests they send when created are sent at the same time.
+        errors (Tuple[Type[Exception], ...]): The errors to log with the name
+            of the iterable they came from, rather than raise, so the other
+            iterables carry on.
+
+    Yields:
+        Tuple[str, T]: The name of the iterable each item came from, and the
+            item. Items from the same iterable stay in order.
+
+    Raises:
+        Exception: Any error from an iterable that isn't one of the errors to
+            log.
+    """
+    results = queue.Queue()
+    stopped = threading.Event()
+    finished = object()
+
+    def run(name: str, stream: Callable[[], Iterable[T]]):
+        try:
+            for item in stream():
+                if stopped.is_set():
+                    return
+                results.put((name, item))
+        except Exception as err:
+            results.put((name, err))
+        results.put((name, finished))
+
+    # the threads are daemons so one stuck on a slow target doesn't keep the
+    # process alive after whatever we were yielding to has stopped
+    for name, stream in streams.items():
+        threading.Thread(target=run, args=(name, stream), daemon=True).start()
+
+    remaining = len(streams)
+    try:
+        while remaining:
+            name, item = results.get()
+            if item is finished:
+                remaining -= 1
+            elif isinstance(item, errors):
+                logging.error(f"{name}: {item}")
+            elif isinstance(item, Exception):
+                raise item
+            else:
+                yield name, item
+    finally:
+        stopped.set()
+
+
+def organisation_key(cfg: PBIConfig) -> str:
+    """Get what identifies the organisation a config connects to, since work
+    item IDs are only unique within an organisation.
+
+    Args:
+        cfg (PBIConfig): The config.
+
+    Returns:
+        str: The key.
+    """
+    return (cfg.url or cfg.organisation).rstrip("/").lower()
+
+
+class MultiTargetAPI:
+    """MultiTargetAPI gets work items and boards from several targets, tagging
+    each with the name of the one it came from.
+
+    It has the same methods as AzureDevOpsAPI that read from more than one
+    project, so commands can use either.
+
+    Attributes:
+        configs (Dict[str, PBIConfig]): The config of each target, keyed by
+            its name.
+        connections (Dict[str, AzureDevOpsAPI]): The connection to each
+            target, keyed by its name.
+        errors (Tuple[Type[Exception], ...]): The errors from a target that
+            are logged rather than raised, so the other targets carry on.
+    """
+    def __init__(self,
+                 configs: Dict[str, PBIConfig],
+                 connect: Callable[[PBIConfig], "AzureDevOpsAPI"],
+                 errors: Tuple[Type[Exception], ...] = ()) -> None:
+        """Connect to each target.
+
+        Args:
+            configs (Dict[str, PBIConfig]): The config of each target, keyed
+                by its name, such as from PBIConfig.target_configs(). The
+                first is used for anything that only needs one, like looking
+                up fields.
+            connect (Callable[[PBIConfig], AzureDevOpsAPI]): Connects to a
+                target.
+            errors (Tuple[Type[Exception], ...]): The errors from a target to
+                log rather than raise.
+        """
+        self.configs = configs
+        self.connections = {
+            name: connect(cfg)
+            for name, cfg in configs.items()
+        }
+        self.errors = errors
+
+    def resolve_fields(self, names: Iterable[str]) -> List["FieldInfo"]:
+        """Find fields by name or reference name, in the first target.
+
+        Args:
+            names (Iterable[str]): The names of the fields.
+
+        Returns:
+            List[FieldInfo]: The fields, in the order they were given.
+        """
+        return next(iter(self.connections.values())).resolve_fields(names)
+
+    def get_work_items(self,
+                       numbers: Iterable[int],
+                       fields: List[str] = None
+                       ) -> Generator["WorkItemContainer", None, None]:
+        """Get multiple work items by ID from every organisation at once.
+
+        IDs are unique within an organisation, so each organisation is only
+        asked once, however many of its projects are targets. When there are
+        several, which one a work item is in is got along with it.
+
+        Args:
+            numbers (Iterable[int]): The IDs to get.
+            fields (List[str]): The reference names of fields to get as well as
+                WORK_ITEM_FIELDS.
+
+        Yields:
+            WorkItemContainer: Work items as they arrive, with their source
+                set. Work items from the same organisation are in the order
+                their IDs were given.
+        """
+        numbers = list(dict.fromkeys(numbers))
+        organisations = {}
+        for name, cfg in self.configs.items():
+            organisations.setdefault(organisation_key(cfg), []).append(name)
+        # an ID is expected to be missing from all but one organisation, so
+        # only the ones missing from all of them are reported
+        missing_ok = len(organisations) > 1
+
+        def stream(names: List[str]
+                   ) -> Callable[[], Iterable["WorkItemContainer"]]:
+            conn = self.connections[names[0]]
+            if len(names) == 1:
+                return lambda: conn.get_work_items(
+                    numbers, fields, missing_ok=missing_ok)
+            return lambda: self._tag_projects(
+                names,
+                conn.get_work_items(numbers, (fields or []) +
+                                    [TEAM_PROJECT_FIELD],
+                                    missing_ok=missing_ok), fields)
+
+        found = set()
+        for name, work_item in merge_streams(
+            {
+                names[0]: stream(names)
+                for names in organisations.values()
+            }, self.errors):
+            if work_item.source is None:
+                work_item.source = name
+            found.add(work_item.id_number)
+            yield work_item
+
+        if missing_ok:
+            for number in numbers:
+                if number not in found:
+                    logging.error(f"Work item #{number} could not be found")
+
+    def _tag_projects(self, names: List[str],
+                      work_items: Iterable["WorkItemContainer"],
+                      fields: List[str] = None
+                      ) -> Generator["WorkItemContainer", None, None]:
+        """Set the source of work items from an organisation with several
+        targets to the target for the project each one is in.
+
+        Args:
+            names (List[str]): The names of the targets in the organisation.
+            work_items (Iterable[WorkItemContainer]): The work items, with
+                TEAM_PROJECT_FIELD.
+            fields (List[str]): The fields that were asked for, so
+                TEAM_PROJECT_FIELD is only kept if it was one of them.
+
+        Yields:
+            WorkItemContainer: The work items, with their source set.
+        """
+        projects = {
+            self.configs[name].project.casefold(): name
+            for name in reversed(names)
+        }
+        organisation = self.configs[names[0]].organisation
+        for work_item in work_items:
+            project = work_item.fields.get(TEAM_PROJECT_FIELD) or ""
+            work_item.source = projects.get(project.casefold(),
+                                            f"{organisation}/{project}")
+            if TEAM_PROJECT_FIELD not in (fields or []):
+                del work_item.fields[TEAM_PROJECT_FIELD]
+                work_item.fields = work_item.fields or None
+            yield work_item
+
+    def get_user_pbis(self,
+                      email: Union[str, List[str]],
+                      top: int = None,
+                      fields: List[str] = None
+                      ) -> Generator["WorkItemContainer", None, None]:
+        """Get all of the PBIs assigned to a user, or to any of a list of
+        users, from every target at once.
+
+        Args:
+            email (Union[str, List[str]]): The email of the user whose PBIs to
+                get, or of each user.
+            top (int): The maximum number of work items to get, or None for
+                all of them.
+            fields (List[str]): The reference names of fields to get as well as
+                WORK_ITEM_FIELDS.
+
+        Yields:
+            WorkItemContainer: Work items assigned to the users as they
+                arrive, with their source set. Work items from the same target
+                are in ID order.
+        """
+        def stream(name: str
+                   ) -> Callable[[], Iterable["WorkItemContainer"]]:
+            # each target only has the work items in its own project, as
+            # several targets can be in the same organisation. The users'
+            # work items are expected to be missing from some of them, so
+            # it's only reported if they are missing from all of them
+            return lambda: self.connections[name].get_user_pbis(
+                email,
+                top,
+                fields,
+                project=self.configs[name].project,
+                missing_ok=True)
+
+        count = 0
+        for name, work_item in merge_streams(
+            {name: stream(name)
+             for name in self.connections}, self.errors):
+            work_item.source = name
+            yield work_item
+            count += 1
+            if top is not None and count >= top:
+                return
+
+        if not count:
+            users = [email] if isinstance(email, str) else email
+            logging.warning(
+                "Could not find any work items for "
+                f"{', '.join(repr(user) for user in users)} in any target."
+                " Did the user exist?")
+
+    def get_boards(self, refresh: bool = False
+                   ) -> Generator[Tuple[str, str], None, None]:
+        """Get all boards from every target at once.
+
+        Args:
+            refresh (bool): Whether to get them from the service even if they
+                are cached.
+
+        Yields:
+            Tuple[str, str]: The name of the target each board is in, and the
+                name of the board, as they arrive.
+        """
+        yield from merge_streams(
+            {
+                name: lambda conn=conn: conn.get_boards(refresh)
+                for name, conn in self.connections.items()
+            }, self.errors)
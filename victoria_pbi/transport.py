@@ -0,0 +1,150 @@
+"""transport.py
+
+This module contains the HTTP transport shared by all of the Azure DevOps
+clients a connection creates, so they all use the same pool of connections.
+
+Author:
+    Sam Gibson <sgibson@glasswallsolutions.com>
+"""
+
+import time
+from urllib.parse import urlsplit
+
+from azure.devops.client import Client
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .config import TransportConfig
+from .scheduler import RequestScheduler, THROTTLED_STATUSES
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+"""HTTP methods that can be sent more than once with the same effect."""
+
+READ_ONLY_POSTS = ("/_apis/wit/wiql", "/_apis/wit/workitemsbatch")
+"""Endpoints that are sent with POST, but only read, so can be retried."""
+
+
+def is_idempotent(request: requests.PreparedRequest) -> bool:
+    """Check whether a request can be sent again if it fails.
+
+    Args:
+        request (requests.PreparedRequest): The request.
+
+    Returns:
+        bool: Whether it has the same effect however many times it is sent.
+    """
+    if request.method in IDEMPOTENT_METHODS:
+        return True
+    path = urlsplit(request.url).path.rstrip("/").lower()
+    return request.method == "POST" and path.endswith(READ_ONLY_POSTS)
+
+
+class SchedulingAdapter(HTTPAdapter):
+    """SchedulingAdapter sends every request through a scheduler, which holds
+    requests back while the service is throttling us and retries them when it
+    is safe to.
+
+    Throttled requests are retried whatever their method, as the service
+    rejects them without processing them. Other failures are only retried for
+    idempotent requests. Connection errors are left to urllib3, which retries
+    idempotent requests.
+
+    Attributes:
+        scheduler (RequestScheduler): The scheduler requests go through.
+    """
+    def __init__(self, scheduler: RequestScheduler, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.scheduler = scheduler
+
+    def send(self, request: requests.PreparedRequest,
+             **kwargs) -> requests.Response:
+        attempt = 0
+        while True:
+            self.scheduler.acquire()
+            try:
+                response = super().send(request, **kwargs)
+            finally:
+                self.scheduler.release()
+
+            wait = self.scheduler.observe(response.status_code,
+                                          response.headers, attempt)
+            if wait is None or not (response.status_code in THROTTLED_STATUSES
+                                    or is_idempotent(request)):
+                response.retried = attempt
+                return response
+
+            # read the body so the connection goes back in the pool
+            response.content
+            response.close()
+            attempt += 1
+            time.sleep(wait)
+
+
+class Transport:
+    """Transport is a pool of HTTP connections shared between Azure DevOps
+    clients.
+
+    By default each msrest client keeps a separate requests session for each
+    thread, so concurrent requests would open new connections and redo TLS
+    handshakes. Instead every client configured with a transport sends its
+    requests through one session, whose connection pool is sized so that
+    concurrent requests wait for a warm connection rather than opening
+    throwaway ones.
+
+    Attributes:
+        config (TransportConfig): The config of the transport.
+        session (requests.Session): The session requests are sent with.
+        scheduler (RequestScheduler): The scheduler every request goes
+            through, which adapts how many are sent at once to what the
+            service allows.
+    """
+    def __init__(self, config: TransportConfig) -> None:
+        self.config = config
+        self.session = requests.Session()
+        self.scheduler = RequestScheduler(config.pool_size,
+                                          retries=config.retries)
+
+        # urllib3 only retries connection errors, so the scheduler sees every
+        # response and can slow down when the service throttles us
+        adapter = SchedulingAdapter(self.scheduler,
+                                    pool_connections=1,
+                                    pool_maxsize=config.pool_size,
+                                    pool_block=True,
+                                    max_retries=Retry(
+                                        total=config.retries,
+                                        backoff_factor=0.8,
+                                        respect_retry_after_header=False,
+                                        raise_on_status=False))
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self.session.headers["Accept-Encoding"] = "gzip, deflate" \
+            if config.compression else "identity"
+        if not config.keep_alive:
+            self.session.headers["Connection"] = "close"
+
+    def configure(self, client: Client) -> None:
+        """Make a client send its requests through this transport.
+
+        Args:
+            client (Client): The client to configure.
+        """
+        client.config.keep_alive = self.config.keep_alive
+        client.config.connection.timeout = self.config.timeout
+        client.config.session_configuration_callback = self._use_session
+
+    def _use_session(self, session: requests.Session, global_config,
+                     local_config, **kwargs) -> dict:
+        """msrest session configuration callback that swaps the session a
+        request is about to be sent with for this transport's session.
+
+        Returns:
+            dict: The keyword arguments to send the request with.
+        """
+        kwargs["session"] = self.session
+        return kwargs
+
+    def close(self) -> None:
+        """Close all of the connections in the pool."""
+        self.session.close()
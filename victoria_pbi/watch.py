@@ -0,0 +1,108 @@
+"""watch.py
+
+This module contains the watcher used to follow the work items assigned to a
+user as they change. Each poll only fetches the work items that changed since
+the one before, so it costs as much as the churn rather than the backlog.
+
+Author:
+    Sam Gibson <sgibson@glasswallsolutions.com>
+"""
+
+from datetime import timedelta
+from typing import Dict, List, Optional, Set, TYPE_CHECKING, Tuple
+
+from .replica import SYNC_OVERLAP, format_date, parse_date
+from .workitem import WorkItemContainer
+
+if TYPE_CHECKING:
+    from .pbi import AzureDevOpsAPI
+
+
+class Watcher:
+    """Watcher polls for changes to the work items assigned to a user.
+
+    The first poll gets all of the user's open work items. Later polls get the
+    ones changed since the newest change seen, less an overlap for changes
+    saved while we were polling, and leave out the ones whose revision we
+    have already seen. Work items that were assigned to the user and have
+    since been closed or assigned to someone else are included once, so they
+    can be shown leaving.
+
+    Attributes:
+        api (AzureDevOpsAPI): The connection to poll with.
+        email (str): The email of the user whose work items to watch.
+        watermark (str): The time of the newest change seen, or None before
+            the first poll.
+    """
+    def __init__(self, api: "AzureDevOpsAPI", email: str) -> None:
+        self.api = api
+        self.email = email
+        self.watermark = None
+        # the revision and change time of each work item changed within the
+        # overlap, so the ones fetched again aren't reported twice
+        self._revisions: Dict[int, Tuple[int, str]] = {}
+        # the work items that have been assigned to the user while watching
+        self._known: Set[int] = set()
+
+    def _since(self) -> Optional[str]:
+        """Get the time to look for changes from.
+
+        Returns:
+            str: The time, or None to get all of the user's work items.
+        """
+        if self.watermark is None:
+            return None
+        return format_date(
+            parse_date(self.watermark) - timedelta(seconds=SYNC_OVERLAP))
+
+    def poll(self) -> List[WorkItemContainer]:
+        """Get the work items that changed since the last poll.
+
+        Returns:
+            List[WorkItemContainer]: The work items that changed, in ID order.
+
+        Raises:
+            AzureDevOpsServiceError: If there was some error getting them. The
+                next poll looks for the same changes again.
+        """
+        since = self._since()
+        revisions = {}
+        known = set(self._known)
+        changed = []
+        for work_item in self.api.get_changed_user_pbis(self.email, since):
+            fields = work_item.fields
+            revision = (fields["System.Rev"],
+                        format_date(parse_date(fields["System.ChangedDate"])))
+            revisions[work_item.id] = revision
+            if self._revisions.get(work_item.id) == revision:
+                continue
+
+            container = WorkItemContainer(work_item)
+            if container.assigned_to.lower() == self.email.lower():
+                known.add(work_item.id)
+            elif work_item.id in known:
+                known.discard(work_item.id)
+            else:
+                # it was assigned to the user before we started watching
+                continue
+            changed.append(container)
+
+        # only move on once the whole poll has succeeded
+        self._revisions.update(revisions)
+        self._known = known
+        newest = max((changed_date for _, changed_date in revisions.values()),
+                     default=None)
+        if newest is not None and (self.watermark is None
+                                   or newest > self.watermark):
+            self.watermark = newest
+
+        # forget the work items that changed before the overlap, as they
+        # won't be fetched again unless they change again
+        since = self._since()
+        if since is not None:
+            self._revisions = {
+                number: revision
+                for number, revision in self._revisions.items()
+                if revision[1] >= since
+            }
+        return changed
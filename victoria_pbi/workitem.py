@@ -0,0 +1,251 @@
+"""workitem.py
+
+This module contains the container work items are kept in once they have been
+fetched from Azure DevOps, and the changes made to them and their outcomes. It
+doesn't import the Azure DevOps SDK, so work items can be handled without
+paying for importing it.
+
+Author:
+    Sam Gibson <sgibson@glasswallsolutions.com>
+"""
+
+import sys
+from typing import Any, Dict, Iterable, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from azure.devops.v5_1.work_item_tracking import WorkItem
+
+
+class WorkItemContainer:
+    """WorkItemContainer is used as a wrapper for an Azure DevOps work item.
+
+    Containers are kept small, as whole projects' worth of them can be held in
+    memory at once. The strings that are shared between many work items are
+    interned, and the Azure DevOps work item is only kept if asked for.
+
+    Attributes:
+        id_number (int): The ID number of the work item.
+        title (str): The title of the work item.
+        work_type (str): The type of the work item.
+        assigned_to (str): The unique name of who the work item is assigned to.
+            This is usually their email.
+        state (str): The current state of the work item.
+        board_column (str): Which board column the work item is in, or its
+            state if it isn't on a board.
+        fields (Dict[str, Any]): The values of any other fields that were
+            asked for, keyed by reference name, or None if there weren't any.
+            Fields the work item doesn't have a value for are None.
+        work_item (WorkItem): The Azure DevOps work item used to generate this,
+            or None if it wasn't kept.
+        source (str): The name of the target the work item came from, when
+            work items are got from several, or None.
+    """
+    __slots__ = ("id_number", "title", "work_type", "assigned_to", "state",
+                 "board_column", "fields", "work_item", "source")
+
+    def __init__(self,
+                 work_item: "WorkItem",
+                 keep_work_item: bool = False,
+                 fields: Iterable[str] = None) -> None:
+        """Create a WorkItemContainer from an Azure DevOps WorkItem.
+
+        Args:
+            work_item (WorkItem): The WorkItem to create this container from.
+            keep_work_item (bool): Whether to keep a reference to the WorkItem,
+                with all of its fields and links.
+            fields (Iterable[str]): The reference names of other fields to
+                keep the values of.
+        """
+        values = work_item.fields
+        self.id_number = work_item.id
+        self.title = values["System.Title"]
+        self.work_type = sys.intern(values["System.WorkItemType"])
+
+        # if the work item is unassigned the field will not be present
+        if values.get("System.AssignedTo") is not None:
+            self.assigned_to = sys.intern(
+                values["System.AssignedTo"]["uniqueName"])
+        else:
+            self.assigned_to = "Unassigned"
+
+        self.state = sys.intern(values["System.State"])
+        # work items that aren't on a board, like tasks, don't have a column
+        self.board_column = sys.intern(
+            values.get("System.BoardColumn") or self.state)
+        self.fields = {name: values.get(name)
+                       for name in fields} if fields else None
+        self.work_item = work_item if keep_work_item else None
+        self.source = None
+
+    @classmethod
+    def from_values(cls,
+                    id_number: int,
+                    title: str,
+                    work_type: str,
+                    assigned_to: str,
+                    state: str,
+                    board_column: str,
+                    fields: Dict[str, Any] = None) -> "WorkItemContainer":
+        """Create a WorkItemContainer from values that were already taken from
+        a work item, such as ones stored in the replica.
+
+        Args:
+            id_number (int): The ID number of the work item.
+            title (str): The title of the work item.
+            work_type (str): The type of the work item.
+            assigned_to (str): Who the work item is assigned to.
+            state (str): The current state of the work item.
+            board_column (str): Which board column the work item is in.
+            fields (Dict[str, Any]): The values of any other fields, keyed by
+                reference name.
+
+        Returns:
+            WorkItemContainer: The container.
+        """
+        container = cls.__new__(cls)
+        container.id_number = id_number
+        container.title = title
+        container.work_type = sys.intern(work_type)
+        container.assigned_to = sys.intern(assigned_to)
+        container.state = sys.intern(state)
+        container.board_column = sys.intern(board_column)
+        container.fields = fields or None
+        container.work_item = None
+        container.source = None
+        return container
+
+    def to_dict(self) -> dict:
+        """Get the work item as a JSON serialisable dict.
+
+        Returns:
+            dict: The work item. Any other fields are under 'fields', keyed by
+                reference name, and the target it came from is under 'source'
+                if it has one.
+        """
+        result = {
+            "id": self.id_number,
+            "type": self.work_type,
+            "title": self.title,
+            "state": self.state,
+            "column": self.board_column,
+            "assigned_to": self.assigned_to
+        }
+        if self.fields is not None:
+            result["fields"] = self.fields
+        if self.source is not None:
+            result["source"] = self.source
+        return result
+
+    def __str__(self):
+        return f"#{self.id_number} ({self.work_type}):" + \
+            f" {self.title}, {self.assigned_to} => {self.board_column}"
+
+    def __eq__(self, other):
+        if isinstance(self, other.__class__):
+            return self.id_number == other.id_number \
+                and self.title == other.title \
+                and self.work_type == other.work_type \
+                and self.assigned_to == other.assigned_to \
+                and self.state == other.state \
+                and self.board_column == other.board_column \
+                and self.fields == other.fields \
+                and self.work_item == other.work_item \
+                and self.source == other.source
+        return False
+
+
+class FieldInfo:
+    """FieldInfo describes a work item field, so its values can be shown.
+
+    Attributes:
+        reference_name (str): The name the field is referred to by in the
+            API, i.e. 'System.IterationPath'.
+        name (str): The name the field is shown with, i.e. 'Iteration Path'.
+        type (str): The type of the field's values, i.e. 'dateTime'.
+    """
+    def __init__(self, reference_name: str, name: str, type: str) -> None:
+        self.reference_name = reference_name
+        self.name = name
+        self.type = type
+
+    def __eq__(self, other):
+        if isinstance(self, other.__class__):
+            return self.reference_name == other.reference_name \
+                and self.name == other.name \
+                and self.type == other.type
+        return False
+
+
+class Change:
+    """Change is an update to a field of a work item, worked out from the
+    value it had when it was read.
+
+    Attributes:
+        id_number (int): The ID number of the work item.
+        field (str): The reference name of the field to update.
+        old (str): What the field was when the work item was read, or None if
+            it wasn't set. People are given by their unique name.
+        new (str): What to set the field to.
+        rev (int): The revision of the work item when it was read.
+        work_item (WorkItemContainer): The work item as it was read.
+    """
+    def __init__(self, id_number: int, field: str, old: Optional[str],
+                 new: str, rev: int, work_item: WorkItemContainer) -> None:
+        self.id_number = id_number
+        self.field = field
+        self.old = old
+        self.new = new
+        self.rev = rev
+        self.work_item = work_item
+
+    @property
+    def changed(self) -> bool:
+        """bool: Whether the update would change the field. Values that only
+        differ by case, like emails, are the same."""
+        return self.old is None or self.old.casefold() != self.new.casefold()
+
+    def __eq__(self, other):
+        if isinstance(self, other.__class__):
+            return self.id_number == other.id_number \
+                and self.field == other.field \
+                and self.old == other.old \
+                and self.new == other.new \
+                and self.rev == other.rev \
+                and self.work_item == other.work_item
+        return False
+
+
+class UpdateResult:
+    """UpdateResult is the outcome of updating a single work item as part of a
+    bulk update.
+
+    Attributes:
+        id_number (int): The ID number of the work item.
+        work_item (WorkItemContainer): The updated work item, or None if the
+            update failed.
+        error (str): Why the update failed, or None if it succeeded.
+        changed (bool): Whether the work item was updated, rather than already
+            being as the update would have left it.
+    """
+    def __init__(self,
+                 id_number: int,
+                 work_item: WorkItemContainer = None,
+                 error: str = None,
+                 changed: bool = True) -> None:
+        self.id_number = id_number
+        self.work_item = work_item
+        self.error = error
+        self.changed = changed
+
+    @property
+    def succeeded(self) -> bool:
+        """bool: Whether the update succeeded."""
+        return self.error is None
+
+    def __eq__(self, other):
+        if isinstance(self, other.__class__):
+            return self.id_number == other.id_number \
+                and self.work_item == other.work_item \
+                and self.error == other.error \
+                and self.changed == other.changed
+        return False